@@ -0,0 +1,89 @@
+"""Compare single-threaded and parallel packing of ``archive``.
+
+    python -m benchmarks.bench_archive [--size_mb 1024] [--workers 8]
+
+It writes a synthetic model and optimizer state to a temporary directory,
+archives them with each codec and prints the time and the throughput. Every
+archive is checked by ``tarfile`` and, if available, by ``tar -xf``.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import time
+from pathlib import Path
+
+from smtools.compression import (
+    SUFFIXES,
+    Codec,
+    CodecName,
+    open_reader,
+    zstandard,
+)
+from smtools.torch.handlers import archive
+
+from benchmarks.bench_codecs import make_checkpoint
+
+
+def default_codecs(workers):
+    # gzip:9 is the default of ``archive``
+    codecs = ["gzip:9", "gzip:6", f"gzip:6:{workers}"]
+    if zstandard is not None:
+        codecs += ["zstd:3", f"zstd:3:{workers}"]
+    return codecs
+
+
+def verify(out_file, src_dir):
+    with open(out_file, "rb") as f, open_reader(f) as f_in, tarfile.open(
+        fileobj=f_in, mode="r|"
+    ) as t:
+        names = sorted(m.name for m in t)
+    assert names == sorted(f"model/{p.name}" for p in src_dir.iterdir())
+
+    # tar may not support zstd or lz4
+    tar_suffixes = (SUFFIXES[CodecName.NONE], SUFFIXES[CodecName.GZIP])
+    if shutil.which("tar") is None or not out_file.name.endswith(
+        tar_suffixes
+    ):
+        return
+    with tempfile.TemporaryDirectory() as out_dir:
+        subprocess.run(
+            ["tar", "-xf", str(out_file), "-C", out_dir], check=True
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size_mb", type=int, default=1024)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--codecs", nargs="*", default=None)
+    args = parser.parse_args()
+    codecs = args.codecs or default_codecs(args.workers)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        src_dir = Path(tmp_dir) / "src"
+        src_dir.mkdir()
+        # the model and the optimizer state of the same size
+        for name in ["model_1000.pth", "optimizer_1000.pth"]:
+            (src_dir / name).write_bytes(make_checkpoint(args.size_mb // 2))
+
+        print(f"{'codec':<12}{'seconds':>10}{'MB/s':>10}{'ratio':>8}")
+        for codec in codecs:
+            out_file = Path(tmp_dir) / f"model{Codec.parse(codec).suffix}"
+            start = time.time()
+            archive(None, [f"{src_dir}/*"], out_file, codec=codec)
+            seconds = time.time() - start
+            verify(out_file, src_dir)
+
+            size = args.size_mb * 1024 * 1024
+            print(
+                f"{codec:<12}{seconds:>10.2f}{size / 1e6 / seconds:>10.1f}"
+                f"{size / out_file.stat().st_size:>8.3f}"
+            )
+            out_file.unlink()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Compare the snapshot codecs on a synthetic float32 checkpoint.
+
+    python -m benchmarks.bench_codecs [--size_mb 256] [--codecs gzip:6 ...]
+
+For each codec it prints the compression ratio and the compression and
+decompression throughput of the uncompressed tar size.
+"""
+import argparse
+import io
+import tarfile
+import time
+
+import numpy as np
+
+from smtools.compression import Codec, open_reader, zstandard, lz4
+
+DEFAULT_CODECS = ["none", "gzip:1", "gzip:6", "gzip:9"]
+if zstandard is not None:
+    DEFAULT_CODECS += ["zstd:1", "zstd:3", "zstd:3:4", "zstd:9"]
+if lz4 is not None:
+    DEFAULT_CODECS += ["lz4"]
+
+
+def make_checkpoint(size_mb, seed=0):
+    """Return an npz of random float32 weights and a squared
+    optimizer-like state, which compress about as badly as real ones."""
+    rng = np.random.RandomState(seed)
+    n = size_mb * 1024 * 1024 // 4 // 2
+    weights = rng.normal(0, 0.02, n).astype(np.float32)
+    state = rng.normal(0, 1e-4, n).astype(np.float32) ** 2
+    buf = io.BytesIO()
+    np.savez(buf, weights=weights, state=state)
+    return buf.getvalue()
+
+
+def bench(codec, data):
+    codec = Codec.parse(codec)
+    info = tarfile.TarInfo("model/snapshot.npz")
+    info.size = len(data)
+
+    out = io.BytesIO()
+    start = time.time()
+    with codec.open_writer(out) as f, tarfile.open(
+        fileobj=f, mode="w|"
+    ) as t:
+        t.addfile(info, io.BytesIO(data))
+    compress_seconds = time.time() - start
+
+    out.seek(0)
+    start = time.time()
+    with open_reader(out) as f, tarfile.open(fileobj=f, mode="r|") as t:
+        for member in t:
+            t.extractfile(member).read()
+    decompress_seconds = time.time() - start
+
+    mb = len(data) / 1e6
+    return {
+        "ratio": len(data) / len(out.getvalue()),
+        "compress": mb / compress_seconds,
+        "decompress": mb / decompress_seconds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size_mb", type=int, default=256)
+    parser.add_argument("--codecs", nargs="*", default=DEFAULT_CODECS)
+    args = parser.parse_args()
+
+    data = make_checkpoint(args.size_mb)
+    print(f"{'codec':<12}{'ratio':>8}{'comp MB/s':>12}{'decomp MB/s':>14}")
+    for codec in args.codecs:
+        r = bench(codec, data)
+        print(
+            f"{codec:<12}{r['ratio']:>8.3f}{r['compress']:>12.1f}"
+            f"{r['decompress']:>14.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""Submit many training jobs concurrently.
+
+Jobs are submitted from a thread pool whose concurrency adapts to the API
+rate limit: it is halved whenever SageMaker throttles a request, which is
+retried with exponential backoff, and grows back by one per window of
+successful requests (additive increase, multiplicative decrease).
+"""
+import gzip
+import hashlib
+import io
+import random
+import tarfile
+import threading
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+from botocore.exceptions import ClientError
+
+THROTTLING_ERROR_CODES = {
+    "ThrottlingException",
+    "Throttling",
+    "TooManyRequestsException",
+    "RequestLimitExceeded",
+}
+
+SETTING_SUFFIXES = [".yml", ".yaml"]
+
+
+def setting_files(paths):
+    """Return the setting files of ``paths``, where a directory means the
+    yaml files directly under it."""
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(
+                sorted(
+                    p
+                    for p in path.iterdir()
+                    if p.is_file() and p.suffix in SETTING_SUFFIXES
+                )
+            )
+        else:
+            files.append(path)
+    return files
+
+
+def is_throttling(error):
+    return (
+        isinstance(error, ClientError)
+        and error.response.get("Error", {}).get("Code")
+        in THROTTLING_ERROR_CODES
+    )
+
+
+class BulkSubmitter:
+    """Call ``submit(job_name, conf)`` for each job on up to
+    ``max_workers`` threads.
+
+    The # concurrent calls starts from ``max_workers``, is halved on a
+    throttling error, and increases again while calls succeed. A throttled
+    call is retried up to ``max_retries`` times, and the other errors are
+    not retried.
+    """
+
+    def __init__(
+        self,
+        submit,
+        max_workers=4,
+        max_retries=8,
+        backoff=1.0,
+        max_backoff=60.0,
+    ):
+        self.submit = submit
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self.submitted = []
+        # [(job_name, error)]
+        self.failed = []
+        self.n_throttled = 0
+
+        # the congestion window, whose floor is the # concurrent calls
+        self._window = float(max_workers)
+        self._running = 0
+        self._cond = threading.Condition()
+
+    @property
+    def concurrency(self):
+        return max(1, int(self._window))
+
+    def run(self, jobs):
+        """Submit ``jobs``, an iterable of ``(job_name, conf)``, which is
+        consumed as the jobs are submitted, and return the names of the
+        jobs submitted."""
+        with ThreadPoolExecutor(self.max_workers) as pool:
+            pending = set()
+            for job_name, conf in jobs:
+                if len(pending) >= 2 * self.max_workers:
+                    _, pending = wait(pending, return_when=FIRST_COMPLETED)
+                pending.add(pool.submit(self._submit, job_name, conf))
+            wait(pending)
+        return self.submitted
+
+    def _submit(self, job_name, conf):
+        for attempt in range(self.max_retries + 1):
+            with self._cond:
+                self._cond.wait_for(lambda: self._running < self.concurrency)
+                self._running += 1
+            try:
+                self.submit(job_name, conf)
+            except Exception as e:
+                throttled = is_throttling(e)
+                with self._cond:
+                    self._running -= 1
+                    if throttled:
+                        self.n_throttled += 1
+                        self._window = max(1.0, self._window / 2)
+                    self._cond.notify_all()
+                if not throttled or attempt == self.max_retries:
+                    with self._cond:
+                        self.failed.append((job_name, e))
+                    traceback.print_exc()
+                    return
+                delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+                # jitter, so that the throttled calls don't retry at once
+                time.sleep(delay * random.uniform(0.5, 1.0))
+                continue
+
+            with self._cond:
+                self._running -= 1
+                self._window = min(
+                    float(self.max_workers), self._window + 1 / self._window
+                )
+                self.submitted.append(job_name)
+                self._cond.notify_all()
+            return
+
+    def summary(self):
+        lines = [f"Submitted {len(self.submitted)} jobs:"]
+        lines.extend(f"  {job_name}" for job_name in self.submitted)
+        if self.failed:
+            lines.append(f"Failed {len(self.failed)} jobs:")
+            lines.extend(
+                f"  {job_name}: {error}" for job_name, error in self.failed
+            )
+        if self.n_throttled:
+            lines.append(f"Throttled {self.n_throttled} times.")
+        return "\n".join(lines)
+
+
+def package_source_dir(source_dir, bucket_name, client):
+    """Upload ``source_dir`` as ``sourcedir.tar.gz`` as the SageMaker SDK
+    does, once for the same contents, and return its S3 URI.
+
+    The key is ``smtrain-{hash}/source/sourcedir.tar.gz``, which is at the
+    same depth as ``{job_name}/source/sourcedir.tar.gz`` so that the bucket
+    is still found from ``module_dir`` in the training job.
+    """
+    source_dir = Path(source_dir)
+    buf = io.BytesIO()
+    # mtime=0 here and in the members, so that the same contents result in
+    # the same bytes
+    with gzip.GzipFile(fileobj=buf, mode="wb", mtime=0) as f_gz, tarfile.open(
+        fileobj=f_gz, mode="w"
+    ) as t:
+        for path in sorted(source_dir.rglob("*")):
+            if path.is_file():
+                t.add(
+                    str(path),
+                    arcname=str(path.relative_to(source_dir)),
+                    filter=_reset_tarinfo,
+                )
+    body = buf.getvalue()
+
+    chsum = hashlib.sha1(body).hexdigest()[:16]
+    key = f"smtrain-{chsum}/source/sourcedir.tar.gz"
+    try:
+        client.head_object(Bucket=bucket_name, Key=key)
+    except ClientError:
+        client.put_object(Bucket=bucket_name, Key=key, Body=body)
+    return f"s3://{bucket_name}/{key}"
+
+
+def _reset_tarinfo(tarinfo):
+    tarinfo.mtime = 0
+    tarinfo.uid = tarinfo.gid = 0
+    tarinfo.uname = tarinfo.gname = ""
+    return tarinfo
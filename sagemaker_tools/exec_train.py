@@ -1,8 +1,13 @@
 import argparse
 import os
+import re
 import subprocess
+import threading
+from collections import Counter
+from copy import deepcopy
 from datetime import datetime
 from pathlib import Path
+from typing import List
 
 import boto3
 import sagemaker
@@ -18,6 +23,14 @@ from sagemaker.tuner import (
     IntegerParameter,
 )
 
+from sagemaker_tools.bulk import (
+    BulkSubmitter,
+    package_source_dir,
+    setting_files,
+)
+from sagemaker_tools.upload_cache import UploadCache
+from smtools.merge_configs import expand_matrix
+
 hp_type = {
     "continuous": ContinuousParameter,
     "integer": IntegerParameter,
@@ -38,21 +51,39 @@ class FrameworkName:
 
 
 def exec_training_sm(
-    session, client, job_name, conf, max_parallel_jobs, framework_name
+    session,
+    client,
+    job_name,
+    conf,
+    max_parallel_jobs,
+    framework_name,
+    sagemaker_session=None,
+    upload_cache=None,
 ):
-    sagemaker_session = sagemaker.Session(
-        boto_session=session, sagemaker_client=client
-    )
+    if sagemaker_session is None:
+        sagemaker_session = sagemaker.Session(
+            boto_session=session, sagemaker_client=client
+        )
 
     # input data
     inputs = conf["inputs"]
 
     if "upload_data" in conf and isinstance(conf["upload_data"], list):
         for d in conf["upload_data"]:
-            s3_dir = sagemaker_session.upload_data(
-                path=d["path"],
-                key_prefix=os.path.join(job_name, d["key_prefix"]),
-            )
+            if d.get("cache", False):
+                # shared by the jobs, and uploaded once per content
+                if upload_cache is None:
+                    upload_cache = UploadCache(session.client("s3"))
+                s3_dir = upload_cache.upload(
+                    d["path"],
+                    sagemaker_session.default_bucket(),
+                    os.path.join("smtrain-data", d["key_prefix"]),
+                )
+            else:
+                s3_dir = sagemaker_session.upload_data(
+                    path=d["path"],
+                    key_prefix=os.path.join(job_name, d["key_prefix"]),
+                )
             inputs[d["name"]] = s3_dir
 
     estimator_args = conf["estimator"]
@@ -143,53 +174,197 @@ def exec_training_local(conf):
 
 
 def exec_training(
-    setting: str,
+    settings: List[str],
     local: bool,
     job_name: str,
     profile_name: str,
     max_parallel_jobs: int,
+    concurrency: int = 4,
 ):
-    setting = Path(setting)
-    conf = yaml.load(setting.open(), Loader=yaml.SafeLoader)
+    settings = setting_files(settings)
+    if len(settings) == 0:
+        raise ValueError("No setting files are found.")
 
     if local:
-        exec_training_local(conf)
+        for setting in settings:
+            conf = yaml.load(setting.open(), Loader=yaml.SafeLoader)
+            for _, point_conf in expand_matrix(conf):
+                exec_training_local(point_conf)
+        return
+
+    # the jobs are submitted by the profile of each setting file
+    job_names = _job_names(settings, job_name)
+    profiles = dict()
+    for setting, setting_job_name in zip(settings, job_names):
+        conf = yaml.load(setting.open(), Loader=yaml.SafeLoader)
+        profiles.setdefault(
+            profile_name or conf.get("profile_name"), []
+        ).append((setting_job_name, conf))
+
+    for setting_profile_name, setting_jobs in profiles.items():
+        if len(profiles) > 1:
+            print(f"Profile {setting_profile_name}:")
+        sessions = _thread_sessions(setting_profile_name)
+        session, _, sagemaker_session = sessions()
+        # clients are thread-safe, unlike sessions
+        s3_client = session.client("s3")
+        upload_cache = UploadCache(s3_client)
+
+        def submit(point_job_name, point_conf):
+            session, client, sagemaker_session = sessions()
+            # copied since it is modified, and the call may be retried
+            exec_training_sm(
+                session,
+                client,
+                point_job_name,
+                deepcopy(point_conf),
+                max_parallel_jobs,
+                point_conf.get("framework_name", FrameworkName.Chainer),
+                sagemaker_session=sagemaker_session,
+                upload_cache=upload_cache,
+            )
+
+        submitter = BulkSubmitter(submit, max_workers=concurrency)
+        submitter.run(_jobs(setting_jobs, sagemaker_session, s3_client))
+        print(submitter.summary())
+
+
+def _clients(profile_name):
+    """Return the boto3 session and the SageMaker client of
+    ``profile_name``."""
+    if profile_name is None:
+        session = Session()
+        client = boto3.client("sagemaker", region_name=session.region_name)
     else:
-        framework_name = conf.get("framework_name", FrameworkName.Chainer)
+        session = Session(profile_name=profile_name)
+        credentials = session.get_credentials()
 
-        job_name = job_name or "{}-{}".format(
-            setting.stem.replace("_", "-"), datetime.now().strftime("%s"),
+        client = boto3.client(
+            "sagemaker",
+            region_name=session.region_name,
+            aws_access_key_id=credentials.access_key,
+            aws_secret_access_key=credentials.secret_key,
+            aws_session_token=credentials.token,
         )
+    return session, client
 
-        profile_name = profile_name or conf.get("profile_name")
-        if profile_name is None:
-            session = Session()
-            client = boto3.client("sagemaker", region_name=session.region_name)
-        else:
-            session = Session(profile_name=profile_name)
-            credentials = session.get_credentials()
-
-            client = boto3.client(
-                "sagemaker",
-                region_name=session.region_name,
-                aws_access_key_id=credentials.access_key,
-                aws_secret_access_key=credentials.secret_key,
-                aws_session_token=credentials.token,
+
+def _thread_sessions(profile_name):
+    """Return a function which returns the boto3 session, the SageMaker
+    client and the ``sagemaker.Session`` of ``profile_name`` for the
+    calling thread.
+
+    boto3 sessions are not thread-safe, and ``sagemaker.Session`` creates
+    clients and resources from its boto3 session on every call.
+    """
+    local = threading.local()
+
+    def sessions():
+        if not hasattr(local, "sessions"):
+            session, client = _clients(profile_name)
+            local.sessions = (
+                session,
+                client,
+                sagemaker.Session(
+                    boto_session=session, sagemaker_client=client
+                ),
             )
+        return local.sessions
 
-        exec_training_sm(
-            session, client, job_name, conf, max_parallel_jobs, framework_name,
-        )
+    return sessions
+
+
+def _job_names(settings, job_name):
+    """Return the job names of the setting files, ``{stem}-{timestamp}`` or
+    ``{job_name}-{stem}``.
+
+    Setting files of the same stem are told apart by as many of their
+    parent directories as needed, e.g. ``exp1-base`` and ``exp2-base``.
+    """
+    if job_name is not None and len(settings) == 1:
+        return [job_name]
+
+    timestamp = datetime.now().strftime("%s")
+    paths = [Path(setting).resolve() for setting in settings]
+    depths = [0] * len(paths)
+    while True:
+        names = [
+            "-".join(path.parts[-1 - depth : -1] + (path.stem,))
+            for path, depth in zip(paths, depths)
+        ]
+        counts = Counter(names)
+        duplicates = [i for i, name in enumerate(names) if counts[name] > 1]
+        if not duplicates:
+            break
+        if any(depths[i] + 2 >= len(paths[i].parts) for i in duplicates):
+            # e.g. the same file given twice, or a.yml and a.yaml
+            seen = Counter()
+            for i in duplicates:
+                seen[names[i]] += 1
+                names[i] = f"{names[i]}-{seen[names[i]]}"
+            break
+        for i in duplicates:
+            depths[i] += 1
+
+    names = [re.sub(r"[^a-zA-Z0-9-]", "-", name) for name in names]
+    if job_name is None:
+        return [f"{name}-{timestamp}" for name in names]
+    return [f"{job_name}-{name}" for name in names]
+
+
+def _jobs(setting_jobs, sagemaker_session, s3_client):
+    """Yield ``(job_name, conf)`` for each point of the matrix section of
+    each ``(job_name, conf)`` of the setting files in ``setting_jobs``."""
+    # source_dir -> S3 URI of sourcedir.tar.gz
+    packages = dict()
+
+    for setting_job_name, conf in setting_jobs:
+        # the source directory is packed and uploaded once for all the jobs,
+        # unless the SDK has to pack the dependencies together
+        estimator_args = conf["estimator"]
+        source_dir = estimator_args.get("source_dir")
+        if (
+            len(setting_jobs) > 1 or "matrix" in conf
+        ) and _is_packable(estimator_args):
+            source_dir = str(Path(source_dir).resolve())
+            if source_dir not in packages:
+                packages[source_dir] = package_source_dir(
+                    source_dir, sagemaker_session.default_bucket(), s3_client
+                )
+            estimator_args["source_dir"] = packages[source_dir]
+
+        # a job for each point of the matrix section, if any
+        for suffix, point_conf in expand_matrix(conf):
+            if suffix:
+                yield f"{setting_job_name}-{suffix}", point_conf
+            else:
+                yield setting_job_name, point_conf
+
+
+def _is_packable(estimator_args):
+    source_dir = estimator_args.get("source_dir")
+    return (
+        source_dir is not None
+        and not source_dir.lower().startswith("s3://")
+        and Path(source_dir).is_dir()
+        and not estimator_args.get("dependencies")
+    )
 
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("setting", type=str, help="Path to setting file.")
+    parser.add_argument(
+        "settings",
+        type=str,
+        nargs="+",
+        help="Paths to setting files, or directories of them.",
+    )
     parser.add_argument(
         "--job_name",
         "-j",
         type=str,
-        help="Training job name. It must be unique.",
+        help="Training job name. It must be unique. "
+        "With many setting files, it is the prefix of the job names.",
     )
     parser.add_argument(
         "--profile_name",
@@ -204,6 +379,13 @@ def main():
         default=1,
         help="# wokers for bulk training.",
     )
+    parser.add_argument(
+        "--concurrency",
+        "-c",
+        type=int,
+        default=4,
+        help="The max # jobs submitted concurrently.",
+    )
     parser.add_argument(
         "--local", "-l", action="store_true", help="local excution"
     )
@@ -0,0 +1,182 @@
+"""Upload local data for training jobs once per content.
+
+A file or a directory is uploaded under ``{key_prefix}/{tree hash}``, where
+the tree hash is the hash of the relative paths and the contents of its
+files, and a manifest is put to ``{key_prefix}/.manifests/{tree hash}.json``
+after all of them have been uploaded. If the manifest already exists, which
+is checked by a HEAD request, the data is not uploaded at all.
+
+The hashes of the local files are cached by their size and mtime, and so
+are the keys of the files uploaded, so that the unchanged files of a
+partly changed directory are copied on S3 instead of uploaded.
+"""
+import hashlib
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from botocore.exceptions import ClientError
+
+DEFAULT_CACHE_FILE = Path.home() / ".cache" / "smtools" / "upload_cache.json"
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class UploadCache:
+    """Upload files and directories to S3 by ``client`` with ``workers``
+    threads, keeping the local cache in ``cache_file``.
+
+    It can be shared by threads, which upload in parallel. The same data
+    is uploaded by one of them while the others wait for it.
+    """
+
+    def __init__(self, client, cache_file=DEFAULT_CACHE_FILE, workers=8):
+        self.client = client
+        self.cache_file = Path(cache_file) if cache_file else None
+        self.workers = workers
+
+        self.n_reused = 0
+        self.n_uploaded = 0
+        self.n_copied = 0
+
+        self._cache = {"files": {}, "objects": {}}
+        if self.cache_file is not None:
+            try:
+                with self.cache_file.open() as f:
+                    self._cache = json.load(f)
+            except (FileNotFoundError, ValueError):
+                pass
+        # guards the cache, the counters and the locks of the trees
+        self._lock = threading.Lock()
+        # (bucket name, manifest key) -> lock
+        self._tree_locks = dict()
+
+    def upload(self, path, bucket_name, key_prefix):
+        """Upload ``path`` under ``{key_prefix}/{tree hash}`` unless it is
+        already there, and return the S3 URI as ``upload_data`` does."""
+        path = Path(path)
+        files = _list_files(path)
+        hashes = {
+            relpath: self._file_hash(file_path)
+            for relpath, file_path in files
+        }
+        tree = hashlib.sha1(
+            "".join(
+                f"{relpath}\0{hashes[relpath]}\n"
+                for relpath in sorted(hashes)
+            ).encode()
+        ).hexdigest()[:16]
+        tree_prefix = f"{key_prefix}/{tree}"
+        manifest_key = f"{key_prefix}/.manifests/{tree}.json"
+
+        with self._tree_lock(bucket_name, manifest_key):
+            if self._exists(bucket_name, manifest_key):
+                with self._lock:
+                    self.n_reused += 1
+            else:
+                self._upload_tree(bucket_name, tree_prefix, files, hashes)
+                # the last, so that only complete trees are reused
+                self.client.put_object(
+                    Bucket=bucket_name,
+                    Key=manifest_key,
+                    Body=json.dumps({"files": hashes}).encode(),
+                )
+        with self._lock:
+            objects = self._cache["objects"].setdefault(bucket_name, {})
+            for relpath, chsum in hashes.items():
+                objects[chsum] = f"{tree_prefix}/{relpath}"
+        self.save()
+
+        uri = f"s3://{bucket_name}/{tree_prefix}"
+        if path.is_dir():
+            return uri
+        return f"{uri}/{path.name}"
+
+    def save(self):
+        if self.cache_file is None:
+            return
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.cache_file.with_name(self.cache_file.name + ".tmp")
+        # in the lock, so that the threads don't write the file at once
+        with self._lock:
+            with tmp_file.open("w") as f:
+                json.dump(self._cache, f)
+            tmp_file.replace(self.cache_file)
+
+    def _tree_lock(self, bucket_name, manifest_key):
+        with self._lock:
+            return self._tree_locks.setdefault(
+                (bucket_name, manifest_key), threading.Lock()
+            )
+
+    def _file_hash(self, path):
+        name = str(path.resolve())
+        stat = path.stat()
+        signature = [stat.st_size, stat.st_mtime_ns]
+        with self._lock:
+            entry = self._cache["files"].get(name)
+        if entry is not None and entry[:2] == signature:
+            return entry[2]
+        sha1 = hashlib.sha1()
+        with path.open("rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                sha1.update(chunk)
+        chsum = sha1.hexdigest()
+        with self._lock:
+            self._cache["files"][name] = [*signature, chsum]
+        return chsum
+
+    def _exists(self, bucket_name, key):
+        try:
+            self.client.head_object(Bucket=bucket_name, Key=key)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ["404", "NoSuchKey", "NotFound"]:
+                return False
+            raise
+        return True
+
+    def _upload_tree(self, bucket_name, tree_prefix, files, hashes):
+        with self._lock:
+            objects = dict(self._cache["objects"].get(bucket_name, {}))
+        with ThreadPoolExecutor(self.workers) as pool:
+            futures = [
+                pool.submit(
+                    self._upload_file,
+                    bucket_name,
+                    f"{tree_prefix}/{relpath}",
+                    file_path,
+                    objects.get(hashes[relpath]),
+                )
+                for relpath, file_path in files
+            ]
+            copied = [future.result() for future in futures]
+        with self._lock:
+            self.n_copied += sum(copied)
+            self.n_uploaded += len(copied) - sum(copied)
+
+    def _upload_file(self, bucket_name, key, path, src_key):
+        """Upload ``path``, or copy ``src_key`` of the same content on S3.
+        Return whether it is copied."""
+        if src_key is not None:
+            try:
+                self.client.copy(
+                    {"Bucket": bucket_name, "Key": src_key}, bucket_name, key
+                )
+                return True
+            except ClientError:
+                # e.g. deleted since it was uploaded
+                pass
+        self.client.upload_file(str(path), bucket_name, key)
+        return False
+
+
+def _list_files(path):
+    """Return ``[(relative path, path)]`` of the files of ``path``."""
+    if not path.is_dir():
+        return [(path.name, path)]
+    return [
+        (p.relative_to(path).as_posix(), p)
+        for p in sorted(path.rglob("*"))
+        if p.is_file()
+    ]
@@ -5,7 +5,9 @@ packages = \
 ['sage_extensions',
  'sagemaker_tools',
  'smtools',
+ 'smtools.chainer.datasets',
  'smtools.chainer.extensions',
+ 'smtools.torch.datasets',
  'smtools.torch.handlers']
 
 package_data = \
@@ -26,10 +28,14 @@ install_requires = \
  'slackweb>=1.0.5,<2.0.0',
  'tqdm>=4.41.1,<5.0.0']
 
+extras_require = \
+{'lz4': ['lz4>=3.0.2,<4.0.0'], 'zstd': ['zstandard>=0.15.0,<0.16.0']}
+
 entry_points = \
 {'console_scripts': ['mgconf = smtools.merge_configs:main',
                      'smbatch = sagemaker_tools.batch_inference:main',
                      'smdeploy = sagemaker_tools.deploy_endpoint:main',
+                     'smrestore = smtools.restore_snapshot:main',
                      'smtrain = sagemaker_tools.exec_train:main']}
 
 setup_kwargs = {
@@ -45,6 +51,7 @@ setup_kwargs = {
     'packages': packages,
     'package_data': package_data,
     'install_requires': install_requires,
+    'extras_require': extras_require,
     'entry_points': entry_points,
     'python_requires': '>=3.6,<4.0',
 }
@@ -0,0 +1,104 @@
+import threading
+import time
+import traceback
+from collections import deque
+
+
+class QueuePolicy:
+    """What ``BackgroundWorker.submit`` does when the queue is full."""
+
+    BLOCK = "block"  # wait until a pending task starts
+    DROP_OLDEST = "drop_oldest"  # discard the oldest pending task
+    SKIP = "skip"  # discard the new task
+
+    values = [BLOCK, DROP_OLDEST, SKIP]
+
+
+class BackgroundWorker:
+    """Run tasks one by one on a daemon thread with a bounded queue.
+
+    At most ``max_pending`` tasks wait in the queue; ``policy`` decides
+    what happens to a task submitted to a full queue. The ``discard``
+    callback of a dropped task is called so that it can release what it
+    holds, e.g. a staged snapshot directory.
+    """
+
+    def __init__(self, max_pending=1, policy=QueuePolicy.BLOCK, name=None):
+        if policy not in QueuePolicy.values:
+            raise ValueError(f"Unknown policy: {policy}")
+        self.max_pending = max_pending
+        self.policy = policy
+
+        self.n_done = 0
+        self.n_failed = 0
+        self.n_dropped = 0
+        self.busy_seconds = 0.0
+
+        self._queue = deque()
+        self._running = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name=name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, task, discard=None):
+        """Queue ``task()``; return False if it has been discarded."""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("The worker is already closed.")
+            if len(self._queue) >= self.max_pending:
+                if self.policy == QueuePolicy.BLOCK:
+                    self._cond.wait_for(
+                        lambda: len(self._queue) < self.max_pending
+                    )
+                elif self.policy == QueuePolicy.DROP_OLDEST:
+                    _, old_discard = self._queue.popleft()
+                    self._discard(old_discard)
+                else:
+                    self._discard(discard)
+                    return False
+            self._queue.append((task, discard))
+            self._cond.notify_all()
+        return True
+
+    def _discard(self, discard):
+        self.n_dropped += 1
+        if discard is not None:
+            discard()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue or self._closed)
+                if not self._queue:
+                    return
+                task, _ = self._queue.popleft()
+                self._running = True
+                self._cond.notify_all()
+
+            start = time.time()
+            try:
+                task()
+                self.n_done += 1
+            except Exception:
+                self.n_failed += 1
+                traceback.print_exc()
+            self.busy_seconds += time.time() - start
+
+            with self._cond:
+                self._running = False
+                self._cond.notify_all()
+
+    def wait(self):
+        """Block until every queued task has finished."""
+        with self._cond:
+            self._cond.wait_for(lambda: not self._queue and not self._running)
+
+    def close(self):
+        """Run the pending tasks and stop the thread."""
+        self.wait()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
@@ -0,0 +1 @@
+from smtools.chainer.datasets.tar_dataset import TarDataset
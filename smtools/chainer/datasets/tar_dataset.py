@@ -0,0 +1,27 @@
+from chainer.dataset import DatasetMixin
+
+from smtools.indexed_tarfile import IndexedTarFile
+
+
+class TarDataset(DatasetMixin):
+    """Dataset of the members of a tar file, read without extracting it.
+
+    Each example is ``transform(name, data)``, or the raw bytes of the
+    member if ``transform`` is None. ``names`` selects and orders the
+    members; its default is all the regular files in the archive.
+    """
+
+    def __init__(self, archive, names=None, transform=None, index_file=None):
+        self._tar = IndexedTarFile(archive, index_file=index_file)
+        self._names = list(names) if names is not None else self._tar.names
+        self._transform = transform
+
+    def __len__(self):
+        return len(self._names)
+
+    def get_example(self, i):
+        name = self._names[i]
+        data = self._tar.read(name)
+        if self._transform is None:
+            return data
+        return self._transform(name, data)
@@ -1,2 +1,2 @@
-from smtools.extensions.slack_reporter import slack_reporter
-from smtools.extensions.snapshot_transfer import snapshot_transfer
+from smtools.chainer.extensions.slack_reporter import slack_reporter
+from smtools.chainer.extensions.snapshot_transfer import snapshot_transfer
@@ -1,79 +1,198 @@
 import hashlib
+import io
 import json
 import os
 import warnings
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
 
 import boto3
 import slackweb
 
 from chainer.training import extension
 
+from smtools.charts import ChartRenderer, columns, sparkline
+from smtools.slack_notifier import SlackNotifier
 
-def slack_reporter(keys, hook, channel, pretext=None, public_bucket_name=None):
-    @extension.make_extension(trigger=(1, "epoch"), priority=0)
+
+def slack_reporter(
+    keys,
+    hook,
+    channel,
+    pretext=None,
+    public_bucket_name=None,
+    async_post=False,
+    min_interval=1.0,
+    sparklines=False,
+    chart_keys=None,
+):
+    if chart_keys is not None:
+        chart = ChartRenderer(chart_keys)
+    else:
+        chart = None
+
+    if async_post:
+        notifier = SlackNotifier(hook, min_interval=min_interval)
+    else:
+        notifier = None
+
+    def finalize(*args):
+        if notifier is not None:
+            notifier.close()
+
+    @extension.make_extension(
+        trigger=(1, "epoch"), priority=0, finalizer=finalize
+    )
     def slack_report(trainer):
-        _slack_report(
-            trainer, keys, hook, channel, pretext, public_bucket_name
+        if notifier is None:
+            _slack_report(
+                trainer,
+                keys,
+                hook,
+                channel,
+                pretext,
+                public_bucket_name,
+                sparklines,
+                chart,
+            )
+            return
+
+        # the log and the figures are read on the trainer thread, since the
+        # next epoch may rewrite them while the notifier posts
+        log_attachment = _log_attachment(trainer, keys, pretext, sparklines)
+        if log_attachment is None:
+            return
+        notifier.notify(
+            partial(
+                _payload,
+                channel,
+                log_attachment,
+                public_bucket_name,
+                chart,
+                # the entries are not modified once reported
+                list(trainer.get_extension("LogReport").log),
+                _figures(trainer, public_bucket_name, chart),
+            )
         )
 
     return slack_report
 
 
-def _slack_report(trainer, keys, hook, channel, pretext, public_bucket_name):
+def _slack_report(
+    trainer,
+    keys,
+    hook,
+    channel,
+    pretext,
+    public_bucket_name,
+    sparklines=False,
+    chart=None,
+):
     slack = slackweb.Slack(url=hook)
 
+    log_attachment = _log_attachment(trainer, keys, pretext, sparklines)
+    if log_attachment is None:
+        return
+    payload = _payload(
+        channel,
+        log_attachment,
+        public_bucket_name,
+        chart,
+        trainer.get_extension("LogReport").log,
+        _figures(trainer, public_bucket_name, chart),
+    )
+
+    slack.notify(**payload)  # [todo] Exception handling
+
+
+def _log_attachment(trainer, keys, pretext, sparklines=False):
     log_report = trainer.get_extension("LogReport")
     try:
         current_log = log_report.log[-1]
     except IndexError:
         warnings.warn("Any logs do not be reported yet.")
-        return
+        return None
 
-    attachments = list()
+    if sparklines:
+        data = columns(log_report.log, keys)
 
     fields = list()
     color = "good"
     for k in keys:
         if k in current_log:
-            fields.append({"title": k, "value": current_log[k], "short": True})
+            value = current_log[k]
+            if sparklines and len(data[k]) > 1:
+                value = "{}\n{}".format(value, sparkline(data[k]))
+            fields.append({"title": k, "value": value, "short": True})
             if not (
                 isinstance(current_log[k], float)
                 or isinstance(current_log[k], int)
             ):
                 color = "danger"
 
-    attachments.append({"pretext": pretext, "color": color, "fields": fields})
+    return {"pretext": pretext, "color": color, "fields": fields}
 
-    plot_reports = [
-        v.extension
-        for k, v in trainer._extensions.items()
-        if "PlotReport" in k
-    ]
-    if len(plot_reports) > 0 and public_bucket_name is not None:
-        s3 = boto3.resource("s3")
-        bucket = s3.Bucket(public_bucket_name)  # [todo] Exception handling
-
-        for pr in plot_reports:
-            name = pr._file_name
-            if os.path.isfile(os.path.join(trainer.out, name)):
-                try:
-                    url = _upload_figure(
-                        name, trainer.out, bucket, public_bucket_name
-                    )
-                    attachments.append(
-                        {
-                            "color": color,
-                            "image_url": url,
-                            "fields": [{"value": name}],
-                        }
-                    )
-                except:
-                    attachments.append(
-                        {
-                            "color": "danger",
-                            "text": "image uploading was failed.",
-                        }
-                    )
+
+def _payload(
+    channel,
+    log_attachment,
+    public_bucket_name,
+    chart=None,
+    log=None,
+    figures=(),
+    with_images=True,
+):
+    """Build the payload, uploading the chart drawn from ``log`` or the
+    ``figures`` given by ``_figures`` unless ``with_images`` is False."""
+    attachments = [log_attachment]
+    color = log_attachment["color"]
+
+    if with_images and chart is not None:
+        # drawn from the log instead of the PNGs of PlotReport
+        png = chart.render(log) if public_bucket_name is not None else None
+        if png is not None:
+            try:
+                url = _upload_png(
+                    hashlib.md5(png).hexdigest(), png, public_bucket_name
+                )
+                attachments.append(
+                    {
+                        "color": color,
+                        "image_url": url,
+                        "fields": [{"value": ", ".join(chart.keys)}],
+                    }
+                )
+            except:
+                attachments.append(
+                    {
+                        "color": "danger",
+                        "text": "image uploading was failed.",
+                    }
+                )
+    if with_images and len(figures) > 0:
+        # the changed figures are uploaded in parallel
+        with ThreadPoolExecutor(len(figures)) as pool:
+            futures = [
+                pool.submit(_upload_png, chsum, png, public_bucket_name)
+                for _, chsum, png in figures
+            ]
+        for (name, _, _), future in zip(figures, futures):
+            try:
+                url = future.result()
+                attachments.append(
+                    {
+                        "color": color,
+                        "image_url": url,
+                        "fields": [{"value": name}],
+                    }
+                )
+            except:
+                attachments.append(
+                    {
+                        "color": "danger",
+                        "text": "image uploading was failed.",
+                    }
+                )
 
     try:
         training_env = os.getenv("SM_TRAINING_ENV")
@@ -81,26 +200,77 @@ def _slack_report(trainer, keys, hook, channel, pretext, public_bucket_name):
     except:
         job_name = os.uname()[1]
 
-    slack.notify(
-        channel=channel,
-        text="Training Report from %s" % job_name,
-        attachments=attachments,
-    )  # [todo] Exception handling
+    return {
+        "channel": channel,
+        "text": "Training Report from %s" % job_name,
+        "attachments": attachments,
+    }
+
+
+# path -> (size, mtime_ns, md5) of the figure
+_figure_hashes = dict()
+# (bucket_name, key) of the figures already uploaded
+_uploaded_figures = set()
 
 
-def _upload_figure(name, out, bucket, public_bucket_name):
-    path = os.path.join(out, name)
+def _figures(trainer, public_bucket_name, chart=None):
+    """Return ``[(name, md5, png)]`` of the figures of PlotReport.
+
+    ``png`` is the content of the figure, or None if it has been uploaded,
+    which is known without reading it unless its size or mtime changed.
+    """
+    if chart is not None or public_bucket_name is None:
+        return []
+    names = [
+        v.extension._file_name
+        for k, v in trainer._extensions.items()
+        if "PlotReport" in k
+    ]
+    figures = []
+    for name in names:
+        path = os.path.join(trainer.out, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        signature = (stat.st_size, stat.st_mtime_ns)
+        entry = _figure_hashes.get(path)
+        chsum = None
+        if entry is not None and entry[:2] == signature:
+            chsum = entry[2]
+        png = None
+        if (
+            chsum is None
+            or (public_bucket_name, chsum + ".png") not in _uploaded_figures
+        ):
+            with open(path, "rb") as f:
+                png = f.read()
+            chsum = hashlib.md5(png).hexdigest()
+            # only the latest version of each figure
+            _figure_hashes[path] = (*signature, chsum)
+        figures.append((name, chsum, png))
+    return figures
 
-    with open(path, "rb") as f:
-        chsum = hashlib.md5(f.read()).hexdigest()
+
+def _upload_png(chsum, png, public_bucket_name):
+    """Upload ``png`` unless it has been uploaded, and return its URL."""
     dst = chsum + ".png"
-    obj = bucket.Object(dst)
-    obj.upload_file(path)
 
-    bucket_location = boto3.client("s3").get_bucket_location(
-        Bucket=public_bucket_name
-    )
+    client, region = _client(public_bucket_name)
+    if (public_bucket_name, dst) not in _uploaded_figures:
+        client.upload_fileobj(io.BytesIO(png), public_bucket_name, dst)
+        _uploaded_figures.add((public_bucket_name, dst))
+
     url_base = "https://s3-{}.amazonaws.com/{}/{}"
-    return url_base.format(
-        bucket_location["LocationConstraint"], public_bucket_name, dst
-    )
+    return url_base.format(region, public_bucket_name, dst)
+
+
+@lru_cache(maxsize=None)
+def _client(bucket_name):
+    """Return a client and the region of the bucket, which are cached.
+
+    Unlike resources, clients can be shared by the upload threads.
+    """
+    client = boto3.client("s3")
+    bucket_location = client.get_bucket_location(Bucket=bucket_name)
+    return client, bucket_location["LocationConstraint"]
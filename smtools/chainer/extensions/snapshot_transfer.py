@@ -3,25 +3,156 @@ import os
 import shutil
 import tarfile
 import tempfile
+import time
+from fnmatch import fnmatch
+from functools import lru_cache, partial
 from pathlib import Path
+from types import SimpleNamespace
 
 import boto3
 from chainer.training import extension
 
+from smtools.background import BackgroundWorker, QueuePolicy
+from smtools.compression import Codec
+from smtools.dedup import DedupUploader
+from smtools.distributed import (
+    DistributedMode,
+    part_name,
+    shard,
+    write_part_marker,
+)
+from smtools.retention import LOCAL_ITERATION_PATTERN
+from smtools.s3_stream import S3MultipartWriter
+from smtools.watcher import FileWatcher
+
 
 def snapshot_transfer(
-    patterns, key_prefix="iter_{.updater.iteration:09}", bucket_name=None,
+    patterns,
+    key_prefix="iter_{.updater.iteration:09}",
+    bucket_name=None,
+    async_upload=False,
+    max_pending=1,
+    stream=False,
+    codec="gzip",
+    incremental=False,
+    retention=None,
+    distributed=DistributedMode.LEADER,
+    watch=False,
+    sentinel=None,
+    stable_seconds=2.0,
 ):
-    @extension.make_extension(trigger=(1, "epoch"), priority=-200)
-    def snapshot_transfer(trainer):
+    if distributed not in DistributedMode.values:
+        raise ValueError(f"Unknown distributed mode: {distributed}")
+    codec = Codec.parse(codec)
+    if async_upload:
+        # Only the latest snapshots are worth uploading,
+        # so stale ones are dropped when uploads fall behind.
+        uploader = BackgroundWorker(
+            max_pending=max_pending,
+            policy=QueuePolicy.DROP_OLDEST,
+            name="snapshot_transfer",
+        )
+    else:
+        uploader = None
+    stats = {"stall_seconds": 0.0}
+    # the iteration of the trainer on the last trigger in watch mode
+    seen = {"iteration": 0}
+    watchers = []
+
+    def transfer(trainer, targets=None):
         _snapshot_transfer(
-            trainer, patterns, key_prefix, bucket_name=bucket_name
+            trainer,
+            patterns,
+            key_prefix,
+            bucket_name=bucket_name,
+            uploader=uploader,
+            stream=stream,
+            codec=codec,
+            incremental=incremental,
+            retention=retention,
+            distributed=distributed,
+            targets=targets,
         )
 
+    def initialize(trainer):
+        out = trainer.out
+        # the latest complete file of each pattern
+        latest = {k: _get_latest_modified_object(out, k) for k in patterns}
+
+        def on_complete(paths):
+            # the trainer has moved on since the files were written, so
+            # they are keyed by their own iteration
+            landed = []
+            for path in paths:
+                for k in patterns:
+                    if fnmatch(path.name, k):
+                        latest[k] = path
+                        landed.append(path)
+            targets = [
+                p for p in latest.values() if p is not None and p.exists()
+            ]
+            iteration = _file_iteration(landed)
+            if iteration is None:
+                iteration = _file_iteration(targets)
+            if iteration is None:
+                iteration = seen["iteration"]
+            transfer(_at_iteration(out, iteration), targets)
+
+        watcher = FileWatcher(
+            out,
+            patterns,
+            on_complete,
+            stable_seconds=stable_seconds,
+            sentinel=sentinel,
+        )
+        watchers.append(watcher.start())
+
+    def finalize(*args):
+        # ship the files completed at the end of the training
+        for watcher in watchers:
+            watcher.stop()
+        if uploader is not None:
+            uploader.close()
+            print(
+                "snapshot_transfer: the trainer stalled for {:.1f} s, uploads "
+                "took {:.1f} s ({} uploaded, {} dropped, {} failed)".format(
+                    stats["stall_seconds"],
+                    uploader.busy_seconds,
+                    uploader.n_done,
+                    uploader.n_dropped,
+                    uploader.n_failed,
+                )
+            )
+        if retention is not None:
+            retention.close()
+
+    @extension.make_extension(
+        trigger=(1, "epoch"),
+        priority=-200,
+        finalizer=finalize,
+        initializer=initialize if watch else None,
+    )
+    def snapshot_transfer(trainer):
+        # the state of the trainer is read only on the trainer thread
+        if retention is not None:
+            _record_scores(trainer, retention)
+        if watch:
+            # the watcher ships the files without the trainer loop
+            seen["iteration"] = trainer.updater.iteration
+            return
+        start = time.time()
+        transfer(trainer)
+        stats["stall_seconds"] += time.time() - start
+
     return snapshot_transfer
 
 
-def _snapshot_transfer(trainer, patterns, key_prefix, bucket_name=None):
+def _snapshot_transfer(
+    trainer, patterns, key_prefix, bucket_name=None, uploader=None,
+    stream=False, codec=None, incremental=False, retention=None,
+    distributed=DistributedMode.LEADER, targets=None,
+):
+    codec = Codec.parse(codec or "gzip")
     # [todo] Exception handling
     training_env = os.getenv("SM_TRAINING_ENV")
     module_dir = Path(json.loads(training_env)["module_dir"])
@@ -31,39 +162,215 @@ def _snapshot_transfer(trainer, patterns, key_prefix, bucket_name=None):
     job_name = module_dir.parents[1].name
     job_name = json.loads(training_env)["job_name"]
 
-    s3 = boto3.resource("s3")
-    bucket = s3.Bucket(bucket_name)
-
-    targets = [_get_latest_modified_object(trainer.out, k) for k in patterns]
-
-    with tempfile.TemporaryDirectory(dir=trainer.out) as tmp_dir:
-        tmp_dir = Path(tmp_dir)
-        for src_file in targets:
-            if src_file is not None:
-                tgt_file = tmp_dir / src_file.name
-                shutil.copyfile(str(src_file), str(tgt_file))
-
-        arcname = "model"
-        out_tar = (Path(trainer.out) / arcname).with_suffix(".tar.gz")
-        with tarfile.open(str(out_tar), mode="w:gz") as tar:
-            tar.add(str(tmp_dir), arcname=arcname)
-
-        dst = str(
-            Path(job_name)
-            / "snapshot"
-            / key_prefix.format(trainer)
-            / out_tar.name
+    snapshot_dir = Path(job_name) / "snapshot"
+    key_dir = snapshot_dir / key_prefix.format(trainer)
+    index, count = shard()
+
+    if distributed != DistributedMode.LEADER or index == 0:
+        if targets is None:
+            targets = [
+                _get_latest_modified_object(trainer.out, k) for k in patterns
+            ]
+            targets = [t for t in targets if t is not None]
+        if distributed == DistributedMode.SHARD and count > 1:
+            part = (index, count)
+        else:
+            part = None
+        _ship(
+            trainer, targets, snapshot_dir, key_dir, bucket_name, uploader,
+            stream, codec, incremental, part=part,
+        )
+
+    if retention is not None:
+        # the local files are safe to delete even if they are still
+        # waiting for upload, since they have been staged
+        paths = [p for k in patterns for p in Path(trainer.out).glob(k)]
+        retention.submit(
+            paths,
+            # the leader prunes the snapshots of all the parts
+            bucket_name=bucket_name if index == 0 else None,
+            prefix=str(snapshot_dir),
         )
-        obj = bucket.Object(dst)
 
+
+def _ship(
+    trainer, targets, snapshot_dir, key_dir, bucket_name, uploader, stream,
+    codec, incremental, part=None,
+):
+    """Upload ``targets`` to ``key_dir``, or to the directory of ``part``
+    (index, count) under ``key_dir`` followed by its marker."""
+    part_dir = key_dir if part is None else key_dir / part_name(*part)
+    arcname = "model"
+    tmp_dir = None
+
+    if incremental:
+        dst = str(part_dir / "manifest.json")
+        send = partial(
+            _dedup_snapshot,
+            bucket_name=bucket_name,
+            chunk_prefix=str(snapshot_dir / "chunks"),
+            dst=dst,
+        )
+    elif stream:
+        dst = str(part_dir / f"{arcname}{codec.suffix}")
+        send = partial(
+            _stream_snapshot,
+            arcname=arcname,
+            bucket_name=bucket_name,
+            dst=dst,
+            codec=codec,
+        )
+    else:
+        tmp_dir = Path(tempfile.mkdtemp(dir=trainer.out))
+        dst = str(part_dir / f"{arcname}{codec.suffix}")
+        send = partial(
+            _tar_snapshot,
+            out_tar=tmp_dir.with_suffix(codec.suffix),
+            arcname=arcname,
+            bucket_name=bucket_name,
+            dst=dst,
+            codec=codec,
+        )
+    if part is not None:
+        send = partial(
+            _send_part,
+            send=send,
+            bucket_name=bucket_name,
+            key_dir=str(key_dir),
+            dst=dst,
+            part=part,
+        )
+
+    if uploader is None and tmp_dir is None:
+        # no local staging at all
+        upload = partial(send, targets)
+    else:
+        if tmp_dir is None:
+            tmp_dir = Path(tempfile.mkdtemp(dir=trainer.out))
+        _stage(targets, tmp_dir)
+        upload = partial(_send_staged, tmp_dir, send)
+
+    if uploader is None:
         try:
-            obj.upload_file(str(out_tar))
+            upload()
         except Exception as e:
             print(e)
+    else:
+        # the worker counts the failed uploads
+        discard = partial(shutil.rmtree, str(tmp_dir), ignore_errors=True)
+        uploader.submit(upload, discard=discard)
+
 
+def _send_part(targets, send, bucket_name, key_dir, dst, part):
+    """Send a part to ``dst`` and then mark it as uploaded."""
+    send(targets)
+    write_part_marker(
+        boto3.client("s3"), bucket_name, key_dir, *part, keys=[dst]
+    )
+
+
+def _record_scores(trainer, retention):
+    """Record the values of ``retention.metric`` in the LogReport."""
+    if retention.metric is None:
+        return
+    try:
+        log_report = trainer.get_extension("LogReport")
+    except ValueError:
+        return
+    for entry in log_report.log:
+        if retention.metric in entry:
+            retention.record(entry["iteration"], entry[retention.metric])
+
+
+def _file_iteration(paths):
+    """Return the largest iteration in the names of ``paths``, which is the
+    last number of a name as in the retention, or None."""
+    iterations = [
+        int(m.group(1))
+        for m in (LOCAL_ITERATION_PATTERN.search(p.name) for p in paths)
+        if m is not None
+    ]
+    return max(iterations, default=None)
+
+
+def _at_iteration(out, iteration):
+    """Stand in for the trainer to format ``key_prefix`` with the iteration
+    of the files, since the live trainer isn't read off its thread."""
+    return SimpleNamespace(
+        out=out, updater=SimpleNamespace(iteration=iteration)
+    )
+
+
+def _stage(targets, tmp_dir):
+    """Take a cheap snapshot of ``targets`` in ``tmp_dir``.
+
+    Files are hard-linked, which is safe because Chainer writes snapshots
+    and logs to new files instead of overwriting them, and copied if the
+    file system doesn't support hard links.
+    """
+    for src_file in targets:
+        tgt_file = tmp_dir / src_file.name
+        try:
+            os.link(str(src_file), str(tgt_file))
+        except OSError:
+            shutil.copyfile(str(src_file), str(tgt_file))
+
+
+def _send_staged(tmp_dir, send):
+    try:
+        send(sorted(tmp_dir.iterdir()))
+    finally:
+        shutil.rmtree(str(tmp_dir), ignore_errors=True)
+
+
+def _tar_snapshot(targets, out_tar, arcname, bucket_name, dst, codec):
+    with open(str(out_tar), "wb") as f:
+        _write_tar(f, targets, arcname, codec)
+
+    s3 = boto3.resource("s3")
+    obj = s3.Bucket(bucket_name).Object(dst)
+    try:
+        obj.upload_file(str(out_tar))
+    finally:
         os.remove(str(out_tar))
 
 
+def _stream_snapshot(targets, arcname, bucket_name, dst, codec):
+    """Write ``targets`` from their paths into a compressed tar stream
+    which is uploaded part by part by a multipart upload."""
+    client = boto3.client("s3")
+    with S3MultipartWriter(client, bucket_name, dst) as f:
+        _write_tar(f, targets, arcname, codec)
+
+
+def _dedup_snapshot(targets, bucket_name, chunk_prefix, dst):
+    """Upload only the chunks of ``targets`` which are not stored yet."""
+    res = _dedup_uploader(bucket_name, chunk_prefix).upload(targets, dst)
+    print(
+        "snapshot_transfer: uploaded {:.1f} MB of {:.1f} MB".format(
+            res["uploaded_bytes"] / 1e6, res["total_bytes"] / 1e6
+        )
+    )
+
+
+@lru_cache(maxsize=None)
+def _dedup_uploader(bucket_name, chunk_prefix):
+    # cached to keep the hashes of the uploaded chunks across calls
+    return DedupUploader(bucket_name, chunk_prefix)
+
+
+def _write_tar(fileobj, files, arcname, codec):
+    with codec.open_writer(fileobj) as f,\
+            tarfile.open(fileobj=f, mode="w|") as tar:
+        info = tarfile.TarInfo(arcname)
+        info.type = tarfile.DIRTYPE
+        info.mode = 0o755
+        info.mtime = int(time.time())
+        tar.addfile(info)
+        for src_file in files:
+            tar.add(str(src_file), arcname=f"{arcname}/{src_file.name}")
+
+
 def _get_latest_modified_object(dirname, key):
     files = [(f, f.stat().st_mtime) for f in Path(dirname).glob(key)]
 
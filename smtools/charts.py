@@ -0,0 +1,115 @@
+"""Compact charts of the metrics in ``LogReport.log``.
+
+``sparkline`` draws a series with Unicode block characters to be inlined in
+a message, and ``ChartRenderer`` draws the series of several keys into a
+single small PNG in memory, which is redrawn only when the values change.
+"""
+import hashlib
+import io
+import numbers
+
+import numpy as np
+
+BLOCKS = "▁▂▃▄▅▆▇█"
+
+
+def columns(log, keys):
+    """Return ``{key: values}`` of ``log``, a list of dicts such as
+    ``LogReport.log``. The values missing or not numbers are NaN."""
+    return {
+        k: np.fromiter(
+            (_number(entry.get(k)) for entry in log),
+            dtype=float,
+            count=len(log),
+        )
+        for k in keys
+    }
+
+
+def _number(value):
+    if isinstance(value, numbers.Real):
+        return value
+    return np.nan
+
+
+def sparkline(values, width=20):
+    """Draw the finite ``values`` with ``BLOCKS``.
+
+    If there are more than ``width`` values, they are averaged in ``width``
+    bins of about the same size.
+    """
+    values = np.asarray(values, dtype=float)
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return ""
+    if len(values) > width:
+        edges = np.linspace(0, len(values), width + 1).astype(int)
+        values = np.add.reduceat(values, edges[:-1]) / np.diff(edges)
+
+    low, high = values.min(), values.max()
+    if high == low:
+        levels = np.full(len(values), len(BLOCKS) // 2 - 1)
+    else:
+        levels = np.rint((values - low) / (high - low) * (len(BLOCKS) - 1))
+    return "".join(BLOCKS[i] for i in levels.astype(int))
+
+
+class ChartRenderer:
+    """Draw ``keys`` of a log against ``x_key`` into a PNG, with a row of
+    ``width`` x ``height`` inches per key."""
+
+    def __init__(self, keys, x_key="epoch", width=4.0, height=1.2, dpi=80):
+        self.keys = keys
+        self.x_key = x_key
+        self.width = width
+        self.height = height
+        self.dpi = dpi
+
+        self.n_rendered = 0
+        self._signature = None
+        self._png = None
+
+    def render(self, log):
+        """Return the PNG of ``log``, or ``None`` if none of the keys has
+        been reported. It is redrawn only if the values have changed."""
+        data = columns(log, [self.x_key] + list(self.keys))
+        x = data.pop(self.x_key)
+        data = {k: v for k, v in data.items() if np.isfinite(v).any()}
+        if not data:
+            return None
+
+        md5 = hashlib.md5(x.tobytes())
+        for k, v in data.items():
+            md5.update(k.encode())
+            md5.update(v.tobytes())
+        signature = md5.digest()
+        if signature != self._signature:
+            self._png = self._draw(x, data)
+            self._signature = signature
+            self.n_rendered += 1
+        return self._png
+
+    def _draw(self, x, data):
+        # no pyplot, which is neither thread-safe nor needs a display
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        fig = Figure(
+            figsize=(self.width, self.height * len(data)), dpi=self.dpi
+        )
+        FigureCanvasAgg(fig)
+        axes = fig.subplots(len(data), 1, sharex=True, squeeze=False)[:, 0]
+        if not np.isfinite(x).any():
+            x = np.arange(len(x))
+        for ax, (k, v) in zip(axes, data.items()):
+            finite = np.isfinite(v)
+            ax.plot(x[finite], v[finite], linewidth=1)
+            ax.set_title(k, fontsize="small", loc="left")
+            ax.tick_params(labelsize="x-small")
+            ax.grid(alpha=0.3)
+        axes[-1].set_xlabel(self.x_key, fontsize="small")
+        fig.tight_layout()
+
+        out = io.BytesIO()
+        fig.savefig(out, format="png")
+        return out.getvalue()
@@ -0,0 +1,195 @@
+"""Compression codecs of tar streams.
+
+``Codec`` wraps a writable file object in a compressing stream, and
+``open_reader`` wraps a readable one in the decompressing stream detected
+from its first bytes. ``zstd`` and ``lz4`` need the optional ``zstandard``
+and ``lz4`` packages.
+"""
+import gzip
+import io
+
+from smtools.parallel_gzip import (
+    HEADER_SIZE,
+    ParallelGzipReader,
+    ParallelGzipWriter,
+    member_size,
+)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+LZ4_MAGIC = b"\x04\x22\x4d\x18"
+
+
+class CodecName:
+    NONE = "none"
+    GZIP = "gzip"
+    ZSTD = "zstd"
+    LZ4 = "lz4"
+
+    values = [NONE, GZIP, ZSTD, LZ4]
+
+
+SUFFIXES = {
+    CodecName.NONE: ".tar",
+    CodecName.GZIP: ".tar.gz",
+    CodecName.ZSTD: ".tar.zst",
+    CodecName.LZ4: ".tar.lz4",
+}
+
+
+class Codec:
+    """A compression codec with its level and # threads.
+
+    It is usually parsed from a spec string like ``"none"``, ``"gzip:6"``,
+    ``"zstd:3:4"`` (level 3 on 4 threads) or ``"lz4"``. Gzip on more than
+    one thread (e.g. ``"gzip:6:8"``) writes independent gzip members of
+    ``smtools.parallel_gzip``, which ``tar -xzf`` still reads.
+    """
+
+    default_levels = {CodecName.GZIP: 9, CodecName.ZSTD: 3, CodecName.LZ4: 0}
+
+    def __init__(self, name=CodecName.GZIP, level=None, threads=None):
+        if name not in CodecName.values:
+            raise ValueError(f"Unknown codec: {name}")
+        if name == CodecName.ZSTD and zstandard is None:
+            raise ImportError("zstd needs `pip install zstandard`.")
+        if name == CodecName.LZ4 and lz4 is None:
+            raise ImportError("lz4 needs `pip install lz4`.")
+        self.name = name
+        self.level = self.default_levels.get(name) if level is None else level
+        self.threads = threads
+
+    @classmethod
+    def parse(cls, spec):
+        """Return the codec of ``spec``, a spec string, a ``Codec`` or None
+        (no compression)."""
+        if isinstance(spec, cls):
+            return spec
+        if spec is None:
+            return cls(CodecName.NONE)
+        name, *params = str(spec).split(":")
+        params = [int(p) for p in params]
+        return cls(name, *params)
+
+    @property
+    def suffix(self):
+        return SUFFIXES[self.name]
+
+    def __repr__(self):
+        return "Codec({!r}, level={}, threads={})".format(
+            self.name, self.level, self.threads
+        )
+
+    def open_writer(self, fileobj):
+        """Return a writable stream which compresses into ``fileobj``.
+
+        Closing the stream finishes the compressed data but does not close
+        ``fileobj``.
+        """
+        if self.name == CodecName.GZIP:
+            if self.threads is not None and self.threads > 1:
+                return ParallelGzipWriter(
+                    fileobj, level=self.level, workers=self.threads
+                )
+            return gzip.GzipFile(
+                fileobj=fileobj, mode="wb", compresslevel=self.level
+            )
+        if self.name == CodecName.ZSTD:
+            cctx = zstandard.ZstdCompressor(
+                level=self.level, threads=self.threads or 0
+            )
+            return cctx.stream_writer(fileobj, closefd=False)
+        if self.name == CodecName.LZ4:
+            return lz4.frame.LZ4FrameFile(
+                fileobj, mode="wb", compression_level=self.level
+            )
+        return _Unclosed(fileobj)
+
+
+def detect(head):
+    """Return the codec name of a stream starting with ``head``."""
+    if head.startswith(GZIP_MAGIC):
+        return CodecName.GZIP
+    if head.startswith(ZSTD_MAGIC):
+        return CodecName.ZSTD
+    if head.startswith(LZ4_MAGIC):
+        return CodecName.LZ4
+    return CodecName.NONE
+
+
+def open_reader(fileobj, workers=None):
+    """Return a readable stream of the data in ``fileobj`` decompressed by
+    the codec detected from its first bytes.
+
+    ``fileobj`` only needs ``read()``. Gzip streams written by
+    ``smtools.parallel_gzip`` are inflated on ``workers`` threads.
+    """
+    head = b""
+    while len(head) < HEADER_SIZE:
+        chunk = fileobj.read(HEADER_SIZE - len(head))
+        if not chunk:
+            break
+        head += chunk
+    f = _Prefixed(head, fileobj)
+
+    name = detect(head)
+    if name == CodecName.GZIP:
+        if member_size(head) is not None:
+            return ParallelGzipReader(f, workers=workers)
+        return gzip.GzipFile(fileobj=f, mode="rb")
+    if name == CodecName.ZSTD:
+        if zstandard is None:
+            raise ImportError("zstd needs `pip install zstandard`.")
+        return zstandard.ZstdDecompressor().stream_reader(
+            f, read_across_frames=True
+        )
+    if name == CodecName.LZ4:
+        if lz4 is None:
+            raise ImportError("lz4 needs `pip install lz4`.")
+        return lz4.frame.LZ4FrameFile(f, mode="rb")
+    return f
+
+
+class _Prefixed(io.RawIOBase):
+    """Readable stream of ``prefix`` followed by the rest of ``fileobj``."""
+
+    def __init__(self, prefix, fileobj):
+        self._prefix = memoryview(prefix)
+        self._f = fileobj
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self._prefix:
+            n = min(len(b), len(self._prefix))
+            b[:n] = self._prefix[:n]
+            self._prefix = self._prefix[n:]
+            return n
+        data = self._f.read(len(b))
+        b[: len(data)] = data
+        return len(data)
+
+
+class _Unclosed(io.RawIOBase):
+    """Writable stream to ``fileobj`` which leaves it open on close."""
+
+    def __init__(self, fileobj):
+        self._f = fileobj
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        return self._f.write(b)
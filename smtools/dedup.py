@@ -0,0 +1,218 @@
+"""Deduplicated, incremental uploads of snapshot files.
+
+Files are cut into content-defined chunks: a chunk ends where the hash of
+the last ``WINDOW`` bytes matches a mask, so an insertion or a change only
+moves the boundaries around it. Each chunk is stored once under
+``{chunk_prefix}/{sha256}`` and every snapshot is a small JSON manifest
+listing the chunks of its files, so unchanged parts of a checkpoint (e.g. a
+frozen backbone) are uploaded only once.
+"""
+import hashlib
+import json
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import boto3
+import numpy as np
+
+WINDOW = 64
+MIN_CHUNK_SIZE = 256 * 1024
+AVG_CHUNK_SIZE = 1024 * 1024
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+SEGMENT_SIZE = 16 * 1024 * 1024
+
+# random but fixed, so that the boundaries are stable across processes
+_GEAR = np.random.RandomState(20200401).randint(
+    0, 2 ** 32, size=256, dtype=np.uint64
+).astype(np.uint32)
+
+
+def _candidates(buf, mask):
+    """Return the positions in ``buf`` after which a chunk may end."""
+    data = np.frombuffer(buf, dtype=np.uint8)
+    if len(data) < WINDOW:
+        return np.zeros(0, dtype=np.int64)
+    # rolling sum of the gear values of the last WINDOW bytes
+    csum = np.cumsum(_GEAR[data], dtype=np.uint32)
+    window_sum = csum[WINDOW - 1 :].copy()
+    window_sum[1:] -= csum[: -WINDOW]
+    return np.flatnonzero((window_sum & mask) == 0) + WINDOW
+
+
+def iter_chunks(
+    f,
+    min_size=MIN_CHUNK_SIZE,
+    avg_size=AVG_CHUNK_SIZE,
+    max_size=MAX_CHUNK_SIZE,
+):
+    """Yield the content-defined chunks of the file object ``f``.
+
+    ``avg_size`` must be a power of 2. The file is hashed with NumPy
+    ``SEGMENT_SIZE`` bytes at a time, so the memory usage is bounded.
+    """
+    mask = avg_size - 1
+    buf = b""
+    eof = False
+    while not eof:
+        data = f.read(SEGMENT_SIZE)
+        eof = not data
+        buf += data
+        candidates = _candidates(buf, mask)
+        start = 0
+        while True:
+            i = np.searchsorted(candidates, start + min_size)
+            if i < len(candidates) and candidates[i] - start <= max_size:
+                end = int(candidates[i])
+            elif len(buf) - start >= max_size:
+                end = start + max_size
+            else:
+                break
+            yield buf[start:end]
+            start = end
+        buf = buf[start:]
+    if buf:
+        yield buf
+
+
+class DedupUploader:
+    """Upload files as deduplicated chunks and a manifest to S3.
+
+    The hashes of the chunks already stored under ``chunk_prefix`` are
+    listed once and then cached, so re-uploading an unchanged chunk costs
+    no request at all.
+    """
+
+    def __init__(self, bucket_name, chunk_prefix, client=None, workers=8):
+        self.bucket_name = bucket_name
+        self.chunk_prefix = chunk_prefix.rstrip("/")
+        self.client = client or boto3.client("s3")
+        self.workers = workers
+        self._known = None
+
+    def _chunk_key(self, digest):
+        return f"{self.chunk_prefix}/{digest}"
+
+    def _list_known(self):
+        known = set()
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(
+            Bucket=self.bucket_name, Prefix=self.chunk_prefix + "/"
+        ):
+            for obj in page.get("Contents", []):
+                known.add(obj["Key"].rsplit("/", 1)[-1])
+        return known
+
+    def upload(self, paths, manifest_key):
+        """Upload ``paths`` and write their manifest to ``manifest_key``.
+
+        Returns the total bytes of the files and the bytes uploaded.
+        """
+        if self._known is None:
+            self._known = self._list_known()
+
+        manifest = {"version": 1, "files": []}
+        n_total = n_uploaded = 0
+        # [(digest, future)], whose digests are known once they are stored
+        pending = deque()
+        queued = set()
+        with ThreadPoolExecutor(self.workers) as pool:
+            for path in paths:
+                path = Path(path)
+                chunks = []
+                with path.open("rb") as f:
+                    for chunk in iter_chunks(f):
+                        digest = hashlib.sha256(chunk).hexdigest()
+                        chunks.append([digest, len(chunk)])
+                        n_total += len(chunk)
+                        if digest in self._known or digest in queued:
+                            continue
+                        queued.add(digest)
+                        n_uploaded += len(chunk)
+                        future = pool.submit(
+                            self.client.put_object,
+                            Bucket=self.bucket_name,
+                            Key=self._chunk_key(digest),
+                            Body=chunk,
+                        )
+                        pending.append((digest, future))
+                        # bound the chunks held in memory
+                        while len(pending) > 2 * self.workers:
+                            self._wait(*pending.popleft())
+                manifest["files"].append(
+                    {
+                        "name": path.name,
+                        "size": path.stat().st_size,
+                        "chunks": chunks,
+                    }
+                )
+            while pending:
+                self._wait(*pending.popleft())
+
+        # the manifest is written last, so that it never refers to
+        # chunks which don't exist
+        self.client.put_object(
+            Bucket=self.bucket_name,
+            Key=manifest_key,
+            Body=json.dumps(manifest).encode(),
+        )
+        return {"total_bytes": n_total, "uploaded_bytes": n_uploaded}
+
+    def _wait(self, digest, future):
+        # a chunk which failed to be stored is uploaded again next time
+        future.result()
+        self._known.add(digest)
+
+
+def restore(
+    bucket_name, manifest_key, out_dir, chunk_prefix=None, client=None,
+    workers=8,
+):
+    """Reassemble the files of the manifest at ``manifest_key`` in
+    ``out_dir`` by downloading their chunks in parallel.
+
+    ``chunk_prefix`` defaults to ``chunks`` next to the snapshot
+    directories, i.e. ``{job}/snapshot/chunks`` for
+    ``{job}/snapshot/iter_*/manifest.json``. Returns the restored paths.
+    """
+    client = client or boto3.client("s3")
+    if chunk_prefix is None:
+        chunk_prefix = str(Path(manifest_key).parents[1] / "chunks")
+    res = client.get_object(Bucket=bucket_name, Key=manifest_key)
+    manifest = json.loads(res["Body"].read())
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    def fetch(fd, digest, offset):
+        res = client.get_object(
+            Bucket=bucket_name, Key=f"{chunk_prefix.rstrip('/')}/{digest}"
+        )
+        data = res["Body"].read()
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise IOError(f"Chunk {digest} is broken.")
+        os.pwrite(fd, data, offset)
+
+    paths, fds, futures = [], [], []
+    with ThreadPoolExecutor(workers) as pool:
+        try:
+            for file_ in manifest["files"]:
+                path = out_dir / file_["name"]
+                fd = os.open(str(path), os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+                fds.append(fd)
+                os.ftruncate(fd, file_["size"])
+                paths.append(path)
+                offset = 0
+                for digest, size in file_["chunks"]:
+                    futures.append(pool.submit(fetch, fd, digest, offset))
+                    offset += size
+            for future in futures:
+                future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+            pool.shutdown()
+            for fd in fds:
+                os.close(fd)
+    return paths
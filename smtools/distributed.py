@@ -0,0 +1,69 @@
+"""Who ships checkpoints in multi-instance or MPI training.
+
+The hosts are read from ``SM_TRAINING_ENV`` (``hosts`` and
+``current_host``), and the rank from the MPI environment variables, which
+take precedence since several ranks may run on a host.
+"""
+import json
+import os
+import socket
+
+# (rank, size) environment variables of Open MPI, MPICH/Intel MPI and
+# torch.distributed
+RANK_ENV_VARS = [
+    ("OMPI_COMM_WORLD_RANK", "OMPI_COMM_WORLD_SIZE"),
+    ("PMI_RANK", "PMI_SIZE"),
+    ("RANK", "WORLD_SIZE"),
+]
+
+
+class DistributedMode:
+    """Which processes upload a checkpoint."""
+
+    ALL = "all"  # every process uploads the same key
+    LEADER = "leader"  # only the first process uploads
+    SHARD = "shard"  # every process uploads its own part
+
+    values = [ALL, LEADER, SHARD]
+
+
+def shard():
+    """Return ``(index, count)`` of this process among the processes which
+    ship checkpoints: the MPI rank and size, or the index of
+    ``current_host`` in the sorted ``hosts`` and # hosts."""
+    for rank_var, size_var in RANK_ENV_VARS:
+        if rank_var in os.environ and size_var in os.environ:
+            return int(os.environ[rank_var]), int(os.environ[size_var])
+
+    training_env = os.getenv("SM_TRAINING_ENV")
+    if training_env is not None:
+        training_env = json.loads(training_env)
+        hosts = sorted(training_env.get("hosts", []))
+        current_host = training_env.get("current_host")
+        if current_host in hosts:
+            return hosts.index(current_host), len(hosts)
+    return 0, 1
+
+
+def part_name(index, count):
+    """Return the name of the directory of the part ``index``."""
+    return f"part-{index:05}-of-{count:05}"
+
+
+def write_part_marker(client, bucket_name, key_dir, index, count, keys):
+    """Mark the part ``index`` under ``key_dir`` as uploaded.
+
+    It must be called after the upload of the part has completed, so that a
+    snapshot is restored only if all of its parts are complete.
+    """
+    marker = {
+        "index": index,
+        "count": count,
+        "host": socket.gethostname(),
+        "keys": list(keys),
+    }
+    client.put_object(
+        Bucket=bucket_name,
+        Key=f"{key_dir}/{part_name(index, count)}.json",
+        Body=json.dumps(marker).encode(),
+    )
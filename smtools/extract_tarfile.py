@@ -1,17 +1,247 @@
+import hashlib
+import io
+import json
 import os
+import re
+import shutil
+import time
+from collections import OrderedDict
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor
 from glob import glob
+from multiprocessing import Manager
 import tarfile
 import argparse
 
+from smtools.compression import SUFFIXES, CodecName, open_reader
 
-def extract_tarfile(inp_dir, remove=True):
+# 'dataset.tar.gz' or its fragment 'dataset.tar.gz-*' -> 'dataset.tar.gz'
+ARCHIVE_PATTERN = re.compile(r'^(.*({}))(-[^/]*)?$'.format(
+    '|'.join(re.escape(suffix) for suffix in SUFFIXES.values())
+))
+PLAIN_TAR_SUFFIX = SUFFIXES[CodecName.NONE]
+
+
+def extract_tarfile(
+    inp_dir,
+    remove=True,
+    stream=False,
+    workers=None,
+    processes=None,
+    check_conflicts=False,
+    cache=True,
+    verify='mtime',
+    plain_tar=False,
+):
+    """Extract every ``*.tar.gz`` and every group of split ``*.tar.gz-*``
+    files in ``inp_dir`` to ``inp_dir``. ``*.tar.zst`` and ``*.tar.lz4``
+    files are extracted as well; the codec is detected from the content.
+    Uncompressed ``*.tar`` files are extracted only with ``plain_tar=True``,
+    since they are usually read in place by ``IndexedTarFile``.
+
+    Several archives are extracted concurrently on up to ``processes``
+    processes. With ``check_conflicts=True`` a member path written by two
+    different archives raises ``FileExistsError``, which costs a round trip
+    to a shared dict per member. Returns the per-archive throughput
+    stats.
+
+    With ``cache=True`` a manifest of each extracted archive is written to
+    ``inp_dir``, and later calls only extract the members which are missing
+    from ``inp_dir``, even if the archive has been removed. ``verify``
+    selects how an archive is compared with its manifest: ``'mtime'``
+    (size and mtime), ``'size'`` or ``'hash'`` (sha256 of the content).
+    """
+    archives = find_archives(inp_dir, cache=cache, plain_tar=plain_tar)
+    assert len(archives) > 0,\
+        'There is no tar file in {}'.format(inp_dir)
+
+    if len(archives) == 1:
+        tar_file, files = archives[0]
+        return [
+            _extract_archive(
+                tar_file, files, remove, stream, workers,
+                cache=cache, verify=verify,
+            )
+        ]
+
+    processes = processes or min(len(archives), os.cpu_count() or 1)
+    with ExitStack() as stack:
+        # the manager process is started only to share the claims
+        claims = None
+        if check_conflicts:
+            claims = stack.enter_context(Manager()).dict()
+        pool = stack.enter_context(ProcessPoolExecutor(processes))
+        futures = [
+            pool.submit(
+                _extract_archive,
+                tar_file, files, remove, stream, workers, claims,
+                cache, verify,
+            )
+            for tar_file, files in archives
+        ]
+        return [future.result() for future in futures]
+
+
+def find_archives(inp_dir, cache=False, plain_tar=False):
+    """Return ``(tar_file, files)`` pairs for the archives in ``inp_dir``.
+
+    ``files`` is ``[tar_file]`` for a ``*.tar.gz`` file and the sorted
+    fragments for split ``{tar_file}-*`` files. With ``cache=True`` the
+    archives which are gone but have a manifest are returned with ``[]``.
+    Uncompressed ``*.tar`` files are included only with ``plain_tar=True``.
+    """
+    archives = OrderedDict()
+    fracs = []
+    for path in sorted(glob(os.path.join(inp_dir, '*.tar*'))):
+        m = ARCHIVE_PATTERN.match(path)
+        if m is None:
+            continue
+        if m.group(2) == PLAIN_TAR_SUFFIX and not plain_tar:
+            continue
+        tar_file = m.group(1)
+        if tar_file == path:
+            archives[tar_file] = [tar_file]
+        else:
+            fracs.append((tar_file, path))
+    for tar_file, frac in fracs:
+        if archives.get(tar_file) == [tar_file]:
+            # already joined
+            continue
+        archives.setdefault(tar_file, []).append(frac)
+    if cache:
+        for manifest in sorted(glob(os.path.join(inp_dir, '.*.manifest'))):
+            # '.../.dataset.tar.gz.manifest' -> '.../dataset.tar.gz'
+            name = os.path.basename(manifest)[1:-len('.manifest')]
+            if name.endswith(PLAIN_TAR_SUFFIX) and not plain_tar:
+                continue
+            archives.setdefault(os.path.join(inp_dir, name), [])
+    return list(archives.items())
+
+
+def _extract_archive(
+    tar_file, files, remove, stream, workers, claims=None,
+    cache=False, verify='mtime',
+):
+    start = time.time()
+    n_bytes = sum(os.path.getsize(f) for f in files)
+    source = _source_signature(files, verify) if cache and files else None
+
+    only = None
+    if cache:
+        manifest = load_manifest(tar_file)
+        if manifest is not None and (
+            not files or manifest['source'] == source
+        ):
+            only = missing_members(manifest, os.path.dirname(tar_file))
+            if not only:
+                print('{}: {} members are already extracted'.format(
+                    os.path.basename(tar_file), manifest['n_members']
+                ))
+                if remove:
+                    for f in files:
+                        os.remove(f)
+                return {
+                    'archive': tar_file, 'bytes': 0, 'seconds': 0.,
+                    'skipped': True,
+                }
+            if not files:
+                raise FileNotFoundError(
+                    '{} members of {} are missing, but the archive is '
+                    'gone'.format(len(only), tar_file)
+                )
+    assert files, 'There is no tar file for {}'.format(tar_file)
+
+    record = {} if cache else None
+    kwargs = dict(
+        remove=remove, workers=workers, claims=claims,
+        only=only, record=record,
+    )
+    if files == [tar_file]:
+        extract(tar_file, **kwargs)
+    elif stream:
+        _extract_stream(files, **kwargs)
+    else:
+        _concat(files, tar_file, remove=remove)
+        if source is not None and not remove and verify == 'mtime':
+            # the joined file is found instead of the fragments next time,
+            # with the same size and content but a newer mtime
+            source = _source_signature([tar_file], verify)
+        extract(tar_file, **kwargs)
+
+    if cache and only is None:
+        save_manifest(tar_file, source, record)
+
+    elapsed = time.time() - start
+    print('{}: {:.1f} MB in {:.1f} s ({:.1f} MB/s)'.format(
+        os.path.basename(tar_file),
+        n_bytes / 1e6,
+        elapsed,
+        n_bytes / 1e6 / max(elapsed, 1e-9),
+    ))
+    return {
+        'archive': tar_file, 'bytes': n_bytes, 'seconds': elapsed,
+        'skipped': False,
+    }
+
+
+def manifest_path(tar_file):
+    return os.path.join(
+        os.path.dirname(tar_file),
+        '.{}.manifest'.format(os.path.basename(tar_file)),
+    )
+
+
+def load_manifest(tar_file):
     try:
-        tar_file = sorted(glob(os.path.join(inp_dir, '*.tar.gz')))[0]
-    except IndexError as e:
-        print(e)
-        print('There is no tar file in {}'.format(inp_dir))
-        tar_file = concat(inp_dir, remove=remove)
-    extract(tar_file, remove=remove)
+        with open(manifest_path(tar_file)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def save_manifest(tar_file, source, members):
+    """Record ``members`` (member name -> size) extracted from the
+    archive whose ``source`` signature is given."""
+    manifest = {
+        'archive': os.path.basename(tar_file),
+        'source': source,
+        'n_members': len(members),
+        'total_bytes': sum(members.values()),
+        'members': members,
+    }
+    path = manifest_path(tar_file)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(path + '.tmp', path)
+
+
+def missing_members(manifest, out_dir):
+    """Return the members in ``manifest`` which do not exist in
+    ``out_dir`` with the recorded size, with one stat call per member."""
+    missing = set()
+    for name, size in manifest['members'].items():
+        try:
+            if os.stat(os.path.join(out_dir, name)).st_size != size:
+                missing.add(name)
+        except FileNotFoundError:
+            missing.add(name)
+    return missing
+
+
+def _source_signature(files, verify):
+    signature = {'size': sum(os.path.getsize(f) for f in files)}
+    if verify == 'mtime':
+        signature['mtime'] = max(os.path.getmtime(f) for f in files)
+    elif verify == 'hash':
+        h = hashlib.sha256()
+        for f in files:
+            with open(f, 'rb') as f_in:
+                for chunk in iter(lambda: f_in.read(1 << 20), b''):
+                    h.update(chunk)
+        signature['sha256'] = h.hexdigest()
+    elif verify != 'size':
+        raise ValueError('Unknown verify: {}'.format(verify))
+    return signature
 
 
 def concat(inp_dir, remove=True):
@@ -25,21 +255,136 @@ def concat(inp_dir, remove=True):
         os.path.basename(tar_file_fracs[0]).split('-')[0],
     )
 
-    for frac in tar_file_fracs:
-        with open(frac, 'rb') as f_in,\
-             open(tar_file, 'ab') as f_out:
-            f_out.write(f_in.read())
-        if remove:
-            os.remove(frac)
+    _concat(tar_file_fracs, tar_file, remove=remove)
 
     return tar_file
 
 
-def extract(tar_file, remove=True):
-    with tarfile.open(tar_file, 'r:gz') as tf:
-        tf.extractall(os.path.dirname(tar_file))
-        if remove:
-            os.remove(tar_file)
+def _concat(tar_file_fracs, tar_file, remove=True):
+    with open(tar_file, 'ab') as f_out:
+        for frac in tar_file_fracs:
+            with open(frac, 'rb') as f_in:
+                shutil.copyfileobj(f_in, f_out)
+            if remove:
+                os.remove(frac)
+
+
+def extract(
+    tar_file, remove=True, workers=None, claims=None, only=None, record=None
+):
+    out_dir = os.path.dirname(tar_file)
+    # archives written by smtools.parallel_gzip are inflated
+    # on `workers` threads
+    with open(tar_file, 'rb') as f,\
+            open_reader(f, workers=workers) as f_in,\
+            tarfile.open(fileobj=f_in, mode='r|') as tf:
+        tf.extractall(
+            out_dir, members=_members(tf, tar_file, claims, only, record)
+        )
+    if remove:
+        os.remove(tar_file)
+
+
+def extract_fragments(inp_dir, remove=True, workers=None):
+    """Extract split ``*.tar.gz-*`` files without joining them on disk.
+
+    The fragments are read in order as one stream and fed to ``tarfile``
+    in stream mode, so neither the joined tarball nor a whole fragment is
+    ever materialized. With ``remove=True`` each fragment is deleted as
+    soon as it has been consumed, which keeps the peak disk usage at about
+    the size of the extracted data.
+    """
+    archives = [
+        files
+        for tar_file, files in find_archives(inp_dir)
+        if files != [tar_file]
+    ]
+    assert len(archives) > 0,\
+        'Cant\'t even find tar file fractions in {}'.format(inp_dir)
+
+    for tar_file_fracs in archives:
+        _extract_stream(tar_file_fracs, remove=remove, workers=workers)
+
+
+def _extract_stream(
+    tar_file_fracs, remove=True, workers=None, claims=None, only=None,
+    record=None,
+):
+    out_dir = os.path.dirname(tar_file_fracs[0])
+    owner = tar_file_fracs[0]
+    with FragmentReader(tar_file_fracs, remove=remove) as f_frac,\
+            open_reader(f_frac, workers=workers) as f_in,\
+            tarfile.open(fileobj=f_in, mode='r|') as tf:
+        tf.extractall(
+            out_dir, members=_members(tf, owner, claims, only, record)
+        )
+        # tarfile stops at the end-of-archive blocks, so consume the
+        # padding left in the last fragment to get it removed as well.
+        while f_in.read(io.DEFAULT_BUFFER_SIZE):
+            pass
+        while f_frac.read(io.DEFAULT_BUFFER_SIZE):
+            pass
+
+
+def _members(tf, owner, claims=None, only=None, record=None):
+    """Yield the members of ``tf`` to extract.
+
+    Each path is claimed for ``owner`` in ``claims``, a dict shared by the
+    archives extracted together. Only the names in ``only`` are yielded if
+    it is given, and the sizes of the regular files are stored in
+    ``record``.
+    """
+    for member in tf:
+        name = os.path.normpath(member.name)
+        if only is not None and name not in only:
+            continue
+        if record is not None and member.isfile():
+            record[name] = member.size
+        if claims is not None and not member.isdir():
+            holder = claims.setdefault(name, owner)
+            if holder != owner:
+                raise FileExistsError(
+                    '{} is contained in both {} and {}'.format(
+                        name, holder, owner
+                    )
+                )
+        yield member
+
+
+class FragmentReader(io.RawIOBase):
+    """Readable stream over the concatenation of ``fragments``.
+
+    Each fragment is opened lazily and, if ``remove`` is set, deleted once
+    it has been read to the end.
+    """
+
+    def __init__(self, fragments, remove=False):
+        self._fragments = list(fragments)
+        self._remove = remove
+        self._f = None
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while self._f is not None or self._fragments:
+            if self._f is None:
+                self._f = open(self._fragments[0], 'rb')
+            n = self._f.readinto(b)
+            if n:
+                return n
+            self._f.close()
+            self._f = None
+            frac = self._fragments.pop(0)
+            if self._remove:
+                os.remove(frac)
+        return 0
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+        super().close()
 
 
 if __name__ == '__main__':
@@ -51,5 +396,21 @@ if __name__ == '__main__':
         '-rm', '--remove',
         action="store_true"
     )
+    parser.add_argument(
+        '-s', '--stream',
+        action="store_true",
+        help='extract the fragments as a stream instead of joining them'
+    )
+    parser.add_argument(
+        '-w', '--workers',
+        type=int,
+        default=None,
+        help='# threads to inflate archives written by smtools.parallel_gzip'
+    )
     args = parser.parse_args()
-    concat(args.inp_dir, remove=args.remove)
+    if args.stream:
+        extract_fragments(
+            args.inp_dir, remove=args.remove, workers=args.workers
+        )
+    else:
+        concat(args.inp_dir, remove=args.remove)
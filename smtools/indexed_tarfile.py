@@ -0,0 +1,229 @@
+"""Random access to the members of a tar file without extracting it.
+
+An offset index (member name -> offset and size) is built in a single pass
+and saved next to the archive as ``{archive}.index``. Members are then read
+by name with ``mmap`` for an uncompressed tar, or with ``os.pread`` of the
+gzip members covering them for a tar written by ``smtools.parallel_gzip``.
+Pack archives for random access with a small ``block_size`` so that a read
+inflates little more than the member itself.
+"""
+import argparse
+import bisect
+import json
+import mmap
+import os
+import struct
+import tarfile
+from collections import OrderedDict
+
+from smtools.parallel_gzip import (
+    HEADER_SIZE,
+    ParallelGzipReader,
+    inflate_member,
+    member_size,
+    is_parallel_gzip,
+)
+
+
+class IndexedTarFile:
+    """Read the members of ``archive`` by name.
+
+    The index is loaded from ``index_file`` (default ``{archive}.index``)
+    if it matches the archive, and built and saved otherwise. Instances
+    can be shared by forked workers and pickled for spawned ones; each
+    process opens its own file descriptor lazily.
+    """
+
+    def __init__(self, archive, index_file=None, cache_blocks=8):
+        self.archive = str(archive)
+        self.index_file = index_file or self.archive + ".index"
+        self._cache_blocks = cache_blocks
+
+        index = load_index(self.archive, self.index_file)
+        if index is None:
+            index = build_index(self.archive)
+            save_index(index, self.index_file)
+
+        self.format = index["format"]
+        self.names = [name for name, _, _ in index["members"]]
+        self._members = {
+            name: (offset, size) for name, offset, size in index["members"]
+        }
+        blocks = index["blocks"]
+        self._block_coffsets = [b[0] for b in blocks]
+        self._block_csizes = [b[1] for b in blocks]
+        self._block_uoffsets = [b[2] for b in blocks]
+        self._reset()
+
+    def _reset(self):
+        self._pid = None
+        self._fd = None
+        self._mmap = None
+        self._block_cache = OrderedDict()
+
+    def _open(self):
+        if self._pid != os.getpid():
+            self._reset()
+            self._pid = os.getpid()
+            self._fd = os.open(self.archive, os.O_RDONLY)
+            if self.format == "tar" and os.fstat(self._fd).st_size > 0:
+                self._mmap = mmap.mmap(
+                    self._fd, 0, access=mmap.ACCESS_READ
+                )
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update(_pid=None, _fd=None, _mmap=None, _block_cache=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset()
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self._members
+
+    def getsize(self, name):
+        return self._members[name][1]
+
+    def read(self, name):
+        offset, size = self._members[name]
+        self._open()
+        if self.format == "tar":
+            return self._mmap[offset : offset + size]
+        return self._read_pgzip(offset, size)
+
+    def _read_pgzip(self, offset, size):
+        first = bisect.bisect_right(self._block_uoffsets, offset) - 1
+        buf = bytearray()
+        i = first
+        while len(buf) < offset - self._block_uoffsets[first] + size:
+            buf += self._block(i)
+            i += 1
+        start = offset - self._block_uoffsets[first]
+        return bytes(buf[start : start + size])
+
+    def _block(self, i):
+        if i in self._block_cache:
+            self._block_cache.move_to_end(i)
+            return self._block_cache[i]
+        member = os.pread(
+            self._fd, self._block_csizes[i], self._block_coffsets[i]
+        )
+        data = inflate_member(member)
+        self._block_cache[i] = data
+        if len(self._block_cache) > self._cache_blocks:
+            self._block_cache.popitem(last=False)
+        return data
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+        if self._fd is not None and self._pid == os.getpid():
+            os.close(self._fd)
+        self._reset()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def build_index(archive):
+    """Build the index of ``archive`` in a single pass."""
+    archive = str(archive)
+    stat = os.stat(archive)
+    index = {
+        "archive_size": stat.st_size,
+        "archive_mtime": stat.st_mtime,
+        "blocks": [],
+    }
+    if is_parallel_gzip(archive):
+        index["format"] = "pgzip"
+        index["blocks"] = _scan_blocks(archive)
+        with open(archive, "rb") as f, ParallelGzipReader(
+            f
+        ) as f_in, tarfile.open(fileobj=f_in, mode="r|") as tf:
+            index["members"] = _scan_members(tf)
+    else:
+        with open(archive, "rb") as f:
+            if f.read(2) == b"\x1f\x8b":
+                raise ValueError(
+                    f"{archive} is a single-member gzip file, which can't be "
+                    "read randomly. Repack it with smtools.parallel_gzip."
+                )
+        index["format"] = "tar"
+        with tarfile.open(archive, "r:") as tf:
+            index["members"] = _scan_members(tf)
+    return index
+
+
+def _scan_members(tf):
+    return [
+        [member.name, member.offset_data, member.size]
+        for member in tf
+        if member.isfile()
+    ]
+
+
+def _scan_blocks(archive):
+    """Return ``[compressed offset, compressed size, offset, size]`` of the
+    gzip members, reading only their headers and trailers."""
+    blocks = []
+    coffset = uoffset = 0
+    with open(archive, "rb") as f:
+        while True:
+            f.seek(coffset)
+            header = f.read(HEADER_SIZE)
+            if not header:
+                break
+            csize = member_size(header)
+            if csize is None:
+                raise ValueError(f"{archive} is broken at {coffset}")
+            f.seek(coffset + csize - 4)
+            (usize,) = struct.unpack("<I", f.read(4))
+            blocks.append([coffset, csize, uoffset, usize])
+            coffset += csize
+            uoffset += usize
+    return blocks
+
+
+def load_index(archive, index_file):
+    """Return the index in ``index_file`` if it matches ``archive``."""
+    try:
+        with open(index_file) as f:
+            index = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    stat = os.stat(archive)
+    if (index["archive_size"], index["archive_mtime"]) != (
+        stat.st_size,
+        stat.st_mtime,
+    ):
+        return None
+    return index
+
+
+def save_index(index, index_file):
+    with open(index_file + ".tmp", "w") as f:
+        json.dump(index, f)
+    os.replace(index_file + ".tmp", index_file)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("archive")
+    parser.add_argument("-o", "--index_file", default=None)
+    args = parser.parse_args()
+
+    index = build_index(args.archive)
+    save_index(index, args.index_file or args.archive + ".index")
+    print(f"Indexed {len(index['members'])} members of {args.archive}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,8 @@
 import argparse
 import collections
+import hashlib
+import itertools
+import json
 from io import StringIO
 from copy import deepcopy
 import difflib
@@ -20,6 +23,9 @@ except ImportError:  # fallback so that the imported classes always exist
 
     Fore = Back = Style = ColorFallback()
 
+# the C loader of libyaml is much faster if available
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 # python 3.8+ compatibility
 try:
     collectionsAbc = collections.abc
@@ -29,19 +35,68 @@ except:
 
 SEPARATION = "\n" + "".join(["=" for _ in range(96)]) + "\n"
 
+# the old value of an added key
+MISSING = object()
+
+# a value at the key path ``path`` (a tuple of keys) updated by ``nestupdate``
+Change = collections.namedtuple("Change", ["path", "old", "new"])
+
+CACHE_INDEX = "index.json"
+
+MATRIX_KEY = "matrix"
+
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("yml_files", nargs="*")
     parser.add_argument("-o", "--out_file")
+    parser.add_argument(
+        "-e",
+        "--expand",
+        action="store_true",
+        help="Write a config for each point of the matrix section "
+        "to {out_file stem}-{suffix}.yml.",
+    )
+    parser.add_argument(
+        "-b",
+        "--batch",
+        help="Manifest yaml file of {out_file: [yml_file, ...]} to merge "
+        "all of them at once.",
+    )
+    parser.add_argument(
+        "--cache_dir",
+        help="Cache directory of the batch mode. "
+        "Its default is .mgconf_cache next to the manifest.",
+    )
+    parser.add_argument(
+        "--no_cache",
+        action="store_true",
+        help="Merge all the targets of the batch mode.",
+    )
     args = parser.parse_args()
 
-    merge_configs_from_file(**vars(args))
+    if args.batch is None:
+        merge_configs_from_file(
+            args.yml_files, args.out_file, expand=args.expand
+        )
+        return
+
+    cache_dir = args.cache_dir or Path(args.batch).parent / ".mgconf_cache"
+    written = merge_configs_batch(
+        args.batch, cache_dir=None if args.no_cache else cache_dir
+    )
+    n_written = sum(written.values())
+    print(
+        f"{n_written} targets were written "
+        f"and {len(written) - n_written} targets were unchanged."
+    )
 
 
-def merge_configs_from_file(yml_files, out_file=None, verbose=True):
+def merge_configs_from_file(
+    yml_files, out_file=None, verbose=True, expand=False
+):
     configs = [
-        yaml.load(Path(yml_file).open(), Loader=yaml.SafeLoader)
+        yaml.load(Path(yml_file).open(), Loader=SafeLoader)
         for yml_file in yml_files
     ]
     config = merge_configs(configs, titles=yml_files, verbose=verbose)
@@ -49,11 +104,81 @@ def merge_configs_from_file(yml_files, out_file=None, verbose=True):
     if out_file is not None:
         out_file = Path(out_file)
         out_file.parent.mkdir(parents=True, exist_ok=True)
-        yaml.dump(config, out_file.open("w"), default_flow_style=False)
+        if not expand:
+            yaml.dump(config, out_file.open("w"), default_flow_style=False)
+            return config
+
+        n_points = 0
+        for suffix, point_config in expand_matrix(config):
+            if suffix:
+                point_file = out_file.with_name(
+                    f"{out_file.stem}-{suffix}{out_file.suffix}"
+                )
+            else:
+                point_file = out_file
+            with point_file.open("w") as f:
+                yaml.dump(point_config, f, default_flow_style=False)
+            n_points += 1
+        print(f"{n_points} configs were written.")
 
     return config
 
 
+def expand_matrix(config, key=MATRIX_KEY):
+    """Yield ``(suffix, config)`` for each point of the product of the
+    ``key`` section of ``config``.
+
+    The section has the same structure as the config, and its leaves are
+    lists of values, e.g. ``{"estimator": {"hyperparameters": {"lr": [0.1,
+    0.01]}}}``. A value which is a list itself is put in a list. Each config
+    is ``config`` without the section updated by the values of a point, and
+    ``suffix`` is a hash of the values, which is the same across runs and
+    the order of the keys.
+
+    The configs are made one by one, so that a large matrix never sits in
+    memory. If there is no section, ``("", config)`` is yielded.
+    """
+    if key not in config:
+        yield "", config
+        return
+
+    base = {k: v for k, v in config.items() if k != key}
+    axes = list(_matrix_axes(config[key]))
+    for values in itertools.product(*(values for _, values in axes)):
+        point = dict()
+        for (path, _), value in zip(axes, values):
+            nestupdate(point, _nest(path, deepcopy(value)))
+        yield matrix_suffix(point), nestupdate(deepcopy(base), point)
+
+
+def matrix_suffix(point):
+    """Return the hash of ``point``, the values of a point of a matrix."""
+    dumped = json.dumps(point, sort_keys=True, default=str)
+    return hashlib.sha1(dumped.encode()).hexdigest()[:8]
+
+
+def _matrix_axes(matrix, path=()):
+    for k, v in six.iteritems(matrix):
+        if isinstance(v, collectionsAbc.Mapping):
+            yield from _matrix_axes(v, path + (k,))
+            continue
+        if not isinstance(v, list):
+            v = [v]
+        if len(v) == 0:
+            raise ValueError(
+                "{} in the matrix has no values.".format(
+                    ".".join(str(k) for k in path + (k,))
+                )
+            )
+        yield path + (k,), v
+
+
+def _nest(path, value):
+    for k in reversed(path):
+        value = {k: value}
+    return value
+
+
 def merge_configs(configs, verbose=True, titles=None):
     print()
 
@@ -62,21 +187,20 @@ def merge_configs(configs, verbose=True, titles=None):
 
     title = titles[0]
     config = configs[0]
-    first_title = deepcopy(title)
-    first_config = deepcopy(config)
+    first_title = title
+    if verbose:
+        # the only copy, which is for the final diff
+        first_config = deepcopy(config)
 
     for title, _config in zip(titles[1:], configs[1:]):
 
-        config_prev = deepcopy(config)
-        config = nestupdate(config, _config)
+        changes = [] if verbose else None
+        config = nestupdate(config, _config, changes)
 
         if verbose:
             print(
-                take_diff(
-                    config_prev,
-                    config,
-                    from_title="previous config",
-                    to_title=title,
+                render_changes(
+                    changes, from_title="previous config", to_title=title
                 )
             )
             print(SEPARATION)
@@ -94,20 +218,195 @@ def merge_configs(configs, verbose=True, titles=None):
     return config
 
 
-def nestupdate(d, u):
+def merge_configs_batch(manifest, cache_dir=None, verbose=False):
+    """Merge the yaml files of many targets in a process.
+
+    ``manifest`` is a yaml file of ``{out_file: [yml_file, ...]}`` whose
+    paths are relative to it, and a target can be one of the yml files of
+    other targets. See ``MergeBatch`` for the caches.
+
+    Return ``{out_file: whether it was written}``.
+    """
+    manifest = Path(manifest)
+    root = manifest.parent
+    with manifest.open("rb") as f:
+        targets = {
+            root / out_file: [root / yml_file for yml_file in yml_files]
+            for out_file, yml_files in yaml.load(f, Loader=SafeLoader).items()
+        }
+    return MergeBatch(targets, cache_dir=cache_dir, verbose=verbose).run()
+
+
+class _TrieNode:
+    def __init__(self, config=None):
+        self.config = config
+        # content hash of the next yml file -> _TrieNode
+        self.children = dict()
+
+
+class MergeBatch:
+    """Merge ``targets``, ``{out_file: [yml_file, ...]}``.
+
+    Each yml file is parsed once, and the merged configs are memoized in a
+    trie keyed by the content hashes of the yml files, so that the common
+    prefix of the stacks, e.g. ``private/global.yml`` and
+    ``train/global.yml``, is merged once. With ``cache_dir``, the content
+    hashes and the targets written are kept in ``{cache_dir}/index.json``,
+    and a target whose yml files are unchanged is skipped without reading
+    them.
+    """
+
+    def __init__(self, targets, cache_dir=None, verbose=False):
+        self.targets = targets
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+        self.verbose = verbose
+
+        self.n_parsed = 0
+        self.n_merged = 0
+
+        self._index = {"files": {}, "targets": {}}
+        if self.cache_dir is not None:
+            try:
+                with (self.cache_dir / CACHE_INDEX).open() as f:
+                    self._index = json.load(f)
+            except (FileNotFoundError, ValueError):
+                pass
+        self._trie = _TrieNode()
+        # content hash -> parsed config
+        self._parsed = dict()
+        # out_file -> whether it was written
+        self._done = dict()
+
+    def run(self):
+        for out_file in self.targets:
+            self._compile(out_file)
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            with (self.cache_dir / CACHE_INDEX).open("w") as f:
+                json.dump(self._index, f)
+        if self.verbose:
+            print(
+                f"parsed {self.n_parsed} files "
+                f"and merged {self.n_merged} times."
+            )
+        return dict(self._done)
+
+    def _compile(self, out_file, stack=()):
+        if out_file in self._done:
+            return
+        if out_file in stack:
+            raise ValueError(f"{out_file} depends on itself.")
+        yml_files = self.targets[out_file]
+        if len(yml_files) == 0:
+            raise ValueError(f"{out_file} has no yml files.")
+        for yml_file in yml_files:
+            if yml_file in self.targets:
+                self._compile(yml_file, stack + (out_file,))
+
+        hashes = [self._hash(yml_file) for yml_file in yml_files]
+        key = hashlib.sha1("\n".join(hashes).encode()).hexdigest()
+        name = str(out_file.resolve())
+        if out_file.exists() and self._index["targets"].get(name) == [
+            key,
+            *_signature(out_file),
+        ]:
+            self._done[out_file] = False
+            if self.verbose:
+                print(f"{out_file} is unchanged.")
+            return
+
+        config = self._merge(yml_files, hashes)
+        out_file.parent.mkdir(parents=True, exist_ok=True)
+        with out_file.open("w") as f:
+            yaml.dump(config, f, default_flow_style=False)
+        self._index["targets"][name] = [key, *_signature(out_file)]
+        self._done[out_file] = True
+        if self.verbose:
+            print(f"{out_file} was written.")
+
+    def _hash(self, yml_file):
+        name = str(yml_file.resolve())
+        signature = _signature(yml_file)
+        entry = self._index["files"].get(name)
+        if entry is not None and entry[:2] == signature:
+            return entry[2]
+        chsum = hashlib.sha1(yml_file.read_bytes()).hexdigest()
+        self._index["files"][name] = [*signature, chsum]
+        return chsum
+
+    def _parse(self, yml_file, chsum):
+        if chsum not in self._parsed:
+            with yml_file.open("rb") as f:
+                self._parsed[chsum] = yaml.load(f, Loader=SafeLoader)
+            self.n_parsed += 1
+        return self._parsed[chsum]
+
+    def _merge(self, yml_files, hashes):
+        node = self._trie
+        for yml_file, chsum in zip(yml_files, hashes):
+            child = node.children.get(chsum)
+            if child is None:
+                # nestupdate modifies the config and shares the values of
+                # the update, both of which are cached
+                config = deepcopy(self._parse(yml_file, chsum))
+                if node is not self._trie:
+                    config = nestupdate(deepcopy(node.config), config)
+                    self.n_merged += 1
+                child = node.children[chsum] = _TrieNode(config)
+            node = child
+        return node.config
+
+
+def _signature(path):
+    stat = path.stat()
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def nestupdate(d, u, changes=None, path=()):
+    """Update ``d`` with ``u`` recursively.
+
+    If ``changes`` is a list, a ``Change`` is appended to it for each value
+    updated, so that the diff is taken without copying or dumping ``d``.
+    """
     for k, v in six.iteritems(u):
+        old = d.get(k, MISSING)
         dv = d.get(k, {})
         if not isinstance(dv, collectionsAbc.Mapping):
             d[k] = v
         elif isinstance(v, collectionsAbc.Mapping):
-            d[k] = nestupdate(dv, v)
+            d[k] = nestupdate(dv, v, changes, path + (k,))
+            continue
         elif type(v) == list:
             d[k] = list(dv) + v
         else:
             d[k] = v
+
+        if changes is not None and (old is MISSING or old != d[k]):
+            changes.append(Change(path + (k,), old, d[k]))
     return d
 
 
+def render_changes(changes, from_title="", to_title=""):
+    """Render ``changes`` of ``nestupdate`` as a colored diff of the key
+    paths, e.g. ``-a.b: 1`` and ``+a.b: 2``."""
+    lines = [f"--- {from_title}", f"+++ {to_title}"]
+    for change in changes:
+        key = ".".join(str(k) for k in change.path)
+        if change.old is not MISSING:
+            lines.append(f"-{key}: {format_value(change.old)}")
+        lines.append(f"+{key}: {format_value(change.new)}")
+    return "\n".join(color_diff(lines))
+
+
+def format_value(value):
+    """Dump ``value`` in a line of YAML flow style."""
+    ymlstr = dumps(value, default_flow_style=True, width=float("inf"))
+    if ymlstr.endswith("\n...\n"):
+        # the end of a document of a scalar
+        ymlstr = ymlstr[: -len("\n...\n")]
+    return ymlstr.strip()
+
+
 def take_diff(from_dict, to_dict, from_title="", to_title=""):
     from_ymlstr = dumps(from_dict, default_flow_style=False).splitlines()
     to_ymlstr = dumps(to_dict, default_flow_style=False).splitlines()
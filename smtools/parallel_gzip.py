@@ -0,0 +1,222 @@
+"""Multi-member gzip streams that can be (de)compressed on several cores.
+
+The writer cuts the data into blocks and deflates each block into an
+independent gzip member on a thread pool. Every member carries its own
+compressed size in an ``SM`` extra subfield of the gzip header, so the
+reader can split the stream into members without inflating it and inflate
+them on a thread pool, too. The output is still an ordinary gzip file, so
+``tarfile``, ``gzip`` and ``tar -xzf`` can read it as well.
+"""
+import argparse
+import io
+import os
+import struct
+import tarfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+BLOCK_SIZE = 4 * 1024 * 1024
+
+# ID1 ID2 CM FLG MTIME XFL OS XLEN | SI1 SI2 SLEN BSIZE
+_HEADER = struct.Struct("<BBBBIBBHBBHI")
+HEADER_SIZE = _HEADER.size
+_TRAILER = struct.Struct("<II")
+_FEXTRA = 4
+
+
+def _deflate(data, level):
+    c = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    payload = c.compress(data) + c.flush()
+    size = HEADER_SIZE + len(payload) + _TRAILER.size
+    header = _HEADER.pack(
+        0x1F, 0x8B, 8, _FEXTRA, 0, 0, 255, 8, ord("S"), ord("M"), 4, size
+    )
+    trailer = _TRAILER.pack(zlib.crc32(data), len(data) & 0xFFFFFFFF)
+    return header + payload + trailer
+
+
+def inflate_member(member):
+    data = zlib.decompress(
+        member[HEADER_SIZE : -_TRAILER.size], -zlib.MAX_WBITS
+    )
+    crc, isize = _TRAILER.unpack(member[-_TRAILER.size :])
+    if crc != zlib.crc32(data) or isize != len(data) & 0xFFFFFFFF:
+        raise OSError("CRC check failed in a parallel gzip member")
+    return data
+
+
+def member_size(header):
+    """Return the member size stored in ``header``, or None."""
+    if len(header) < HEADER_SIZE:
+        return None
+    id1, id2, cm, flg, _, _, _, xlen, si1, si2, slen, size = _HEADER.unpack(
+        header[:HEADER_SIZE]
+    )
+    if (
+        (id1, id2, cm) != (0x1F, 0x8B, 8)
+        or flg != _FEXTRA
+        or xlen != 8
+        or (si1, si2, slen) != (ord("S"), ord("M"), 4)
+    ):
+        return None
+    return size
+
+
+def is_parallel_gzip(file):
+    """Whether ``file`` (a path or a seekable file object) was written by
+    ``ParallelGzipWriter``."""
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "rb") as f:
+            return member_size(f.read(HEADER_SIZE)) is not None
+    pos = file.tell()
+    try:
+        return member_size(file.read(HEADER_SIZE)) is not None
+    finally:
+        file.seek(pos)
+
+
+def _read_exact(f, n):
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = f.read(n - len(buf))
+        if not chunk:
+            break
+        buf += chunk
+    return bytes(buf)
+
+
+class ParallelGzipReader(io.RawIOBase):
+    """Readable stream that inflates the members of ``fileobj`` in parallel.
+
+    ``fileobj`` only needs ``read()``, so it can be a pipe or a
+    ``FragmentReader``. Up to ``max_pending`` members are inflated ahead of
+    the consumer, which overlaps inflation with whatever the consumer does
+    with the data (e.g. writing the extracted files).
+    """
+
+    def __init__(self, fileobj, workers=None, max_pending=None):
+        self._f = fileobj
+        workers = workers or os.cpu_count() or 1
+        self._pool = ThreadPoolExecutor(workers)
+        self._max_pending = max_pending or 2 * workers
+        self._pending = deque()
+        self._buf = memoryview(b"")
+        self._eof = False
+
+    def readable(self):
+        return True
+
+    def _read_member(self):
+        header = _read_exact(self._f, HEADER_SIZE)
+        if not header:
+            return None
+        size = member_size(header)
+        if size is None:
+            raise OSError("Not a parallel gzip member")
+        body = _read_exact(self._f, size - HEADER_SIZE)
+        if len(body) != size - HEADER_SIZE:
+            raise EOFError("Truncated parallel gzip member")
+        return header + body
+
+    def _fill(self):
+        while not self._eof and len(self._pending) < self._max_pending:
+            member = self._read_member()
+            if member is None:
+                self._eof = True
+                break
+            self._pending.append(self._pool.submit(inflate_member, member))
+
+    def readinto(self, b):
+        while not self._buf:
+            self._fill()
+            if not self._pending:
+                return 0
+            self._buf = memoryview(self._pending.popleft().result())
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            for future in self._pending:
+                future.cancel()
+            self._pending.clear()
+            self._pool.shutdown()
+        super().close()
+
+
+class ParallelGzipWriter(io.RawIOBase):
+    """Writable stream that deflates ``block_size`` blocks in parallel.
+
+    The members are written to ``fileobj`` in order; at most
+    ``max_pending`` blocks are kept in memory. Closing the writer does not
+    close ``fileobj``.
+    """
+
+    def __init__(
+        self,
+        fileobj,
+        level=6,
+        workers=None,
+        block_size=BLOCK_SIZE,
+        max_pending=None,
+    ):
+        self._f = fileobj
+        self._level = level
+        self._block_size = block_size
+        workers = workers or os.cpu_count() or 1
+        self._pool = ThreadPoolExecutor(workers)
+        self._max_pending = max_pending or 2 * workers
+        self._pending = deque()
+        self._buf = bytearray()
+        self._n_members = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._buf += b
+        while len(self._buf) >= self._block_size:
+            self._submit(bytes(self._buf[: self._block_size]))
+            del self._buf[: self._block_size]
+        return len(b)
+
+    def _submit(self, data):
+        self._pending.append(self._pool.submit(_deflate, data, self._level))
+        self._n_members += 1
+        while len(self._pending) > self._max_pending:
+            self._f.write(self._pending.popleft().result())
+
+    def close(self):
+        if not self.closed:
+            if self._buf or self._n_members == 0:
+                self._submit(bytes(self._buf))
+                self._buf.clear()
+            while self._pending:
+                self._f.write(self._pending.popleft().result())
+            self._pool.shutdown()
+        super().close()
+
+
+def pack_directory(
+    src_dir, out_file, level=6, workers=None, block_size=BLOCK_SIZE
+):
+    """Pack ``src_dir`` into a parallel gzip ``out_file`` like
+    ``tar -czf out_file src_dir``."""
+    with open(out_file, "wb") as f_out, ParallelGzipWriter(
+        f_out, level=level, workers=workers, block_size=block_size
+    ) as f_gz, tarfile.open(fileobj=f_gz, mode="w|") as t:
+        arcname = os.path.basename(os.path.normpath(src_dir))
+        t.add(str(src_dir), arcname=arcname)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("src_dir")
+    parser.add_argument("out_file")
+    parser.add_argument("-l", "--level", type=int, default=6)
+    parser.add_argument("-w", "--workers", type=int, default=None)
+    args = parser.parse_args()
+    pack_directory(**vars(args))
@@ -0,0 +1,218 @@
+"""Restore a snapshot uploaded by ``snapshot_transfer``.
+
+The snapshot is downloaded by concurrent ranged GETs and extracted while
+the download is still running.
+"""
+import argparse
+import io
+import re
+import tarfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import boto3
+
+from smtools.compression import open_reader
+from smtools import dedup
+
+SNAPSHOT_PATTERN = re.compile(
+    r"/iter_(?P<iteration>\d+)/"
+    r"(?:part-(?P<index>\d+)-of-(?P<count>\d+)/)?"
+    r"(?:model\.tar(\.\w+)?|manifest\.json)$"
+)
+# written after each part of a sharded snapshot is uploaded
+MARKER_PATTERN = re.compile(
+    r"/iter_(?P<iteration>\d+)/part-(?P<index>\d+)-of-(?P<count>\d+)\.json$"
+)
+
+
+def find_snapshot(bucket_name, job_name, iteration=None, client=None):
+    """Return ``(iteration, keys)`` of the latest snapshot of ``job_name``,
+    or of the one at ``iteration``, with a single paginated listing.
+
+    ``keys`` are the objects of the snapshot: a single one, or one per part
+    for a snapshot sharded across hosts. A sharded snapshot is found only
+    if all of its parts are marked as uploaded.
+    """
+    client = client or boto3.client("s3")
+    prefix = f"{job_name}/snapshot/"
+    singles, parts, markers = dict(), dict(), dict()
+    paginator = client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            key = obj["Key"]
+            m = SNAPSHOT_PATTERN.search(key)
+            if m is not None:
+                it = int(m.group("iteration"))
+                if m.group("index") is None:
+                    singles[it] = key
+                else:
+                    part = (int(m.group("index")), int(m.group("count")))
+                    parts.setdefault(it, dict())[part] = key
+                continue
+            m = MARKER_PATTERN.search(key)
+            if m is not None:
+                part = (int(m.group("index")), int(m.group("count")))
+                markers.setdefault(int(m.group("iteration")), set()).add(part)
+
+    snapshots = {it: [key] for it, key in singles.items()}
+    for it, keys in parts.items():
+        counts = {count for _, count in keys}
+        if len(counts) != 1:
+            continue
+        count = counts.pop()
+        complete = {(index, count) for index in range(count)}
+        if complete <= set(keys) and complete <= markers.get(it, set()):
+            snapshots[it] = [keys[part] for part in sorted(complete)]
+
+    if len(snapshots) == 0:
+        raise FileNotFoundError(f"No snapshot in s3://{bucket_name}/{prefix}")
+    if iteration is None:
+        iteration = max(snapshots)
+    elif iteration not in snapshots:
+        raise FileNotFoundError(
+            f"No snapshot at iteration {iteration} in "
+            f"s3://{bucket_name}/{prefix}"
+        )
+    return iteration, snapshots[iteration]
+
+
+class RangedReader(io.RawIOBase):
+    """Readable stream of an S3 object downloaded by ranged GETs.
+
+    ``workers`` ranges of ``part_size`` bytes are downloaded ahead of the
+    consumer in parallel, so at most ``workers + 1`` parts are held in
+    memory.
+    """
+
+    def __init__(
+        self, client, bucket_name, key, part_size=8 * 1024 * 1024, workers=8
+    ):
+        self.client = client
+        self.bucket_name = bucket_name
+        self.key = key
+        self.part_size = part_size
+        self.size = client.head_object(Bucket=bucket_name, Key=key)[
+            "ContentLength"
+        ]
+        self._pool = ThreadPoolExecutor(workers)
+        self._workers = workers
+        self._next = 0
+        self._pending = deque()
+        self._buf = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def _get(self, start, end):
+        res = self.client.get_object(
+            Bucket=self.bucket_name, Key=self.key, Range=f"bytes={start}-{end}"
+        )
+        return res["Body"].read()
+
+    def _fill(self):
+        while self._next < self.size and len(self._pending) < self._workers:
+            end = min(self._next + self.part_size, self.size) - 1
+            self._pending.append(self._pool.submit(self._get, self._next, end))
+            self._next = end + 1
+
+    def readinto(self, b):
+        if not self._buf:
+            self._fill()
+            if not self._pending:
+                return 0
+            self._buf = memoryview(self._pending.popleft().result())
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            for future in self._pending:
+                future.cancel()
+            self._pending.clear()
+            self._pool.shutdown()
+        super().close()
+
+
+def restore_snapshot(
+    bucket_name,
+    job_name,
+    out_dir,
+    iteration=None,
+    client=None,
+    part_size=8 * 1024 * 1024,
+    workers=8,
+):
+    """Download and extract a snapshot of ``job_name`` to ``out_dir``.
+
+    Returns the paths of the restored files, which can be passed to
+    ``chainer.serializers.load_npz`` or ``torch.load``.
+    """
+    client = client or boto3.client("s3")
+    iteration, keys = find_snapshot(
+        bucket_name, job_name, iteration=iteration, client=client
+    )
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    paths = []
+    # the parts of a sharded snapshot are stitched in out_dir
+    for key in keys:
+        print(f"Restoring s3://{bucket_name}/{key}")
+        if key.endswith("manifest.json"):
+            # uploaded by snapshot_transfer(incremental=True)
+            paths += dedup.restore(
+                bucket_name,
+                key,
+                out_dir,
+                chunk_prefix=f"{job_name}/snapshot/chunks",
+                client=client,
+                workers=workers,
+            )
+        else:
+            paths += _restore_tar(
+                client, bucket_name, key, out_dir, part_size, workers
+            )
+    return paths
+
+
+def _restore_tar(client, bucket_name, key, out_dir, part_size, workers):
+    paths = []
+    with RangedReader(
+        client, bucket_name, key, part_size=part_size, workers=workers
+    ) as f, open_reader(f) as f_in, tarfile.open(
+        fileobj=f_in, mode="r|"
+    ) as tf:
+        for member in tf:
+            tf.extract(member, str(out_dir))
+            if member.isfile():
+                paths.append(out_dir / member.name)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("bucket_name")
+    parser.add_argument("job_name")
+    parser.add_argument("--out_dir", "-o", default=".")
+    parser.add_argument(
+        "--iteration",
+        "-i",
+        type=int,
+        default=None,
+        help="Iteration of the snapshot. Its default is the latest one.",
+    )
+    parser.add_argument("--workers", "-w", type=int, default=8)
+    args = parser.parse_args()
+
+    paths = restore_snapshot(**vars(args))
+    for path in paths:
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
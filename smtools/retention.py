@@ -0,0 +1,192 @@
+"""Retention policy of snapshots on S3 and on the local disk.
+
+A snapshot is identified by its iteration: the number of an ``iter_*``
+directory on S3 (e.g. ``{job}/snapshot/iter_000001000/model.tar.gz``) or
+the last number in a local file name (e.g. ``snapshot_iter_1000`` or
+``model_1000.pth``). Every file of a pruned snapshot is deleted.
+"""
+import re
+from functools import partial
+from pathlib import Path
+
+import boto3
+
+from smtools.background import BackgroundWorker, QueuePolicy
+
+# the max # keys of a single DeleteObjects request
+MAX_DELETE_KEYS = 1000
+
+S3_ITERATION_PATTERN = re.compile(r"(?:^|/)iter_(\d+)/")
+LOCAL_ITERATION_PATTERN = re.compile(r"(\d+)\D*$")
+
+
+class Retention:
+    """Decide which snapshots to keep and delete the others.
+
+    A snapshot is kept if any of the rules keeps it:
+
+    - ``keep_last``: the last N snapshots.
+    - ``keep_best``: the best K snapshots by ``metric``, whose values are
+      given by ``record``. ``mode`` is ``"min"`` or ``"max"``.
+    - ``keep_every``: the snapshots whose iteration is a multiple of M.
+
+    The latest snapshot is always kept to resume from it. Without any rule
+    nothing is deleted.
+
+    ``submit`` prunes on a background thread; call ``close`` at the end of
+    training to wait for the pending pruning.
+    """
+
+    def __init__(
+        self,
+        keep_last=None,
+        keep_best=None,
+        metric=None,
+        mode="min",
+        keep_every=None,
+    ):
+        if keep_best is not None and metric is None:
+            raise ValueError("keep_best needs a metric.")
+        if mode not in ("min", "max"):
+            raise ValueError(f"Unknown mode: {mode}")
+        self.keep_last = keep_last
+        self.keep_best = keep_best
+        self.metric = metric
+        self.mode = mode
+        self.keep_every = keep_every
+
+        self.scores = dict()
+        self._worker = None
+
+    def record(self, iteration, score):
+        """Record the value of ``metric`` at ``iteration``."""
+        self.scores[iteration] = float(score)
+
+    def select(self, iterations, scores=None):
+        """Return the iterations to keep out of ``iterations``."""
+        iterations = sorted(set(iterations))
+        if scores is None:
+            scores = self.scores
+        if not iterations:
+            return set()
+        if (
+            self.keep_last is None
+            and self.keep_best is None
+            and self.keep_every is None
+        ):
+            return set(iterations)
+
+        keep = {iterations[-1]}
+        if self.keep_last is not None and self.keep_last > 0:
+            keep.update(iterations[-self.keep_last :])
+        if self.keep_best is not None:
+            scored = [i for i in iterations if i in scores]
+            scored.sort(key=lambda i: scores[i], reverse=self.mode == "max")
+            keep.update(scored[: self.keep_best])
+        if self.keep_every is not None:
+            keep.update(i for i in iterations if i % self.keep_every == 0)
+        return keep
+
+    def prune_s3(self, bucket_name, prefix, client=None, scores=None):
+        """Delete the snapshots ``{prefix}/.../iter_*/`` which are not kept.
+
+        Objects outside ``iter_*`` directories, e.g. the chunks shared by
+        incremental snapshots, are never deleted. Returns the deleted keys.
+        """
+        client = client or boto3.client("s3")
+        prefix = prefix.rstrip("/") + "/"
+        snapshots = dict()
+        paginator = client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                m = S3_ITERATION_PATTERN.search(obj["Key"][len(prefix) :])
+                if m is not None:
+                    snapshots.setdefault(int(m.group(1)), []).append(
+                        obj["Key"]
+                    )
+
+        keep = self.select(snapshots, scores)
+        keys = [
+            key
+            for iteration, keys in sorted(snapshots.items())
+            if iteration not in keep
+            for key in keys
+        ]
+        delete_keys(client, bucket_name, keys)
+        return keys
+
+    def prune_local(self, paths, scores=None):
+        """Delete the files in ``paths`` of the snapshots which are not
+        kept. Directories and files without a number in their names are
+        ignored. Returns the deleted paths."""
+        snapshots = dict()
+        for path in map(Path, paths):
+            m = LOCAL_ITERATION_PATTERN.search(path.name)
+            if m is not None and not path.is_dir():
+                snapshots.setdefault(int(m.group(1)), []).append(path)
+
+        keep = self.select(snapshots, scores)
+        deleted = []
+        for iteration, files in sorted(snapshots.items()):
+            if iteration in keep:
+                continue
+            for path in files:
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    continue
+                deleted.append(path)
+        return deleted
+
+    def prune(
+        self, paths=(), bucket_name=None, prefix=None, client=None, scores=None
+    ):
+        """Prune the local ``paths`` and, if ``bucket_name`` is given, the
+        snapshots under ``s3://{bucket_name}/{prefix}/``."""
+        self.prune_local(paths, scores)
+        if bucket_name is not None:
+            self.prune_s3(bucket_name, prefix, client, scores)
+
+    def submit(self, paths=(), bucket_name=None, prefix=None, client=None):
+        """Run ``prune`` on the background thread with the current
+        scores."""
+        if self._worker is None:
+            self._worker = BackgroundWorker(
+                max_pending=4, policy=QueuePolicy.BLOCK, name="retention"
+            )
+        self._worker.submit(
+            partial(
+                self.prune,
+                list(paths),
+                bucket_name=bucket_name,
+                prefix=prefix,
+                client=client,
+                scores=dict(self.scores),
+            )
+        )
+
+    def close(self):
+        """Wait for the pending pruning and stop the background thread."""
+        if self._worker is not None:
+            self._worker.close()
+            self._worker = None
+
+
+def delete_keys(client, bucket_name, keys):
+    """Delete ``keys`` by DeleteObjects requests of up to 1000 keys."""
+    for i in range(0, len(keys), MAX_DELETE_KEYS):
+        res = client.delete_objects(
+            Bucket=bucket_name,
+            Delete={
+                "Objects": [
+                    {"Key": key} for key in keys[i : i + MAX_DELETE_KEYS]
+                ],
+                "Quiet": True,
+            },
+        )
+        for error in res.get("Errors", []):
+            print(
+                "Failed to delete s3://{}/{}: {}".format(
+                    bucket_name, error["Key"], error["Message"]
+                )
+            )
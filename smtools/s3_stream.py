@@ -0,0 +1,133 @@
+import io
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# S3 requires every part but the last to be at least 5 MiB.
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class S3MultipartWriter(io.RawIOBase):
+    """Writable stream that uploads what is written to ``s3://bucket/key``.
+
+    The data is cut into ``part_size`` parts, which are uploaded by a
+    multipart upload on ``max_pending`` threads while the writer keeps
+    producing, so at most ``max_pending + 1`` parts are held in memory.
+    Data smaller than a part is uploaded by a single ``put_object``.
+
+    Used as a context manager, the upload is completed on a normal exit and
+    aborted if an exception is raised, so no partial object is left.
+    """
+
+    def __init__(
+        self,
+        client,
+        bucket,
+        key,
+        part_size=8 * 1024 * 1024,
+        max_pending=2,
+        extra_args=None,
+    ):
+        if part_size < MIN_PART_SIZE:
+            raise ValueError(f"part_size must be >= {MIN_PART_SIZE}")
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.max_pending = max_pending
+        self.extra_args = extra_args or {}
+
+        self._buf = bytearray()
+        self._upload_id = None
+        self._pool = None
+        self._pending = deque()
+        self._parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._buf += b
+        while len(self._buf) >= self.part_size:
+            self._submit(bytes(self._buf[: self.part_size]))
+            del self._buf[: self.part_size]
+        return len(b)
+
+    def _submit(self, data):
+        if self._upload_id is None:
+            res = self.client.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key, **self.extra_args
+            )
+            self._upload_id = res["UploadId"]
+            self._pool = ThreadPoolExecutor(self.max_pending)
+
+        part_number = len(self._parts) + len(self._pending) + 1
+        future = self._pool.submit(
+            self.client.upload_part,
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self._upload_id,
+            PartNumber=part_number,
+            Body=data,
+        )
+        self._pending.append((part_number, future))
+        while len(self._pending) > self.max_pending:
+            self._collect()
+
+    def _collect(self):
+        part_number, future = self._pending.popleft()
+        etag = future.result()["ETag"]
+        self._parts.append({"PartNumber": part_number, "ETag": etag})
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._upload_id is None:
+                self.client.put_object(
+                    Bucket=self.bucket,
+                    Key=self.key,
+                    Body=bytes(self._buf),
+                    **self.extra_args,
+                )
+            else:
+                if self._buf:
+                    self._submit(bytes(self._buf))
+                while self._pending:
+                    self._collect()
+                self.client.complete_multipart_upload(
+                    Bucket=self.bucket,
+                    Key=self.key,
+                    UploadId=self._upload_id,
+                    MultipartUpload={"Parts": self._parts},
+                )
+        except Exception:
+            self.abort()
+            raise
+        finally:
+            self._shutdown()
+        super().close()
+
+    def abort(self):
+        """Abort the upload without creating the object."""
+        if self._upload_id is not None:
+            for _, future in self._pending:
+                future.cancel()
+            self._shutdown()
+            self.client.abort_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self._upload_id
+            )
+            self._upload_id = None
+        self._buf.clear()
+        self._pending.clear()
+        super().close()
+
+    def _shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
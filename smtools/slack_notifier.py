@@ -0,0 +1,163 @@
+"""Post messages to a Slack incoming webhook on a background thread.
+
+The messages are posted at most once every ``min_interval`` seconds, and
+the ones which pile up in the meantime are merged into a single message,
+so that short epochs don't flood the channel. Failed posts are retried
+with exponential backoff, following ``Retry-After`` on HTTP 429.
+"""
+import json
+import threading
+import time
+import traceback
+import urllib.error
+import urllib.request
+from collections import deque
+
+
+def merge_payloads(payloads):
+    """Merge webhook payloads into one.
+
+    The text and the channel are the ones of the latest payload. The
+    attachments are concatenated, except for the images (``image_url``),
+    of which only the latest ones are kept.
+    """
+    merged = dict(payloads[-1])
+    attachments = [
+        a
+        for p in payloads[:-1]
+        for a in p.get("attachments", [])
+        if "image_url" not in a
+    ]
+    merged["attachments"] = attachments + payloads[-1].get("attachments", [])
+    return merged
+
+
+class SlackNotifier:
+    """Queue webhook payloads and post them on a daemon thread.
+
+    ``notify`` takes a payload dict, or a function which returns one and is
+    called on the background thread, e.g. to upload figures. The function
+    takes ``with_images``, which is False unless it is the latest of the
+    payloads merged, whose images are the only ones kept. At most
+    ``max_pending`` payloads wait; the oldest ones are dropped beyond that.
+    """
+
+    def __init__(
+        self,
+        hook,
+        min_interval=1.0,
+        max_pending=100,
+        max_retries=5,
+        backoff=1.0,
+        max_backoff=60.0,
+        timeout=10.0,
+        merge=merge_payloads,
+    ):
+        self.hook = hook
+        self.min_interval = min_interval
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.merge = merge
+
+        self.n_posted = 0
+        self.n_merged = 0
+        self.n_failed = 0
+        self.n_dropped = 0
+
+        self._queue = deque()
+        self._closed = False
+        self._busy = False
+        self._last_post = 0.0
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="slack")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def notify(self, payload):
+        """Queue ``payload`` without blocking."""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("The notifier is already closed.")
+            if len(self._queue) >= self.max_pending:
+                self._queue.popleft()
+                self.n_dropped += 1
+            self._queue.append(payload)
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue or self._closed)
+                if not self._queue:
+                    return
+                # wait for the rate limit, unless draining on close
+                delay = self._last_post + self.min_interval - time.time()
+                if delay > 0 and not self._closed:
+                    self._cond.wait(delay)
+                    continue
+                payloads = list(self._queue)
+                self._queue.clear()
+                self._busy = True
+
+            try:
+                # only the images of the latest payload are kept
+                last = len(payloads) - 1
+                payloads = [
+                    p(with_images=i == last) if callable(p) else p
+                    for i, p in enumerate(payloads)
+                ]
+                self._post(self.merge(payloads))
+                self.n_posted += 1
+                self.n_merged += len(payloads) - 1
+            except Exception:
+                self.n_failed += 1
+                traceback.print_exc()
+
+            with self._cond:
+                self._last_post = time.time()
+                self._busy = False
+                self._cond.notify_all()
+
+    def _post(self, payload):
+        data = json.dumps(payload).encode()
+        for attempt in range(self.max_retries + 1):
+            request = urllib.request.Request(
+                self.hook,
+                data=data,
+                headers={"Content-Type": "application/json"},
+            )
+            try:
+                with urllib.request.urlopen(request, timeout=self.timeout):
+                    return
+            except urllib.error.HTTPError as e:
+                # client errors but rate limiting are not worth retrying
+                if e.code != 429 and e.code < 500:
+                    raise
+                retry_after = e.headers.get("Retry-After")
+                error = e
+            except (urllib.error.URLError, OSError) as e:
+                retry_after = None
+                error = e
+            if attempt == self.max_retries:
+                raise error
+            if retry_after is not None:
+                delay = float(retry_after)
+            else:
+                delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+            time.sleep(delay)
+
+    def wait(self):
+        """Block until every queued payload has been posted."""
+        with self._cond:
+            self._cond.wait_for(lambda: not self._queue and not self._busy)
+
+    def close(self):
+        """Post the pending payloads without waiting for the rate limit
+        and stop the thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
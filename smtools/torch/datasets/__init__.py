@@ -0,0 +1 @@
+from smtools.torch.datasets.tar_dataset import TarDataset
@@ -0,0 +1,37 @@
+from typing import Any, Callable, Iterable, Optional
+from pathlib import Path
+
+from torch.utils.data import Dataset
+
+from smtools.indexed_tarfile import IndexedTarFile
+
+
+class TarDataset(Dataset):
+    """Dataset of the members of a tar file, read without extracting it.
+
+    Each item is ``transform(name, data)``, or the raw bytes of the member
+    if ``transform`` is None. ``names`` selects and orders the members; its
+    default is all the regular files in the archive. DataLoader workers
+    share the page cache of the archive instead of opening many files.
+    """
+
+    def __init__(
+        self,
+        archive: Path,
+        names: Optional[Iterable[str]] = None,
+        transform: Optional[Callable[[str, bytes], Any]] = None,
+        index_file: Optional[str] = None,
+    ):
+        self._tar = IndexedTarFile(archive, index_file=index_file)
+        self._names = list(names) if names is not None else self._tar.names
+        self._transform = transform
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def __getitem__(self, i: int) -> Any:
+        name = self._names[i]
+        data = self._tar.read(name)
+        if self._transform is None:
+            return data
+        return self._transform(name, data)
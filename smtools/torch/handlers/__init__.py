@@ -3,3 +3,5 @@
 from smtools.torch.handlers.archive import archive
 from smtools.torch.handlers.s3_copy import s3_copy
 from smtools.torch.handlers.remove import remove
+from smtools.torch.handlers.prune import prune
+from smtools.torch.handlers.ship import Ship
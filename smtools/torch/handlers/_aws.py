@@ -0,0 +1,22 @@
+"""AWS helpers shared by the handlers."""
+import json
+import os
+from functools import lru_cache
+
+import boto3
+
+
+@lru_cache(maxsize=None)
+def s3_client():
+    # clients are thread-safe and costly to create
+    return boto3.client("s3")
+
+
+def job_name() -> str:
+    """Return the name of the training job, or the host name outside
+    SageMaker."""
+    try:
+        training_env = os.environ["SM_TRAINING_ENV"]
+        return json.loads(training_env)["job_name"]
+    except Exception:
+        return os.uname()[1]
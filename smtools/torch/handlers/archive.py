@@ -1,23 +1,43 @@
-from typing import List
+from typing import List, Optional
 from pathlib import Path
 import tarfile
 
 from ignite.engine import Engine
 
+from smtools.compression import Codec
+from smtools.torch.handlers.resolve import resolve_patterns
+
 
 def archive(
     trainer: Engine,
     patterns: List[str],
     out_file: Path,
     compress: bool = True,
+    codec: Optional[str] = None,
+    cache_listing: bool = False,
+    workers: Optional[int] = None,
 ):
-    paths: List[Path] = list()
-    for pattern in patterns:
-        paths += list(Path("/").glob(pattern.lstrip("/")))
+    """Archive the files matching `patterns` into `out_file`.
+
+    `codec` (e.g. "none", "gzip:6", "zstd:3:4", "lz4") overrides `compress`,
+    which means gzip or no compression. `cache_listing` caches the
+    directory listings across calls (see `resolve_patterns`).
+
+    With `workers`, gzip and zstd compress blocks of the tar stream on
+    `workers` threads unless the codec specifies its # threads. Gzip blocks
+    are written as independent gzip members, so the output is still read
+    by `tarfile` and `tar -xzf`.
+    """
+    paths = resolve_patterns(patterns, cache=cache_listing)
 
     out_name_wo_suffix = out_file.name.split(".")[0]
     # out_dir/model.tar.gz -> model
 
-    with tarfile.open(out_file, "w:gz" if compress else "w") as t:
+    codec = Codec.parse(codec or ("gzip" if compress else "none"))
+    if workers is not None and codec.threads is None:
+        codec = Codec(codec.name, codec.level, workers)
+    with open(out_file, "wb") as f, codec.open_writer(
+        f
+    ) as f_c, tarfile.open(fileobj=f_c, mode="w|") as t:
         for path in paths:
             t.add(str(path), arcname=f"{out_name_wo_suffix}/{path.name}")
@@ -0,0 +1,30 @@
+from typing import List, Optional
+
+from ignite.engine import Engine
+
+from smtools.retention import Retention
+from smtools.torch.handlers import _aws
+from smtools.torch.handlers.resolve import resolve_patterns
+
+
+def prune(
+    trainer: Engine,
+    retention: Retention,
+    patterns: List[str] = (),
+    bucket_name: Optional[str] = None,
+    key_prefix: str = "{job_name}",
+):
+    """Delete the snapshots which `retention` doesn't keep in the background.
+
+    The local files matching `patterns` and, if `bucket_name` is given, the
+    `iter_*` directories under `s3://{bucket_name}/{key_prefix}/` are
+    pruned. The value of `retention.metric` in `trainer.state.metrics` is
+    recorded as the score of the current iteration.
+    """
+    metrics = getattr(trainer.state, "metrics", None) or {}
+    if retention.metric in metrics:
+        retention.record(trainer.state.iteration, metrics[retention.metric])
+
+    paths = resolve_patterns(patterns)
+    key_prefix = key_prefix.format(job_name=_aws.job_name(), trainer=trainer)
+    retention.submit(paths, bucket_name=bucket_name, prefix=key_prefix)
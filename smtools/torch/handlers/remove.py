@@ -1,10 +1,10 @@
 from typing import List
-from pathlib import Path
 
 from ignite.engine import Engine
 
+from smtools.torch.handlers.resolve import resolve_patterns
 
-def remove(trainer: Engine, patterns: List[str]):
-    for pattern in patterns:
-        for path in Path("/").glob(pattern.lstrip("/")):
-            path.unlink()
+
+def remove(trainer: Engine, patterns: List[str], cache_listing: bool = False):
+    for path in resolve_patterns(patterns, cache=cache_listing):
+        path.unlink()
@@ -0,0 +1,110 @@
+import os
+import re
+from collections import OrderedDict
+from fnmatch import fnmatchcase
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+MAGIC = re.compile(r"[*?\[]")
+
+# dir -> (mtime_ns, [(name, is_dir, is_symlink)])
+_listings: Dict[str, Tuple[int, List[Tuple[str, bool, bool]]]] = dict()
+
+
+def resolve_patterns(patterns: List[str], cache: bool = False) -> List[Path]:
+    """Return the paths matching the glob `patterns`, which are relative to
+    "/" like `Path("/").glob(pattern.lstrip("/"))`.
+
+    Each pattern is anchored at its longest literal directory prefix, and
+    the patterns under the same directory share a single `os.scandir` of
+    each directory. With `cache=True`, the listings are reused across calls
+    until the mtime of their directory changes.
+
+    The paths are ordered by pattern, and sorted for each pattern.
+    """
+    # anchor -> [(pattern index, remaining parts)]
+    groups: Dict[str, List[Tuple[int, Tuple[str, ...]]]] = OrderedDict()
+    matches: List[set] = [set() for _ in patterns]
+    for i, pattern in enumerate(patterns):
+        parts = Path("/", pattern.lstrip("/")).parts[1:]
+        n_literal = 0
+        while n_literal < len(parts) and not MAGIC.search(parts[n_literal]):
+            n_literal += 1
+        if n_literal == len(parts):
+            # no wildcard at all
+            path = Path("/", *parts)
+            if path.exists():
+                matches[i].add(path)
+            continue
+        anchor = os.path.join("/", *parts[:n_literal])
+        groups.setdefault(anchor, []).append((i, parts[n_literal:]))
+
+    for anchor, rests in groups.items():
+        _match(anchor, rests, matches, cache)
+
+    paths: List[Path] = list()
+    seen = set()
+    for found in matches:
+        for path in sorted(found):
+            if path not in seen:
+                seen.add(path)
+                paths.append(path)
+    return paths
+
+
+def _match(anchor, rests, matches, cache):
+    # dirs to scan, each of which with the patterns to match in it
+    pending: Dict[str, set] = OrderedDict({anchor: set(rests)})
+    while pending:
+        dirname, rests = pending.popitem(last=False)
+        # "**" matches the directory itself too
+        while True:
+            zero = {
+                (i, rest[1:])
+                for i, rest in rests
+                if rest[0] == "**" and len(rest) > 1
+            }
+            if zero <= rests:
+                break
+            rests |= zero
+
+        entries = _list(dirname, cache)
+        for i, rest in rests:
+            head, tail = rest[0], rest[1:]
+            if head == "**":
+                if not tail:
+                    # "a/**" matches the directories under "a"
+                    matches[i].add(Path(dirname))
+                for name, is_dir, is_symlink in entries:
+                    if is_dir and not is_symlink:
+                        child = os.path.join(dirname, name)
+                        pending.setdefault(child, set()).add((i, rest))
+                continue
+            for name, is_dir, _ in entries:
+                if not fnmatchcase(name, head):
+                    continue
+                child = os.path.join(dirname, name)
+                if not tail:
+                    matches[i].add(Path(child))
+                elif is_dir:
+                    pending.setdefault(child, set()).add((i, tail))
+
+
+def _list(dirname, cache):
+    try:
+        mtime = os.stat(dirname).st_mtime_ns
+    except OSError:
+        return []
+    if cache and dirname in _listings and _listings[dirname][0] == mtime:
+        return _listings[dirname][1]
+    try:
+        with os.scandir(dirname) as it:
+            entries = [
+                (entry.name, entry.is_dir(), entry.is_symlink())
+                for entry in it
+            ]
+    except OSError:
+        return []
+    if cache:
+        _listings[dirname] = (mtime, entries)
+    return entries
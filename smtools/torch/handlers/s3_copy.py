@@ -1,30 +1,184 @@
-import os
-import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import List, Optional
 
-import boto3
+import botocore
+from boto3.s3.transfer import TransferConfig
 from ignite.engine import Engine
 
+from smtools.dedup import DedupUploader
+from smtools.distributed import (
+    DistributedMode,
+    part_name,
+    shard,
+    write_part_marker,
+)
+from smtools.torch.handlers import _aws
+from smtools.torch.handlers.resolve import resolve_patterns
+
 
 def s3_copy(
     trainer: Engine,
     pattern: str,
     bucket_name: str,
     key_prefix: str = "{job_name}",
+    dedup: bool = False,
+    chunk_prefix: str = "{job_name}/chunks",
+    workers: int = 8,
+    part_size: int = 8 * 1024 * 1024,
+    max_concurrency: int = 10,
+    skip_unchanged: bool = False,
+    cache_listing: bool = False,
+    distributed: str = DistributedMode.LEADER,
 ):
-    try:
-        training_env = os.environ["SM_TRAINING_ENV"]
-        job_name = json.loads(training_env)["job_name"]
-    except Exception:
-        job_name = os.uname()[1]
+    """Copy the files matching `pattern` to `s3://{bucket_name}/{key_prefix}/`.
+
+    The files are uploaded on `workers` threads, and each file larger than
+    `part_size` by a multipart upload of `max_concurrency` threads.
+
+    With `skip_unchanged=True`, a file is not uploaded again if its ETag
+    equals the one of the last upload, which is cached in memory, or of
+    the object on S3. The file isn't even hashed if its size and mtime are
+    unchanged since the last upload.
 
-    paths = list(Path("/").glob(pattern.lstrip("/")))
+    With `dedup=True`, the files are uploaded as content-defined chunks
+    under `chunk_prefix`, which are stored only once, and a manifest
+    `{key_prefix}/manifest.json` of them. Restore them with
+    `smtools.dedup.restore`.
+
+    `cache_listing` caches the directory listings across calls (see
+    `resolve_patterns`).
+
+    In multi-host or MPI training, `distributed` decides who uploads: only
+    the first host or rank ("leader"), every one of them to the same keys
+    ("all"), or every one of them its own files to
+    `{key_prefix}/part-{index:05}-of-{count:05}/` followed by a marker
+    `{key_prefix}/part-{index:05}-of-{count:05}.json` ("shard").
+    """
+    job_name = _aws.job_name()
+    index, count = shard()
+    if distributed == DistributedMode.LEADER and index != 0:
+        return
+
+    paths = resolve_patterns([pattern], cache=cache_listing)
 
-    s3 = boto3.resource("s3")
     key_prefix = key_prefix.format(job_name=job_name, trainer=trainer)
-    for path in paths:
-        s3.meta.client.upload_file(
-            Filename=str(path),
-            Bucket=bucket_name,
-            Key=f"{key_prefix}/{path.name}",
+    key_dir = key_prefix
+    sharded = distributed == DistributedMode.SHARD and count > 1
+    if sharded:
+        key_prefix = f"{key_dir}/{part_name(index, count)}"
+
+    if dedup:
+        chunk_prefix = chunk_prefix.format(job_name=job_name, trainer=trainer)
+        keys = [f"{key_prefix}/manifest.json"]
+        _dedup_uploader(bucket_name, chunk_prefix).upload(paths, keys[0])
+    else:
+        keys = _upload_files(
+            paths,
+            bucket_name,
+            key_prefix,
+            workers,
+            part_size,
+            max_concurrency,
+            skip_unchanged,
+        )
+
+    if sharded:
+        write_part_marker(
+            _aws.s3_client(), bucket_name, key_dir, index, count, keys
+        )
+
+
+def _upload_files(
+    paths: List[Path],
+    bucket_name: str,
+    key_prefix: str,
+    workers: int,
+    part_size: int,
+    max_concurrency: int,
+    skip_unchanged: bool,
+) -> List[str]:
+    config = TransferConfig(
+        multipart_threshold=part_size,
+        multipart_chunksize=part_size,
+        max_concurrency=max_concurrency,
+    )
+    with ThreadPoolExecutor(workers) as pool:
+        keys = [f"{key_prefix}/{path.name}" for path in paths]
+        futures = [
+            pool.submit(
+                _upload, path, bucket_name, key, config, skip_unchanged
+            )
+            for path, key in zip(paths, keys)
+        ]
+        for future in futures:
+            future.result()
+    return keys
+
+
+# (bucket_name, key) -> (size, mtime_ns, etag) of the last upload
+_uploaded = dict()
+
+
+def _upload(
+    path: Path,
+    bucket_name: str,
+    key: str,
+    config: TransferConfig,
+    skip_unchanged: bool,
+):
+    stat = path.stat()
+    signature = (stat.st_size, stat.st_mtime_ns)
+    etag = None
+    if skip_unchanged:
+        last = _uploaded.get((bucket_name, key))
+        if last is not None and last[:2] == signature:
+            return
+        etag = _etag(path, config.multipart_chunksize)
+        remote_etag = (
+            last[2] if last is not None else _remote_etag(bucket_name, key)
+        )
+        if etag == remote_etag:
+            _uploaded[(bucket_name, key)] = (*signature, etag)
+            return
+
+    _aws.s3_client().upload_file(
+        Filename=str(path), Bucket=bucket_name, Key=key, Config=config
+    )
+    if skip_unchanged:
+        _uploaded[(bucket_name, key)] = (*signature, etag)
+
+
+def _etag(path: Path, part_size: int) -> str:
+    """Compute the ETag S3 gives to `path` uploaded in `part_size` parts."""
+    digests = []
+    with path.open("rb") as f:
+        for part in iter(lambda: f.read(part_size), b""):
+            digests.append(hashlib.md5(part).digest())
+    if path.stat().st_size < part_size:
+        # uploaded by a single PutObject
+        return (digests[0] if digests else hashlib.md5().digest()).hex()
+    etag = hashlib.md5(b"".join(digests)).hexdigest()
+    return f"{etag}-{len(digests)}"
+
+
+def _remote_etag(bucket_name: str, key: str) -> Optional[str]:
+    try:
+        res = _aws.s3_client().head_object(Bucket=bucket_name, Key=key)
+    except botocore.exceptions.ClientError:
+        return None
+    return res["ETag"].strip('"')
+
+
+_dedup_uploaders = dict()
+
+
+def _dedup_uploader(bucket_name: str, chunk_prefix: str) -> DedupUploader:
+    # cached to keep the hashes of the uploaded chunks across calls
+    key = (bucket_name, chunk_prefix)
+    if key not in _dedup_uploaders:
+        _dedup_uploaders[key] = DedupUploader(
+            bucket_name, chunk_prefix, client=_aws.s3_client()
         )
+    return _dedup_uploaders[key]
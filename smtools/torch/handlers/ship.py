@@ -0,0 +1,161 @@
+import glob
+import os
+import shutil
+import tempfile
+from functools import partial
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from ignite.engine import Engine
+
+from smtools.background import BackgroundWorker, QueuePolicy
+from smtools.torch.handlers import _aws
+from smtools.torch.handlers.archive import archive
+from smtools.torch.handlers.resolve import resolve_patterns
+
+
+class Ship:
+    """Archive, upload and remove checkpoints in a background pipeline.
+
+    It replaces the `archive`, `s3_copy` and `remove` handlers run one after
+    another. On each call, the files matching `patterns` are hard-linked
+    into a staging directory, which takes no time, and a background thread
+    archives them into `archive_name`, uploads it to
+    `s3://{bucket_name}/{key_prefix}/{archive_name}` and, with
+    `remove=True`, deletes the original files once the upload is
+    confirmed.
+
+    At most `max_pending` checkpoints wait for shipping; `policy` decides
+    what happens to a new checkpoint when the queue is full (see
+    `smtools.background.QueuePolicy`). A dropped checkpoint is neither
+    uploaded nor removed.
+
+    `cache_listing` caches the directory listings across calls (see
+    `resolve_patterns`).
+
+    Register `close` (or `wait`) on `Events.COMPLETED` to ship the pending
+    checkpoints before exiting.
+    """
+
+    def __init__(
+        self,
+        patterns: List[str],
+        bucket_name: str,
+        key_prefix: str = "{job_name}/iter_{trainer.state.iteration:09}",
+        archive_name: str = "model.tar.gz",
+        codec: Optional[str] = "gzip",
+        remove: bool = True,
+        max_pending: int = 1,
+        policy: str = QueuePolicy.BLOCK,
+        work_dir: Optional[Path] = None,
+        cache_listing: bool = False,
+    ):
+        self.patterns = patterns
+        self.bucket_name = bucket_name
+        self.key_prefix = key_prefix
+        self.archive_name = archive_name
+        self.codec = codec
+        self.remove = remove
+        self.work_dir = work_dir
+        self.cache_listing = cache_listing
+        self.worker = BackgroundWorker(
+            max_pending=max_pending, policy=policy, name="ship"
+        )
+
+    def __call__(self, trainer: Engine):
+        paths = [
+            path
+            for path in resolve_patterns(
+                self.patterns, cache=self.cache_listing
+            )
+            if path.is_file()
+        ]
+        if not paths:
+            return
+
+        key_prefix = self.key_prefix.format(
+            job_name=_aws.job_name(), trainer=trainer
+        )
+        # hard links need the same file system as the checkpoints
+        tmp_dir = Path(
+            tempfile.mkdtemp(
+                prefix=".ship-", dir=self.work_dir or paths[0].parent
+            )
+        )
+        signatures = _stage(paths, tmp_dir / "files")
+        self.worker.submit(
+            partial(self._ship, tmp_dir, signatures, key_prefix),
+            discard=partial(shutil.rmtree, str(tmp_dir), ignore_errors=True),
+        )
+
+    def _ship(
+        self,
+        tmp_dir: Path,
+        signatures: Dict[Path, Tuple[int, int, int]],
+        key_prefix: str,
+    ):
+        try:
+            out_file = tmp_dir / self.archive_name
+            archive(
+                None,
+                [
+                    glob.escape(str(p))
+                    for p in sorted((tmp_dir / "files").iterdir())
+                ],
+                out_file,
+                codec=self.codec,
+            )
+            key = f"{key_prefix}/{self.archive_name}"
+            client = _aws.s3_client()
+            client.upload_file(
+                Filename=str(out_file), Bucket=self.bucket_name, Key=key
+            )
+            res = client.head_object(Bucket=self.bucket_name, Key=key)
+            if res["ContentLength"] != out_file.stat().st_size:
+                raise IOError(f"s3://{self.bucket_name}/{key} is broken.")
+
+            if self.remove:
+                for path, signature in signatures.items():
+                    # a checkpoint rewritten after staging isn't uploaded
+                    if _signature(path) == signature:
+                        path.unlink()
+        finally:
+            shutil.rmtree(str(tmp_dir), ignore_errors=True)
+
+    def wait(self, *args):
+        """Block until the pending checkpoints are shipped."""
+        self.worker.wait()
+
+    def close(self, *args):
+        """Ship the pending checkpoints and stop the background thread."""
+        self.worker.close()
+        print(
+            "ship: {} shipped, {} dropped, {} failed in {:.1f} s".format(
+                self.worker.n_done,
+                self.worker.n_dropped,
+                self.worker.n_failed,
+                self.worker.busy_seconds,
+            )
+        )
+
+
+def _signature(path: Path) -> Optional[Tuple[int, int, int]]:
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def _stage(paths: List[Path], staging_dir: Path):
+    """Hard-link `paths` into `staging_dir`, or copy them if hard links are
+    not supported, and return the signatures of the originals."""
+    staging_dir.mkdir()
+    signatures = dict()
+    for path in paths:
+        signatures[path] = _signature(path)
+        try:
+            os.link(str(path), str(staging_dir / path.name))
+        except OSError:
+            shutil.copy2(str(path), str(staging_dir / path.name))
+    return signatures
@@ -0,0 +1,212 @@
+"""Watch a directory for files which have been completely written.
+
+On Linux, the directory is watched by inotify through ctypes and a file is
+complete when it is closed after writing or moved into the directory.
+Elsewhere, or if inotify is not available, the directory is polled and a
+file is complete when its size and mtime have been stable for
+``stable_seconds``. With ``sentinel``, a file is complete only when the
+sentinel file ``{name}{sentinel}`` exists.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+import traceback
+from fnmatch import fnmatch
+from pathlib import Path
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, "O_CLOEXEC", 0)
+
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class _Inotify:
+    """Minimal inotify binding of libc."""
+
+    def __init__(self, dirname, mask):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        wd = libc.inotify_add_watch(self.fd, os.fsencode(dirname), mask)
+        if wd < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+
+    def read(self, timeout):
+        """Return ``[(mask, name)]`` of the events within ``timeout``."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(buf):
+            _, mask, _, length = EVENT_HEADER.unpack_from(buf, offset)
+            offset += EVENT_HEADER.size
+            name = buf[offset : offset + length].rstrip(b"\0")
+            offset += length
+            events.append((mask, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FileWatcher:
+    """Call ``callback(paths)`` on a daemon thread with the files in
+    ``dirname`` matching ``patterns`` as soon as they are complete.
+
+    Files which exist when the watcher starts are ignored, and a file is
+    reported again only if it is rewritten. ``callback`` gets the files
+    completed at about the same time in a single call.
+    """
+
+    def __init__(
+        self,
+        dirname,
+        patterns,
+        callback,
+        stable_seconds=2.0,
+        sentinel=None,
+        poll_interval=1.0,
+        use_inotify=True,
+    ):
+        self.dirname = Path(dirname)
+        self.patterns = patterns
+        self.callback = callback
+        self.stable_seconds = stable_seconds
+        self.sentinel = sentinel
+        self.poll_interval = poll_interval
+
+        self._inotify = None
+        if use_inotify:
+            try:
+                self._inotify = _Inotify(
+                    str(self.dirname), IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+                )
+            except (OSError, AttributeError, TypeError):
+                # no inotify, e.g. not on Linux
+                self._inotify = None
+
+        # name -> signature of the files already reported
+        self._done = dict()
+        # name -> (signature, when it was seen first) of the files in writing
+        self._pending = dict()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="watcher")
+        self._thread.daemon = True
+
+    @property
+    def uses_inotify(self):
+        return self._inotify is not None
+
+    def start(self):
+        for name, signature in self._scan().items():
+            self._done[name] = signature
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop watching after reporting the files completed so far."""
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+    def _match(self, name):
+        if self.sentinel and name.endswith(self.sentinel):
+            return False
+        return any(fnmatch(name, pattern) for pattern in self.patterns)
+
+    def _signature(self, name):
+        try:
+            stat = (self.dirname / name).stat()
+        except FileNotFoundError:
+            return None
+        return (stat.st_size, stat.st_mtime_ns)
+
+    def _scan(self):
+        signatures = dict()
+        with os.scandir(str(self.dirname)) as it:
+            for entry in it:
+                if entry.is_file() and self._match(entry.name):
+                    stat = entry.stat()
+                    signatures[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        return signatures
+
+    def _run(self):
+        while True:
+            stopping = self._stopped.is_set()
+            try:
+                ready = self._poll(
+                    timeout=0 if stopping else self.poll_interval,
+                    final=stopping,
+                )
+                if ready:
+                    self.callback([self.dirname / name for name in ready])
+            except Exception:
+                traceback.print_exc()
+            if stopping:
+                return
+
+    def _poll(self, timeout, final=False):
+        """Return the names of the files completed since the last call."""
+        closed = set()
+        if self._inotify is None or final:
+            time.sleep(timeout)
+            candidates = set(self._scan())
+        else:
+            candidates = set(self._pending)
+            for mask, name in self._inotify.read(timeout):
+                if mask & IN_Q_OVERFLOW:
+                    candidates |= set(self._scan())
+                    continue
+                if self.sentinel and name.endswith(self.sentinel):
+                    name = name[: -len(self.sentinel)]
+                elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                    closed.add(name)
+                candidates.add(name)
+
+        ready = []
+        now = time.time()
+        for name in sorted(candidates):
+            if not self._match(name):
+                continue
+            signature = self._signature(name)
+            if signature is None or self._done.get(name) == signature:
+                self._pending.pop(name, None)
+                continue
+            if self._is_complete(name, signature, closed, now, final):
+                self._done[name] = signature
+                self._pending.pop(name, None)
+                ready.append(name)
+        return ready
+
+    def _is_complete(self, name, signature, closed, now, final):
+        if self.sentinel:
+            complete = (self.dirname / f"{name}{self.sentinel}").exists()
+            if not complete:
+                self._pending[name] = (signature, now)
+            return complete
+        # nothing is written any more on the final call
+        if name in closed or final:
+            return True
+        last = self._pending.get(name)
+        if last is None or last[0] != signature:
+            self._pending[name] = (signature, now)
+            return False
+        return now - last[1] >= self.stable_seconds
@@ -0,0 +1,29 @@
+import importlib.util
+
+import boto3
+import pytest
+from moto import mock_s3
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "requires(module): skip unless the module is installed"
+    )
+
+
+def pytest_runtest_setup(item):
+    for marker in item.iter_markers(name="requires"):
+        module = marker.args[0]
+        if importlib.util.find_spec(module) is None:
+            pytest.skip(f"{module} is not installed")
+
+
+@pytest.fixture
+def s3_client(monkeypatch):
+    """An S3 client of moto, which also mocks the clients created by the
+    code under test."""
+    # newer botocore sends aws-chunked bodies with checksums,
+    # which moto doesn't decode
+    monkeypatch.setenv("AWS_REQUEST_CHECKSUM_CALCULATION", "when_required")
+    with mock_s3():
+        yield boto3.client("s3", region_name="us-east-1")
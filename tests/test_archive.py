@@ -1,3 +1,4 @@
+import os
 import pytest
 import tarfile
 from pathlib import Path
@@ -5,6 +6,8 @@ from pathlib import Path
 from pytest_mock import MockFixture
 from ignite.engine import Engine
 
+from smtools.compression import open_reader
+from smtools.parallel_gzip import is_parallel_gzip
 from smtools.torch.handlers import archive
 
 
@@ -49,3 +52,57 @@ def test_archive(tmp_path: Path, mocker: MockFixture, compress: bool):
             file_ = model_dir / name
             assert file_.exists()
             assert file_.read_text() == content
+
+
+@pytest.mark.parametrize(
+    "codec",
+    [
+        "none",
+        "gzip:1",
+        pytest.param("zstd:3:2", marks=pytest.mark.requires("zstandard")),
+        pytest.param("lz4", marks=pytest.mark.requires("lz4")),
+    ],
+)
+def test_archive_codec(tmp_path: Path, mocker: MockFixture, codec: str):
+    # Setup
+    (tmp_path / "model_123.pth").write_text("This is a model." * 100)
+    trainer = mocker.MagicMock(spec=Engine)
+
+    # Execute
+    out_file = tmp_path / "model.tar"
+    archive(
+        trainer=trainer,
+        patterns=[f"{tmp_path}/model_*.pth"],
+        out_file=out_file,
+        codec=codec,
+    )
+
+    # Check
+    with open(out_file, "rb") as f, open_reader(f) as f_in, tarfile.open(
+        fileobj=f_in, mode="r|"
+    ) as t:
+        t.extractall(tmp_path / "out")
+    content = (tmp_path / "out/model/model_123.pth").read_text()
+    assert content == "This is a model." * 100
+
+
+def test_archive_workers(tmp_path: Path, mocker: MockFixture):
+    # Setup
+    data = os.urandom(1024 * 1024) * 8
+    (tmp_path / "model_123.pth").write_bytes(data)
+    trainer = mocker.MagicMock(spec=Engine)
+
+    # Execute
+    out_file = tmp_path / "model.tar.gz"
+    archive(
+        trainer=trainer,
+        patterns=[f"{tmp_path}/model_*.pth"],
+        out_file=out_file,
+        workers=4,
+    )
+
+    # Check
+    assert is_parallel_gzip(out_file)
+    # readable as a standard tar.gz
+    with tarfile.open(out_file, "r:gz") as t:
+        assert t.extractfile("model/model_123.pth").read() == data
@@ -0,0 +1,69 @@
+import threading
+import time
+
+import pytest
+
+from smtools.background import BackgroundWorker, QueuePolicy
+
+
+def _blocked_worker(policy: str):
+    """Return a worker whose first task blocks until the event is set."""
+    event = threading.Event()
+    worker = BackgroundWorker(max_pending=1, policy=policy)
+    worker.submit(event.wait)
+    # wait until the first task is taken from the queue
+    while worker._queue:
+        time.sleep(0.01)
+    return worker, event
+
+
+@pytest.mark.parametrize(
+    "policy,expected",
+    [(QueuePolicy.DROP_OLDEST, ["c"]), (QueuePolicy.SKIP, ["b"])],
+)
+def test_background_worker_full_queue(policy: str, expected: list):
+    # Setup
+    worker, event = _blocked_worker(policy)
+    done, discarded = [], []
+
+    # Execute
+    for name in ["b", "c"]:
+        worker.submit(
+            lambda name=name: done.append(name),
+            discard=lambda name=name: discarded.append(name),
+        )
+    event.set()
+    worker.close()
+
+    # Check
+    assert done == expected
+    assert discarded == [n for n in ["b", "c"] if n not in expected]
+    assert worker.n_done == 2
+    assert worker.n_dropped == 1
+
+
+def test_background_worker_block():
+    # Setup
+    worker, event = _blocked_worker(QueuePolicy.BLOCK)
+    done = []
+    worker.submit(lambda: done.append("b"))
+
+    # Execute: the next submit blocks until "b" leaves the queue
+    timer = threading.Timer(0.1, event.set)
+    timer.start()
+    worker.submit(lambda: done.append("c"))
+    worker.close()
+
+    # Check
+    assert done == ["b", "c"]
+    assert worker.n_dropped == 0
+
+
+def test_background_worker_failure():
+    worker = BackgroundWorker()
+    worker.submit(lambda: 1 / 0)
+    worker.close()
+
+    assert worker.n_failed == 1
+    with pytest.raises(RuntimeError):
+        worker.submit(lambda: None)
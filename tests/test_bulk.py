@@ -0,0 +1,130 @@
+import io
+import tarfile
+
+import boto3
+from botocore.stub import Stubber
+
+from sagemaker_tools.bulk import (
+    BulkSubmitter,
+    package_source_dir,
+    setting_files,
+)
+
+
+def _create_training_job(client):
+    def submit(job_name, conf):
+        client.create_training_job(
+            TrainingJobName=job_name,
+            AlgorithmSpecification={
+                "TrainingImage": "image",
+                "TrainingInputMode": "File",
+            },
+            RoleArn="arn:aws:iam::123456789012:role/sagemaker",
+            HyperParameters={k: str(v) for k, v in conf.items()},
+            OutputDataConfig={"S3OutputPath": "s3://bucket/output"},
+            ResourceConfig={
+                "InstanceType": "ml.p2.xlarge",
+                "InstanceCount": 1,
+                "VolumeSizeInGB": 30,
+            },
+            StoppingCondition={"MaxRuntimeInSeconds": 3600},
+        )
+
+    return submit
+
+
+def test_bulk_submitter():
+    # Setup
+    client = boto3.client("sagemaker", region_name="us-east-1")
+    stubber = Stubber(client)
+    for _ in range(3):
+        stubber.add_client_error(
+            "create_training_job",
+            service_error_code="ThrottlingException",
+            http_status_code=400,
+        )
+    for _ in range(5):
+        stubber.add_response("create_training_job", {"TrainingJobArn": "arn"})
+    submitter = BulkSubmitter(
+        _create_training_job(client), max_workers=4, backoff=0.01
+    )
+    jobs = ((f"job-{i}", {"lr": 0.1 * i}) for i in range(5))
+
+    # Execute
+    with stubber:
+        submitted = submitter.run(jobs)
+
+    # Check
+    # the throttled calls are retried
+    assert sorted(submitted) == [f"job-{i}" for i in range(5)]
+    assert submitter.failed == []
+    assert submitter.n_throttled == 3
+    stubber.assert_no_pending_responses()
+    assert "Throttled 3 times." in submitter.summary()
+
+
+def test_bulk_submitter_failure():
+    # Setup
+    client = boto3.client("sagemaker", region_name="us-east-1")
+    stubber = Stubber(client)
+    stubber.add_client_error(
+        "create_training_job",
+        service_error_code="ValidationException",
+        http_status_code=400,
+    )
+    stubber.add_response("create_training_job", {"TrainingJobArn": "arn"})
+    submitter = BulkSubmitter(
+        _create_training_job(client), max_workers=1, backoff=0.01
+    )
+
+    # Execute
+    with stubber:
+        submitted = submitter.run([("job-0", {}), ("job-1", {})])
+
+    # Check
+    # the other errors are not retried
+    assert submitted == ["job-1"]
+    assert [job_name for job_name, _ in submitter.failed] == ["job-0"]
+    assert "Failed 1 jobs:" in submitter.summary()
+
+
+def test_setting_files(tmp_path):
+    settings_dir = tmp_path / "settings"
+    settings_dir.mkdir()
+    for name in ["b.yml", "a.yaml", "c.txt"]:
+        (settings_dir / name).touch()
+    other = tmp_path / "other.yml"
+    other.touch()
+
+    assert setting_files([settings_dir, other]) == [
+        settings_dir / "a.yaml",
+        settings_dir / "b.yml",
+        other,
+    ]
+
+
+def test_package_source_dir(tmp_path, s3_client):
+    # Setup
+    client = s3_client
+    client.create_bucket(Bucket="bucket")
+    source_dir = tmp_path / "src"
+    (source_dir / "lib").mkdir(parents=True)
+    (source_dir / "train.py").write_text("print('train')\n")
+    (source_dir / "lib" / "model.py").write_text("model = None\n")
+
+    # Execute
+    uri = package_source_dir(source_dir, "bucket", client)
+
+    # Check
+    assert uri.startswith("s3://bucket/smtrain-")
+    assert uri.endswith("/source/sourcedir.tar.gz")
+    key = uri[len("s3://bucket/") :]
+    body = client.get_object(Bucket="bucket", Key=key)["Body"].read()
+    with tarfile.open(fileobj=io.BytesIO(body), mode="r:gz") as t:
+        assert sorted(t.getnames()) == ["lib/model.py", "train.py"]
+
+    # the same contents are uploaded once
+    (source_dir / "train.py").touch()
+    assert package_source_dir(source_dir, "bucket", client) == uri
+    (source_dir / "train.py").write_text("print('changed')\n")
+    assert package_source_dir(source_dir, "bucket", client) != uri
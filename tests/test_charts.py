@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from smtools.charts import BLOCKS, ChartRenderer, columns, sparkline
+
+
+def test_columns():
+    log = [
+        {"epoch": 1, "main/loss": 0.5},
+        {"epoch": 2, "main/loss": np.float32(0.25), "lr": "n/a"},
+    ]
+
+    data = columns(log, ["epoch", "main/loss", "lr"])
+
+    np.testing.assert_array_equal(data["epoch"], [1, 2])
+    np.testing.assert_array_equal(data["main/loss"], [0.5, 0.25])
+    assert np.isnan(data["lr"]).all()
+
+
+def test_sparkline():
+    assert sparkline([]) == ""
+    assert sparkline([1, np.nan, 8]) == BLOCKS[0] + BLOCKS[-1]
+    assert sparkline([3, 3, 3]) == BLOCKS[3] * 3
+    # averaged in bins
+    assert sparkline(np.arange(100), width=10) == "▁▂▃▃▄▅▆▆▇█"
+    assert len(sparkline(np.arange(7), width=3)) == 3
+
+
+def test_chart_renderer():
+    pytest.importorskip("matplotlib")
+    renderer = ChartRenderer(["main/loss", "validation/main/loss"])
+    log = [{"epoch": 1, "main/loss": 0.5}]
+
+    assert ChartRenderer(["lr"]).render(log) is None
+
+    png = renderer.render(log)
+    assert png.startswith(b"\x89PNG")
+    # not redrawn if nothing has changed
+    assert renderer.render(list(log)) is png
+    assert renderer.n_rendered == 1
+
+    log.append({"epoch": 2, "main/loss": 0.4, "validation/main/loss": 0.6})
+    assert renderer.render(log) != png
+    assert renderer.n_rendered == 2
@@ -0,0 +1,109 @@
+import io
+import os
+from pathlib import Path
+
+import pytest
+from botocore.exceptions import ClientError
+
+from smtools.dedup import MAX_CHUNK_SIZE, DedupUploader, iter_chunks, restore
+
+
+def test_iter_chunks():
+    # Setup
+    data = os.urandom(16 * 1024 * 1024)
+
+    # Execute
+    chunks = list(iter_chunks(io.BytesIO(data)))
+    # insert a few bytes at the beginning
+    shifted = list(iter_chunks(io.BytesIO(b"abc" + data)))
+
+    # Check
+    assert b"".join(chunks) == data
+    assert all(len(c) <= 4 * 1024 * 1024 for c in chunks)
+    assert all(len(c) >= 256 * 1024 for c in chunks[:-1])
+    # the chunks are in sync again after a cut by the content, which may be
+    # a few chunks later if the cuts are forced at the max size
+    assert len(chunks) > 4
+    n_shared = len(chunks) - 3
+    assert shifted[-n_shared:] == chunks[-n_shared:]
+
+
+def test_dedup_upload_and_restore(tmp_path: Path, s3_client):
+    # Setup
+    client = s3_client
+    bucket_name = "sample"
+    client.create_bucket(Bucket=bucket_name)
+
+    backbone = os.urandom(16 * 1024 * 1024)
+    head = os.urandom(1024 * 1024)
+    (tmp_path / "model.npz").write_bytes(backbone + head)
+    (tmp_path / "log").write_text("This is a log.")
+
+    uploader = DedupUploader(bucket_name, "job/snapshot/chunks", client)
+    paths = [tmp_path / "model.npz", tmp_path / "log"]
+
+    # Execute
+    res1 = uploader.upload(paths, "job/snapshot/iter_1/manifest.json")
+    # the backbone is frozen and only the head changes
+    new_head = os.urandom(1024 * 1024)
+    (tmp_path / "model.npz").write_bytes(backbone + new_head)
+    # a new uploader lists the uploaded chunks
+    uploader = DedupUploader(bucket_name, "job/snapshot/chunks", client)
+    res2 = uploader.upload(paths, "job/snapshot/iter_2/manifest.json")
+
+    # Check
+    assert res1["uploaded_bytes"] == res1["total_bytes"]
+    assert res2["total_bytes"] == res1["total_bytes"]
+    # the new head and the chunk containing the boundary
+    assert res2["uploaded_bytes"] <= len(new_head) + MAX_CHUNK_SIZE
+    assert res2["uploaded_bytes"] < res2["total_bytes"] / 3
+
+    out_dir = tmp_path / "restored"
+    restored = restore(
+        bucket_name, "job/snapshot/iter_2/manifest.json", out_dir,
+        client=client,
+    )
+    assert sorted(p.name for p in restored) == ["log", "model.npz"]
+    assert (out_dir / "model.npz").read_bytes() == backbone + new_head
+    assert (out_dir / "log").read_text() == "This is a log."
+
+
+def test_dedup_upload_failure(tmp_path: Path, s3_client):
+    # Setup
+    client = s3_client
+    bucket_name = "sample"
+    client.create_bucket(Bucket=bucket_name)
+    data = os.urandom(4 * 1024 * 1024)
+    (tmp_path / "model.npz").write_bytes(data)
+    paths = [tmp_path / "model.npz"]
+    uploader = DedupUploader(bucket_name, "job/snapshot/chunks", client)
+
+    # the second chunk fails to be stored
+    put_object = client.put_object
+    chunk_keys = []
+
+    def flaky_put_object(**kwargs):
+        if "/chunks/" in kwargs["Key"]:
+            chunk_keys.append(kwargs["Key"])
+            if len(chunk_keys) == 2:
+                error = {"Error": {"Code": "InternalError"}}
+                raise ClientError(error, "PutObject")
+        return put_object(**kwargs)
+
+    client.put_object = flaky_put_object
+
+    # Execute
+    with pytest.raises(ClientError):
+        uploader.upload(paths, "job/snapshot/iter_1/manifest.json")
+    res = uploader.upload(paths, "job/snapshot/iter_2/manifest.json")
+
+    # Check
+    # the failed chunk is uploaded again
+    assert 0 < res["uploaded_bytes"] < res["total_bytes"]
+    client.head_object(Bucket=bucket_name, Key=chunk_keys[1])
+    out_dir = tmp_path / "restored"
+    restore(
+        bucket_name, "job/snapshot/iter_2/manifest.json", out_dir,
+        client=client,
+    )
+    assert (out_dir / "model.npz").read_bytes() == data
@@ -0,0 +1,115 @@
+import importlib
+import json
+import os
+from pathlib import Path
+
+import boto3
+import pytest
+from pytest_mock import MockFixture
+from ignite.engine import Engine
+
+from smtools.distributed import shard
+from smtools.restore_snapshot import find_snapshot, restore_snapshot
+from smtools.torch.handlers import _aws, s3_copy
+
+HOSTS = ["algo-1", "algo-2", "algo-3"]
+
+
+def _set_host(monkeypatch, host):
+    training_env = {"job_name": "job", "hosts": HOSTS, "current_host": host}
+    monkeypatch.setenv("SM_TRAINING_ENV", json.dumps(training_env))
+
+
+@pytest.fixture(autouse=True)
+def no_mpi(monkeypatch):
+    for var in ["OMPI_COMM_WORLD_RANK", "PMI_RANK", "RANK"]:
+        monkeypatch.delenv(var, raising=False)
+    monkeypatch.delenv("SM_TRAINING_ENV", raising=False)
+
+
+@pytest.fixture
+def s3_copy_module(s3_client):
+    module = importlib.import_module("smtools.torch.handlers.s3_copy")
+    _aws.s3_client.cache_clear()
+    module._dedup_uploaders.clear()
+    return module
+
+
+def test_shard(monkeypatch):
+    assert shard() == (0, 1)
+
+    _set_host(monkeypatch, "algo-3")
+    assert shard() == (2, 3)
+
+    # the MPI rank takes precedence
+    monkeypatch.setenv("OMPI_COMM_WORLD_RANK", "5")
+    monkeypatch.setenv("OMPI_COMM_WORLD_SIZE", "8")
+    assert shard() == (5, 8)
+
+
+def test_s3_copy_leader(
+    tmp_path: Path, mocker: MockFixture, monkeypatch, s3_copy_module
+):
+    # Setup
+    s3 = boto3.resource("s3", region_name="us-east-1")
+    bucket_name = "sample"
+    s3.create_bucket(Bucket=bucket_name)
+    (tmp_path / "model.pth").write_text("model")
+    trainer = mocker.MagicMock(spec=Engine)
+
+    # Execute
+    for host in HOSTS:
+        _set_host(monkeypatch, host)
+        spy = mocker.spy(s3_copy_module, "_upload")
+        s3_copy(trainer, f"{tmp_path}/model.pth", bucket_name)
+
+        # Check
+        assert spy.call_count == (1 if host == "algo-1" else 0)
+        mocker.stopall()
+
+
+def test_s3_copy_shard(
+    tmp_path: Path, mocker: MockFixture, monkeypatch, s3_copy_module
+):
+    # Setup
+    s3 = boto3.resource("s3", region_name="us-east-1")
+    bucket_name = "sample"
+    s3.create_bucket(Bucket=bucket_name)
+    trainer = mocker.MagicMock(spec=Engine)
+    contents = dict()
+
+    # Execute & Check
+    for index, host in enumerate(HOSTS):
+        # each host has its own shard of the checkpoint
+        host_dir = tmp_path / host
+        host_dir.mkdir()
+        name = f"model_shard{index}.pth"
+        contents[name] = os.urandom(1024 * 1024)
+        (host_dir / name).write_bytes(contents[name])
+
+        _set_host(monkeypatch, host)
+        s3_copy(
+            trainer,
+            f"{host_dir}/*.pth",
+            bucket_name,
+            key_prefix="job/snapshot/iter_000000010",
+            dedup=True,
+            chunk_prefix="job/snapshot/chunks",
+            distributed="shard",
+        )
+        if index < len(HOSTS) - 1:
+            # incomplete until every part is uploaded
+            with pytest.raises(FileNotFoundError):
+                find_snapshot(bucket_name, "job")
+
+    iteration, keys = find_snapshot(bucket_name, "job")
+    assert iteration == 10
+    assert keys == [
+        f"job/snapshot/iter_000000010/part-0000{i}-of-00003/manifest.json"
+        for i in range(3)
+    ]
+
+    paths = restore_snapshot(bucket_name, "job", tmp_path / "restored")
+    assert sorted(p.name for p in paths) == sorted(contents)
+    for path in paths:
+        assert path.read_bytes() == contents[path.name]
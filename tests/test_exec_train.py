@@ -0,0 +1,154 @@
+import threading
+from collections import defaultdict
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+import yaml
+
+pytest.importorskip("sagemaker")
+
+from sagemaker_tools import exec_train  # noqa: E402
+
+
+def _write_setting(path: Path, conf: dict):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(yaml.safe_dump(conf))
+    return path
+
+
+def test_job_names(tmp_path: Path):
+    # Setup
+    settings = [
+        tmp_path / "exp1" / "base.yml",
+        tmp_path / "exp2" / "base.yml",
+        tmp_path / "exp2" / "large_lr.yml",
+    ]
+
+    # Execute
+    job_names = exec_train._job_names(settings, "job")
+
+    # Check
+    # the same stems are told apart by their directories
+    assert job_names == ["job-exp1-base", "job-exp2-base", "job-large-lr"]
+    assert exec_train._job_names(settings[:1], "job") == ["job"]
+    # the same file given twice
+    job_names = exec_train._job_names(settings[:1] * 2, None)
+    assert len(set(job_names)) == 2
+
+
+def test_jobs(tmp_path: Path, s3_client):
+    # Setup
+    s3_client.create_bucket(Bucket="bucket")
+    source_dir = tmp_path / "src"
+    source_dir.mkdir()
+    (source_dir / "train.py").write_text("print('train')\n")
+    setting_jobs = [
+        (
+            "job-a",
+            {
+                "estimator": {"source_dir": str(source_dir)},
+                "matrix": {"estimator": {"hyperparameters": {"lr": [1, 2]}}},
+            },
+        ),
+        ("job-b", {"estimator": {"source_dir": str(source_dir)}}),
+    ]
+    sagemaker_session = SimpleNamespace(default_bucket=lambda: "bucket")
+
+    # Execute
+    jobs = list(exec_train._jobs(setting_jobs, sagemaker_session, s3_client))
+
+    # Check
+    # a job for each point of the matrix
+    assert [job_name for job_name, _ in jobs][2:] == ["job-b"]
+    assert all(job_name.startswith("job-a-") for job_name, _ in jobs[:2])
+    assert [conf["estimator"].get("hyperparameters") for _, conf in jobs] == [
+        {"lr": 1},
+        {"lr": 2},
+        None,
+    ]
+    # the source directory is uploaded once for all the jobs
+    uris = {conf["estimator"]["source_dir"] for _, conf in jobs}
+    assert len(uris) == 1
+    assert uris.pop().startswith("s3://bucket/smtrain-")
+
+
+def test_exec_training(tmp_path: Path, monkeypatch):
+    # Setup
+    # profiles of different regions
+    config_file = tmp_path / "config"
+    config_file.write_text(
+        "[profile dev]\nregion = us-east-1\n"
+        "[profile prod]\nregion = us-west-2\n"
+    )
+    credentials_file = tmp_path / "credentials"
+    credentials_file.write_text(
+        "[dev]\naws_access_key_id = dev\naws_secret_access_key = dev\n"
+        "[prod]\naws_access_key_id = prod\naws_secret_access_key = prod\n"
+    )
+    monkeypatch.setenv("AWS_CONFIG_FILE", str(config_file))
+    monkeypatch.setenv("AWS_SHARED_CREDENTIALS_FILE", str(credentials_file))
+    settings = [
+        _write_setting(
+            tmp_path / "settings" / f"{name}.yml",
+            {"profile_name": profile_name, "estimator": {}},
+        )
+        for name, profile_name in [("a", "dev"), ("b", "prod"), ("c", "dev")]
+    ]
+
+    # a stub of sagemaker.Session, which talks to SageMaker
+    monkeypatch.setattr(
+        exec_train.sagemaker,
+        "Session",
+        lambda boto_session, sagemaker_client: SimpleNamespace(
+            boto_session=boto_session, sagemaker_client=sagemaker_client
+        ),
+    )
+    submitted = []
+    # session -> the threads using it
+    threads = defaultdict(set)
+
+    def exec_training_sm(session, client, job_name, conf, *args, **kwargs):
+        sagemaker_session = kwargs["sagemaker_session"]
+        assert sagemaker_session.boto_session is session
+        assert sagemaker_session.sagemaker_client is client
+        threads[session].add(threading.current_thread().name)
+        submitted.append(
+            (job_name, session.profile_name, client.meta.region_name)
+        )
+
+    monkeypatch.setattr(exec_train, "exec_training_sm", exec_training_sm)
+
+    # Execute
+    exec_train.exec_training(
+        [str(tmp_path / "settings")],
+        local=False,
+        job_name="job",
+        profile_name=None,
+        max_parallel_jobs=1,
+    )
+
+    # Check
+    # each job is submitted by the client of its own profile
+    assert sorted(submitted) == [
+        ("job-a", "dev", "us-east-1"),
+        ("job-b", "prod", "us-west-2"),
+        ("job-c", "dev", "us-east-1"),
+    ]
+    # the sessions are not shared by the threads
+    assert all(len(names) == 1 for names in threads.values())
+
+    # the profile of the command line is used for all the jobs
+    submitted.clear()
+    exec_train.exec_training(
+        [str(setting) for setting in settings],
+        local=False,
+        job_name="job",
+        profile_name="prod",
+        max_parallel_jobs=1,
+    )
+    assert sorted(submitted) == [
+        ("job-a", "prod", "us-west-2"),
+        ("job-b", "prod", "us-west-2"),
+        ("job-c", "prod", "us-west-2"),
+    ]
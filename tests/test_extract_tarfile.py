@@ -0,0 +1,238 @@
+import importlib
+import io
+import os
+import tarfile
+from pathlib import Path
+
+import pytest
+
+from smtools.extract_tarfile import extract_tarfile
+from smtools.compression import Codec
+from smtools.parallel_gzip import is_parallel_gzip, pack_directory
+
+# `smtools.extract_tarfile` is shadowed by the function in `smtools`
+extract_tarfile_module = importlib.import_module("smtools.extract_tarfile")
+
+
+def _make_fragments(tmp_path: Path, contents: dict, frac_size: int):
+    src_dir = tmp_path / "src"
+    src_dir.mkdir()
+    for name, content in contents.items():
+        (src_dir / name).write_bytes(content)
+
+    tar_file = tmp_path / "dataset.tar.gz"
+    with tarfile.open(tar_file, "w:gz") as t:
+        for name in contents:
+            t.add(str(src_dir / name), arcname=f"dataset/{name}")
+
+    data = tar_file.read_bytes()
+    tar_file.unlink()
+
+    inp_dir = tmp_path / "inp"
+    inp_dir.mkdir()
+    for i in range(0, len(data), frac_size):
+        frac = inp_dir / f"dataset.tar.gz-{i // frac_size:04}"
+        frac.write_bytes(data[i : i + frac_size])
+    return inp_dir
+
+
+@pytest.mark.parametrize("remove", [True, False])
+def test_extract_tarfile_stream(tmp_path: Path, remove: bool):
+    # Setup
+    contents = {
+        "a.txt": b"This is a." * 1000,
+        "b.bin": os.urandom(10000),
+    }
+    inp_dir = _make_fragments(tmp_path, contents, frac_size=1000)
+    n_fracs = len(list(inp_dir.glob("*.tar.gz-*")))
+    assert n_fracs > 1
+
+    # Execute
+    extract_tarfile(str(inp_dir), remove=remove, stream=True)
+
+    # Check
+    for name, content in contents.items():
+        assert (inp_dir / "dataset" / name).read_bytes() == content
+    # the joined tarball is never written
+    assert not (inp_dir / "dataset.tar.gz").exists()
+    n_left = len(list(inp_dir.glob("*.tar.gz-*")))
+    assert n_left == (0 if remove else n_fracs)
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_extract_tarfile_parallel_gzip(tmp_path: Path, stream: bool):
+    # Setup
+    src_dir = tmp_path / "dataset"
+    src_dir.mkdir()
+    contents = {f"{i}.bin": os.urandom(3000) for i in range(10)}
+    for name, content in contents.items():
+        (src_dir / name).write_bytes(content)
+
+    tar_file = tmp_path / "dataset.tar.gz"
+    pack_directory(src_dir, tar_file, workers=4, block_size=4096)
+    assert is_parallel_gzip(tar_file)
+    # still readable as an ordinary gzip file
+    with tarfile.open(tar_file, "r:gz") as t:
+        assert len(t.getnames()) == len(contents) + 1
+
+    inp_dir = tmp_path / "inp"
+    inp_dir.mkdir()
+    if stream:
+        data = tar_file.read_bytes()
+        for i in range(0, len(data), 5000):
+            (inp_dir / f"dataset.tar.gz-{i // 5000:04}").write_bytes(
+                data[i : i + 5000]
+            )
+    else:
+        tar_file.rename(inp_dir / tar_file.name)
+
+    # Execute
+    extract_tarfile(str(inp_dir), remove=True, stream=stream, workers=4)
+
+    # Check
+    for name, content in contents.items():
+        assert (inp_dir / "dataset" / name).read_bytes() == content
+    assert list(inp_dir.glob("[!.]*.tar.gz*")) == []
+
+
+def _make_tarfile(tar_file: Path, contents: dict):
+    with tarfile.open(tar_file, "w:gz") as t:
+        for name, content in contents.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            t.addfile(info, io.BytesIO(content))
+
+
+def test_extract_tarfile_multiple_archives(tmp_path: Path, mocker):
+    # Setup
+    contents = {
+        f"shard{i}": {
+            f"dataset/{i}_{j}.bin": os.urandom(100) for j in range(5)
+        }
+        for i in range(3)
+    }
+    for shard, shard_contents in contents.items():
+        _make_tarfile(tmp_path / f"{shard}.tar.gz", shard_contents)
+    # a split archive is extracted together with the others
+    (tmp_path / "shard2.tar.gz").rename(tmp_path / "shard2.tar.gz-0000")
+
+    manager = mocker.spy(extract_tarfile_module, "Manager")
+
+    # Execute
+    stats = extract_tarfile(str(tmp_path), remove=True, stream=True)
+
+    # Check
+    # no manager process without check_conflicts
+    assert manager.call_count == 0
+    assert sorted(Path(s["archive"]).name for s in stats) == [
+        f"{shard}.tar.gz" for shard in sorted(contents)
+    ]
+    for shard_contents in contents.values():
+        for name, content in shard_contents.items():
+            assert (tmp_path / name).read_bytes() == content
+    assert list(tmp_path.glob("[!.]*.tar.gz*")) == []
+
+
+def test_extract_tarfile_conflict(tmp_path: Path, mocker):
+    _make_tarfile(tmp_path / "a.tar.gz", {"dataset/x.txt": b"a"})
+    _make_tarfile(tmp_path / "b.tar.gz", {"dataset/x.txt": b"b"})
+    manager = mocker.spy(extract_tarfile_module, "Manager")
+
+    with pytest.raises(FileExistsError):
+        extract_tarfile(str(tmp_path), remove=False, check_conflicts=True)
+    assert manager.call_count == 1
+
+
+def test_extract_tarfile_cache(tmp_path: Path, mocker):
+    # Setup
+    contents = {f"dataset/{i}.bin": os.urandom(100) for i in range(5)}
+    _make_tarfile(tmp_path / "dataset.tar.gz", contents)
+    extract_tarfile(str(tmp_path), remove=True)
+    assert not (tmp_path / "dataset.tar.gz").exists()
+    assert (tmp_path / ".dataset.tar.gz.manifest").exists()
+
+    # Execute: nothing to do even though the archive has been removed
+    extract = mocker.spy(extract_tarfile_module, "extract")
+    stats = extract_tarfile(str(tmp_path), remove=True)
+
+    # Check
+    assert stats[0]["skipped"]
+    assert extract.call_count == 0
+
+    # Execute: only a missing member is extracted again
+    _make_tarfile(tmp_path / "dataset.tar.gz", contents)
+    extract_tarfile(str(tmp_path), remove=False)
+    (tmp_path / "dataset/3.bin").unlink()
+    (tmp_path / "dataset/4.bin").write_bytes(b"broken")
+    stats = extract_tarfile(str(tmp_path), remove=False)
+
+    # Check
+    assert not stats[0]["skipped"]
+    assert extract.call_args[1]["only"] == {"dataset/3.bin", "dataset/4.bin"}
+    for name, content in contents.items():
+        assert (tmp_path / name).read_bytes() == content
+
+
+def test_extract_tarfile_cache_fragments(tmp_path: Path):
+    # Setup
+    contents = {"a.txt": b"This is a." * 1000}
+    inp_dir = _make_fragments(tmp_path, contents, frac_size=1000)
+    stats = extract_tarfile(str(inp_dir), remove=False)
+    assert not stats[0]["skipped"]
+    # the joined tarball is left with the fragments
+    assert (inp_dir / "dataset.tar.gz").exists()
+
+    # Execute
+    stats = extract_tarfile(str(inp_dir), remove=False)
+
+    # Check
+    assert stats[0]["skipped"]
+
+
+@pytest.mark.parametrize(
+    "codec",
+    [
+        "none",
+        "gzip",
+        pytest.param("zstd:3:2", marks=pytest.mark.requires("zstandard")),
+        pytest.param("lz4", marks=pytest.mark.requires("lz4")),
+    ],
+)
+def test_extract_tarfile_codec(tmp_path: Path, codec: str):
+    # Setup
+    codec = Codec.parse(codec)
+    contents = {f"dataset/{i}.bin": os.urandom(100) for i in range(5)}
+    tar_file = tmp_path / f"dataset{codec.suffix}"
+    with open(tar_file, "wb") as f, codec.open_writer(
+        f
+    ) as f_c, tarfile.open(fileobj=f_c, mode="w|") as t:
+        for name, content in contents.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            t.addfile(info, io.BytesIO(content))
+
+    # Execute
+    extract_tarfile(str(tmp_path), remove=True, plain_tar=True)
+
+    # Check
+    for name, content in contents.items():
+        assert (tmp_path / name).read_bytes() == content
+    assert not tar_file.exists()
+
+
+def test_extract_tarfile_plain_tar(tmp_path: Path):
+    # Setup
+    _make_tarfile(tmp_path / "a.tar.gz", {"a.txt": b"a"})
+    with tarfile.open(tmp_path / "b.tar", "w") as t:
+        info = tarfile.TarInfo("b.txt")
+        info.size = 1
+        t.addfile(info, io.BytesIO(b"b"))
+
+    # Execute
+    extract_tarfile(str(tmp_path), remove=True)
+
+    # Check
+    # plain tar files are kept for IndexedTarFile
+    assert (tmp_path / "a.txt").read_bytes() == b"a"
+    assert (tmp_path / "b.tar").exists()
+    assert not (tmp_path / "b.txt").exists()
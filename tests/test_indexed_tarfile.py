@@ -0,0 +1,63 @@
+import io
+import os
+import tarfile
+from pathlib import Path
+
+import pytest
+from torch.utils.data import DataLoader
+
+from smtools.indexed_tarfile import IndexedTarFile
+from smtools.parallel_gzip import ParallelGzipWriter
+from smtools.torch.datasets import TarDataset
+
+
+def _make_archive(archive: Path, contents: dict, parallel_gzip: bool):
+    with open(archive, "wb") as f:
+        f_out = (
+            ParallelGzipWriter(f, workers=2, block_size=1024)
+            if parallel_gzip
+            else f
+        )
+        with tarfile.open(fileobj=f_out, mode="w|") as t:
+            for name, content in contents.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(content)
+                t.addfile(info, io.BytesIO(content))
+        if parallel_gzip:
+            f_out.close()
+
+
+@pytest.mark.parametrize("parallel_gzip", [True, False])
+def test_indexed_tarfile(tmp_path: Path, parallel_gzip: bool):
+    # Setup
+    contents = {
+        f"images/{i}.jpg": os.urandom(i * 300) for i in range(20)
+    }
+    archive = tmp_path / "dataset.tar"
+    _make_archive(archive, contents, parallel_gzip)
+
+    # Execute & Check
+    with IndexedTarFile(archive) as t:
+        assert t.names == list(contents)
+        for name in reversed(t.names):
+            assert t.read(name) == contents[name]
+    assert (tmp_path / "dataset.tar.index").exists()
+
+    # the saved index is reused
+    with IndexedTarFile(archive) as t:
+        assert t.read("images/7.jpg") == contents["images/7.jpg"]
+
+
+def test_torch_tar_dataset(tmp_path: Path):
+    # Setup
+    contents = {f"{i}.bin": os.urandom(100) for i in range(10)}
+    archive = tmp_path / "dataset.tar"
+    _make_archive(archive, contents, parallel_gzip=True)
+
+    # Execute
+    dataset = TarDataset(archive, transform=lambda name, data: len(data))
+    loader = DataLoader(dataset, batch_size=5, num_workers=2)
+
+    # Check
+    assert len(dataset) == 10
+    assert [int(n) for batch in loader for n in batch] == [100] * 10
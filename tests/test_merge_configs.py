@@ -0,0 +1,225 @@
+import itertools
+from copy import deepcopy
+
+import pytest
+import yaml
+
+from smtools.merge_configs import (
+    MISSING,
+    Change,
+    MergeBatch,
+    expand_matrix,
+    merge_configs,
+    merge_configs_batch,
+    merge_configs_from_file,
+    nestupdate,
+    render_changes,
+    take_diff,
+)
+
+
+def test_nestupdate_changes():
+    # Setup
+    d = {"a": {"b": 1, "c": 2}, "l": [1], "s": "x"}
+    u = {"a": {"b": 3, "c": 2, "d": {"e": 4}}, "l": [2], "s": {"t": 5}}
+
+    # Execute
+    changes = []
+    d = nestupdate(d, u, changes)
+
+    # Check
+    assert d == {
+        "a": {"b": 3, "c": 2, "d": {"e": 4}},
+        "l": [2],
+        "s": {"t": 5},
+    }
+    # the unchanged value a.c isn't recorded
+    assert changes == [
+        Change(("a", "b"), 1, 3),
+        Change(("a", "d", "e"), MISSING, 4),
+        Change(("l",), [1], [2]),
+        Change(("s",), "x", {"t": 5}),
+    ]
+
+
+def test_render_changes():
+    changes = [
+        Change(("a", "b"), 1, 3),
+        Change(("a", "d"), MISSING, "new"),
+        Change(("l",), [1], [1, 2]),
+    ]
+
+    rendered = render_changes(changes, "previous config", "layer.yml")
+
+    for line in [
+        "--- previous config",
+        "+++ layer.yml",
+        "-a.b: 1",
+        "+a.b: 3",
+        "+a.d: new",
+        "-l: [1]",
+        "+l: [1, 2]",
+    ]:
+        assert line in rendered
+    assert "-a.d" not in rendered
+
+
+def test_merge_configs(capsys):
+    # Setup
+    configs = [
+        {"batch_size": 8, "model": {"n_layers": 1}, "files": ["a"]},
+        {"model": {"n_layers": 2, "dropout": 0.3}},
+        {"batch_size": 16, "files": ["b"]},
+    ]
+    first_config = deepcopy(configs[0])
+
+    # Execute
+    config = merge_configs(deepcopy(configs), titles=["1", "2", "3"])
+
+    # Check
+    assert config == {
+        "batch_size": 16,
+        "model": {"n_layers": 2, "dropout": 0.3},
+        "files": ["b"],
+    }
+    out = capsys.readouterr().out
+    assert "+model.dropout: 0.3" in out
+    assert "+batch_size: 16" in out
+    # the final diff is the one of the whole YAML
+    assert take_diff(first_config, config, "1", "FINALE CONFIG") in out
+
+    assert merge_configs(deepcopy(configs), verbose=False) == config
+    assert "FINALE CONFIG" not in capsys.readouterr().out
+
+
+def _write_settings(root):
+    files = {
+        "private/global.yml": "estimator: {role: r}\n",
+        "train/global.yml": (
+            "estimator: {instance: p2, hyperparameters: {a: 1}}\n"
+        ),
+        "data1.yml": "inputs: {train: s3://b/data1}\n",
+        "data2.yml": "inputs: {train: s3://b/data2}\n",
+        "debug.yml": "estimator: {hyperparameters: {a: 0}}\n",
+    }
+    for name, content in files.items():
+        (root / name).parent.mkdir(parents=True, exist_ok=True)
+        (root / name).write_text(content)
+    manifest = root / "batch.yml"
+    manifest.write_text(
+        "global_train.yml: [private/global.yml, train/global.yml]\n"
+        "job1.yml: [global_train.yml, data1.yml]\n"
+        "job2.yml: [global_train.yml, data2.yml]\n"
+        "debug-job1.yml: [private/global.yml, train/global.yml, data1.yml, "
+        "debug.yml]\n"
+    )
+    return manifest
+
+
+def test_merge_configs_batch(tmp_path):
+    # Setup
+    manifest = _write_settings(tmp_path)
+    targets = {
+        tmp_path / out_file: [tmp_path / f for f in yml_files]
+        for out_file, yml_files in yaml.safe_load(manifest.read_text()).items()
+    }
+    cache_dir = tmp_path / ".mgconf_cache"
+
+    # Execute
+    batch = MergeBatch(targets, cache_dir=cache_dir)
+    written = batch.run()
+
+    # Check
+    assert all(written.values())
+    for out_file, yml_files in targets.items():
+        configs = [yaml.safe_load(f.read_text()) for f in yml_files]
+        expected = merge_configs(configs, verbose=False)
+        assert yaml.safe_load(out_file.read_text()) == expected
+    assert yaml.safe_load((tmp_path / "debug-job1.yml").read_text()) == {
+        "estimator": {
+            "role": "r",
+            "instance": "p2",
+            "hyperparameters": {"a": 0},
+        },
+        "inputs": {"train": "s3://b/data1"},
+    }
+    # global_train.yml is parsed once, and the prefix of debug-job1.yml is
+    # shared with global_train.yml
+    assert batch.n_parsed == 6
+    assert batch.n_merged == 5
+
+    # nothing is written again
+    assert not any(merge_configs_batch(manifest, cache_dir).values())
+
+    # only the targets depending on the changed file are written
+    (tmp_path / "data2.yml").write_text("inputs: {train: s3://b/data3}\n")
+    written = merge_configs_batch(manifest, cache_dir)
+    assert [out_file.name for out_file, w in written.items() if w] == [
+        "job2.yml"
+    ]
+    assert yaml.safe_load((tmp_path / "job2.yml").read_text())["inputs"] == {
+        "train": "s3://b/data3"
+    }
+
+
+def test_expand_matrix():
+    # Setup
+    config = {
+        "estimator": {"hyperparameters": {"epochs": 10, "lr": 0.1}},
+        "matrix": {
+            "estimator": {
+                "hyperparameters": {"lr": [0.1, 0.01], "optimizer": "adam"}
+            },
+            "tags": [[1], [1, 2], [3]],
+        },
+    }
+
+    # Execute
+    points = list(expand_matrix(config))
+
+    # Check
+    assert len(points) == 6
+    assert points[1][1] == {
+        "estimator": {
+            "hyperparameters": {"epochs": 10, "lr": 0.1, "optimizer": "adam"}
+        },
+        "tags": [1, 2],
+    }
+    suffixes = [suffix for suffix, _ in points]
+    assert len(set(suffixes)) == 6
+    # the same across runs
+    assert [suffix for suffix, _ in expand_matrix(config)] == suffixes
+    # the config isn't modified
+    assert "optimizer" not in config["estimator"]["hyperparameters"]
+
+    assert list(expand_matrix({"a": 1})) == [("", {"a": 1})]
+    with pytest.raises(ValueError):
+        list(expand_matrix({"matrix": {"a": []}}))
+
+
+def test_expand_matrix_lazily():
+    matrix = {f"p{i}": list(range(10)) for i in range(4)}
+
+    points = expand_matrix({"matrix": matrix})
+
+    first = list(itertools.islice(points, 3))
+    assert [config["p3"] for _, config in first] == [0, 1, 2]
+
+
+def test_merge_configs_from_file_expand(tmp_path):
+    (tmp_path / "base.yml").write_text("lr: 0.1\nepochs: 10\n")
+    (tmp_path / "sweep.yml").write_text("matrix: {lr: [0.1, 0.01, 0.001]}\n")
+    out_file = tmp_path / "out" / "job.yml"
+
+    merge_configs_from_file(
+        [str(tmp_path / "base.yml"), str(tmp_path / "sweep.yml")],
+        out_file,
+        verbose=False,
+        expand=True,
+    )
+
+    point_files = sorted(out_file.parent.iterdir())
+    assert len(point_files) == 3
+    assert all(f.name.startswith("job-") for f in point_files)
+    lrs = sorted(yaml.safe_load(f.read_text())["lr"] for f in point_files)
+    assert lrs == [0.001, 0.01, 0.1]
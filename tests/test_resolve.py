@@ -0,0 +1,57 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from smtools.torch.handlers.resolve import resolve_patterns
+
+
+@pytest.fixture
+def root(tmp_path: Path) -> Path:
+    for name in [
+        "model_1.pth",
+        "model_2.pth",
+        "args.yml",
+        "a/model_3.pth",
+        "a/b/model_4.pth",
+        "a/b/.hidden.pth",
+        "c/log",
+    ]:
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(name)
+    return tmp_path
+
+
+@pytest.mark.parametrize(
+    "pattern",
+    ["*", "model_*.pth", "*/*.pth", "**/*.pth", "a/**", "[ac]/*", "args.yml"],
+)
+def test_resolve_patterns(root: Path, pattern: str):
+    # Execute
+    paths = resolve_patterns([f"{root}/{pattern}"])
+
+    # Check
+    expected = Path("/").glob(f"{root}/{pattern}".lstrip("/"))
+    assert sorted(paths) == sorted(expected)
+    assert len(paths) == len(set(paths))
+
+
+def test_resolve_patterns_cache(root: Path):
+    # Setup
+    patterns = [f"{root}/model_*.pth", f"{root}/*.yml"]
+
+    # Execute & Check
+    paths = resolve_patterns(patterns, cache=True)
+    assert paths == [
+        root / "model_1.pth",
+        root / "model_2.pth",
+        root / "args.yml",
+    ]
+
+    (root / "model_3.pth").write_text("model_3.pth")
+    # make sure the mtime of the directory changes
+    stat = os.stat(root)
+    os.utime(root, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    paths = resolve_patterns(patterns, cache=True)
+    assert root / "model_3.pth" in paths
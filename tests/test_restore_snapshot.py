@@ -0,0 +1,93 @@
+import io
+import os
+import tarfile
+from pathlib import Path
+
+import pytest
+
+from smtools.compression import Codec
+from smtools.dedup import DedupUploader
+from smtools.restore_snapshot import find_snapshot, restore_snapshot
+
+
+def _put_snapshot(client, bucket_name, key, files, codec):
+    body = io.BytesIO()
+    with Codec.parse(codec).open_writer(body) as f,\
+            tarfile.open(fileobj=f, mode="w|") as tar:
+        for name, data in files.items():
+            info = tarfile.TarInfo(f"model/{name}")
+            info.size = len(data)
+            tar.addfile(info, fileobj=io.BytesIO(data))
+    client.put_object(Bucket=bucket_name, Key=key, Body=body.getvalue())
+
+
+def test_restore_snapshot(tmp_path: Path, s3_client):
+    # Setup
+    client = s3_client
+    bucket_name = "sample"
+    client.create_bucket(Bucket=bucket_name)
+
+    old = {"model.npz": os.urandom(1024)}
+    new = {"model.npz": os.urandom(3 * 1024 * 1024), "log": b"This is a log."}
+    _put_snapshot(
+        client,
+        bucket_name,
+        "job/snapshot/iter_000000010/model.tar.gz",
+        old,
+        "gzip",
+    )
+    _put_snapshot(
+        client,
+        bucket_name,
+        "job/snapshot/iter_000000020/model.tar.zst",
+        new,
+        "zstd",
+    )
+
+    # Execute
+    # small parts to have many concurrent ranged GETs
+    latest = restore_snapshot(
+        bucket_name,
+        "job",
+        tmp_path / "latest",
+        client=client,
+        part_size=256 * 1024,
+    )
+    first = restore_snapshot(
+        bucket_name, "job", tmp_path / "first", iteration=10, client=client
+    )
+
+    # Check
+    assert sorted(latest) == sorted(
+        tmp_path / "latest" / "model" / name for name in new
+    )
+    for name, data in new.items():
+        assert (tmp_path / "latest" / "model" / name).read_bytes() == data
+    assert first == [tmp_path / "first" / "model" / "model.npz"]
+    assert first[0].read_bytes() == old["model.npz"]
+
+    with pytest.raises(FileNotFoundError):
+        find_snapshot(bucket_name, "job", iteration=30, client=client)
+
+
+def test_restore_snapshot_incremental(tmp_path: Path, s3_client):
+    # Setup
+    client = s3_client
+    bucket_name = "sample"
+    client.create_bucket(Bucket=bucket_name)
+
+    data = os.urandom(2 * 1024 * 1024)
+    (tmp_path / "model.npz").write_bytes(data)
+    uploader = DedupUploader(bucket_name, "job/snapshot/chunks", client)
+    uploader.upload(
+        [tmp_path / "model.npz"], "job/snapshot/iter_000000010/manifest.json"
+    )
+
+    # Execute
+    paths = restore_snapshot(
+        bucket_name, "job", tmp_path / "out", client=client
+    )
+
+    # Check
+    assert paths == [tmp_path / "out" / "model.npz"]
+    assert paths[0].read_bytes() == data
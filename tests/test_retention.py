@@ -0,0 +1,96 @@
+from pathlib import Path
+
+import pytest
+from pytest_mock import MockFixture
+from ignite.engine import Engine
+
+from smtools import retention as retention_module
+from smtools.retention import Retention
+from smtools.torch.handlers import prune
+
+
+def test_select():
+    # Setup
+    retention = Retention(
+        keep_last=2, keep_best=2, metric="val_loss", keep_every=40
+    )
+    scores = {10: 0.5, 20: 0.1, 30: 0.3, 50: 0.4, 60: 0.2, 70: 0.6}
+    for iteration, score in scores.items():
+        retention.record(iteration, score)
+
+    # Execute
+    keep = retention.select(range(10, 101, 10))
+
+    # Check
+    # the last 2, the best 2 and every 40 iterations
+    assert keep == {90, 100, 20, 60, 40, 80}
+
+
+def test_select_without_rules():
+    assert Retention().select([1, 2, 3]) == {1, 2, 3}
+    assert Retention(keep_last=0).select([1, 2, 3]) == {3}
+    with pytest.raises(ValueError):
+        Retention(keep_best=1)
+
+
+def test_prune_s3(monkeypatch, mocker: MockFixture, s3_client):
+    # Setup
+    # delete in small batches to test the batching
+    monkeypatch.setattr(retention_module, "MAX_DELETE_KEYS", 3)
+    client = s3_client
+    bucket_name = "sample"
+    client.create_bucket(Bucket=bucket_name)
+    for iteration in range(1, 6):
+        for name in ["model.tar.gz", "log"]:
+            client.put_object(
+                Bucket=bucket_name,
+                Key=f"job/snapshot/iter_{iteration:09}/{name}",
+                Body=b"snapshot",
+            )
+    client.put_object(
+        Bucket=bucket_name, Key="job/snapshot/chunks/abc", Body=b"chunk"
+    )
+    spy = mocker.spy(client, "delete_objects")
+
+    # Execute
+    deleted = Retention(keep_last=2).prune_s3(
+        bucket_name, "job/snapshot", client=client
+    )
+
+    # Check
+    res = client.list_objects_v2(Bucket=bucket_name)
+    keys = sorted(obj["Key"] for obj in res["Contents"])
+    assert keys == [
+        "job/snapshot/chunks/abc",
+        "job/snapshot/iter_000000004/log",
+        "job/snapshot/iter_000000004/model.tar.gz",
+        "job/snapshot/iter_000000005/log",
+        "job/snapshot/iter_000000005/model.tar.gz",
+    ]
+    assert len(deleted) == 6
+    assert spy.call_count == 2
+
+
+def test_prune_handler(tmp_path: Path, mocker: MockFixture):
+    # Setup
+    trainer = mocker.MagicMock(spec=Engine)
+    trainer.state = mocker.MagicMock()
+    retention = Retention(keep_last=1, keep_best=1, metric="val_loss")
+    losses = [0.5, 0.2, 0.3, 0.4]
+
+    # Execute
+    for iteration, loss in enumerate(losses, 1):
+        (tmp_path / f"model_{iteration}.pth").write_text("model")
+        (tmp_path / f"optimizer_{iteration}.pth").write_text("optimizer")
+        trainer.state.iteration = iteration
+        trainer.state.metrics = {"val_loss": loss}
+        prune(trainer, retention, patterns=[f"{tmp_path}/*.pth"])
+    retention.close()
+
+    # Check
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "model_2.pth",
+        "model_4.pth",
+        "optimizer_2.pth",
+        "optimizer_4.pth",
+    ]
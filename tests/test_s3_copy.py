@@ -1,3 +1,4 @@
+import importlib
 import os
 from pathlib import Path
 
@@ -7,7 +8,7 @@ from moto import mock_s3
 from pytest_mock import MockFixture
 from ignite.engine import Engine
 
-from smtools.torch.handlers import s3_copy
+from smtools.torch.handlers import _aws, s3_copy
 
 
 @mock_s3
@@ -65,3 +66,52 @@ def test_s3_copy(tmp_path: Path, mocker: MockFixture):
             assert False, "The file doesn't exist."
         else:
             assert False, e
+
+
+def test_s3_copy_skip_unchanged(
+    tmp_path: Path, mocker: MockFixture, s3_client
+):
+    # Setup
+    s3_copy_module = importlib.import_module("smtools.torch.handlers.s3_copy")
+    _aws.s3_client.cache_clear()
+    s3_copy_module._uploaded.clear()
+    (tmp_path / "args.yml").write_text("This is args.yml.")
+    (tmp_path / "model.pth").write_bytes(os.urandom(11 * 1024 * 1024))
+
+    trainer = mocker.MagicMock(spec=Engine)
+    s3 = boto3.resource("s3")
+    bucket_name = "sample"
+    s3.create_bucket(Bucket=bucket_name)
+
+    def copy():
+        s3_copy(
+            trainer,
+            pattern=f"{tmp_path}/*",
+            bucket_name=bucket_name,
+            part_size=5 * 1024 * 1024,
+            skip_unchanged=True,
+        )
+
+    copy()
+    upload_file = mocker.spy(_aws.s3_client(), "upload_file")
+
+    # Execute & Check
+    # the sizes and mtimes are unchanged
+    copy()
+    assert upload_file.call_count == 0
+
+    # the contents are unchanged
+    (tmp_path / "args.yml").write_text("This is args.yml.")
+    copy()
+    assert upload_file.call_count == 0
+
+    # the ETags on S3 are compared after a restart
+    s3_copy_module._uploaded.clear()
+    copy()
+    assert upload_file.call_count == 0
+
+    (tmp_path / "args.yml").write_text("This is a new args.yml.")
+    copy()
+    assert upload_file.call_count == 1
+    body = s3.Object(bucket_name, f"{os.uname()[1]}/args.yml").get()["Body"]
+    assert body.read() == b"This is a new args.yml."
@@ -0,0 +1,45 @@
+import os
+
+import pytest
+
+from smtools.s3_stream import MIN_PART_SIZE, S3MultipartWriter
+
+
+@pytest.mark.parametrize("size", [100, 2 * MIN_PART_SIZE + 100])
+def test_s3_multipart_writer(size: int, s3_client):
+    # Setup
+    client = s3_client
+    bucket_name = "sample"
+    client.create_bucket(Bucket=bucket_name)
+    data = os.urandom(size)
+
+    # Execute
+    with S3MultipartWriter(
+        client, bucket_name, "model.tar.gz", part_size=MIN_PART_SIZE
+    ) as f:
+        for i in range(0, size, 1000000):
+            f.write(data[i : i + 1000000])
+
+    # Check
+    res = client.get_object(Bucket=bucket_name, Key="model.tar.gz")
+    assert res["Body"].read() == data
+
+
+def test_s3_multipart_writer_abort(s3_client):
+    # Setup
+    client = s3_client
+    bucket_name = "sample"
+    client.create_bucket(Bucket=bucket_name)
+
+    # Execute
+    with pytest.raises(RuntimeError):
+        with S3MultipartWriter(
+            client, bucket_name, "model.tar.gz", part_size=MIN_PART_SIZE
+        ) as f:
+            f.write(os.urandom(MIN_PART_SIZE + 1))
+            raise RuntimeError
+
+    # Check
+    assert "Contents" not in client.list_objects_v2(Bucket=bucket_name)
+    uploads = client.list_multipart_uploads(Bucket=bucket_name)
+    assert uploads.get("Uploads", []) == []
@@ -0,0 +1,128 @@
+import shutil
+import tarfile
+import threading
+from pathlib import Path
+
+import boto3
+import pytest
+from moto import mock_s3
+from pytest_mock import MockFixture
+from ignite.engine import Engine
+
+from smtools.background import QueuePolicy
+from smtools.torch.handlers import Ship
+
+
+@pytest.fixture
+def trainer(mocker: MockFixture):
+    trainer = mocker.MagicMock(spec=Engine)
+    trainer.state = mocker.MagicMock()
+    return trainer
+
+
+@mock_s3
+def test_ship(tmp_path: Path, trainer):
+    # Setup
+    s3 = boto3.resource("s3")
+    bucket_name = "sample"
+    s3.create_bucket(Bucket=bucket_name)
+    ship = Ship(
+        [f"{tmp_path}/model_*.pth", f"{tmp_path}/args.yml"],
+        bucket_name,
+        key_prefix="job/iter_{trainer.state.iteration}",
+    )
+
+    # Execute
+    for iteration in [1, 2]:
+        (tmp_path / "args.yml").write_text("This is args.yml.")
+        (tmp_path / f"model_{iteration}.pth").write_text(f"model {iteration}")
+        trainer.state.iteration = iteration
+        ship(trainer)
+        ship.wait()
+    ship.close()
+
+    # Check
+    keys = sorted(obj.key for obj in s3.Bucket(bucket_name).objects.all())
+    assert keys == ["job/iter_1/model.tar.gz", "job/iter_2/model.tar.gz"]
+    s3.Object(bucket_name, "job/iter_2/model.tar.gz").download_file(
+        str(tmp_path / "model.tar.gz")
+    )
+    with tarfile.open(tmp_path / "model.tar.gz") as t:
+        names = sorted(t.getnames())
+    assert names == ["model/args.yml", "model/model_2.pth"]
+    # the uploaded files are removed and the staging dirs are cleaned up
+    assert list(tmp_path.iterdir()) == [tmp_path / "model.tar.gz"]
+
+
+@mock_s3
+def test_ship_failure(tmp_path: Path, trainer):
+    # Setup
+    ship = Ship(
+        [f"{tmp_path}/model_*.pth"], "no-such-bucket", key_prefix="job"
+    )
+    (tmp_path / "model_1.pth").write_text("model")
+
+    # Execute
+    ship(trainer)
+    ship.close()
+
+    # Check
+    # nothing is removed unless uploaded
+    assert ship.worker.n_failed == 1
+    assert list(tmp_path.iterdir()) == [tmp_path / "model_1.pth"]
+
+
+def test_ship_drop_oldest(tmp_path: Path, trainer, mocker: MockFixture):
+    # Setup
+    started, resume = threading.Event(), threading.Event()
+    shipped = []
+
+    def slow_ship(self, tmp_dir, signatures, key_prefix):
+        started.set()
+        resume.wait()
+        shipped.append(key_prefix)
+        shutil.rmtree(str(tmp_dir))
+
+    mocker.patch.object(Ship, "_ship", slow_ship)
+    ship = Ship(
+        [f"{tmp_path}/model.pth"],
+        "sample",
+        key_prefix="iter_{trainer.state.iteration}",
+        max_pending=1,
+        policy=QueuePolicy.DROP_OLDEST,
+    )
+    (tmp_path / "model.pth").write_text("model")
+
+    # Execute
+    for iteration in range(1, 5):
+        trainer.state.iteration = iteration
+        ship(trainer)
+        started.wait()
+    resume.set()
+    ship.close()
+
+    # Check
+    assert shipped == ["iter_1", "iter_4"]
+    assert ship.worker.n_dropped == 2
+    # the staging dirs of the dropped checkpoints are removed
+    staged = [p for p in tmp_path.iterdir() if p.name.startswith(".ship-")]
+    assert staged == []
+
+
+@pytest.mark.parametrize("cache_listing", [False, True])
+def test_ship_cache_listing(
+    tmp_path: Path, trainer, mocker: MockFixture, cache_listing: bool
+):
+    # Setup
+    resolve_patterns = mocker.patch(
+        "smtools.torch.handlers.ship.resolve_patterns", return_value=[]
+    )
+    patterns = [f"{tmp_path}/model_*.pth"]
+    ship = Ship(patterns, "sample", cache_listing=cache_listing)
+
+    # Execute
+    ship(trainer)
+    ship.close()
+
+    # Check
+    resolve_patterns.assert_called_once_with(patterns, cache=cache_listing)
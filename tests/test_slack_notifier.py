@@ -0,0 +1,161 @@
+import json
+import threading
+import time
+from functools import partial
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from smtools.slack_notifier import SlackNotifier, merge_payloads
+
+
+class Webhook(BaseHTTPRequestHandler):
+    """Local stand-in of a Slack incoming webhook."""
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        time.sleep(server.delay)
+        if server.responses:
+            code = server.responses.pop(0)
+        else:
+            code = 200
+        if code == 200:
+            server.payloads.append(json.loads(body))
+        self.send_response(code)
+        if code == 429:
+            self.send_header("Retry-After", "0")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def webhook():
+    server = HTTPServer(("127.0.0.1", 0), Webhook)
+    server.payloads = []
+    server.responses = []
+    server.delay = 0.0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = "http://127.0.0.1:{}/hook".format(server.server_port)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _report(epoch):
+    return {
+        "text": f"epoch {epoch}",
+        "attachments": [
+            {"fields": [{"title": "epoch", "value": epoch}]},
+            {"image_url": f"https://example.com/{epoch}.png"},
+        ],
+    }
+
+
+def test_merge_payloads():
+    merged = merge_payloads([_report(1), _report(2)])
+    assert merged == {
+        "text": "epoch 2",
+        "attachments": [
+            {"fields": [{"title": "epoch", "value": 1}]},
+            {"fields": [{"title": "epoch", "value": 2}]},
+            {"image_url": "https://example.com/2.png"},
+        ],
+    }
+
+
+def test_slack_notifier_coalesce(webhook):
+    # Setup
+    notifier = SlackNotifier(webhook.url, min_interval=0.5)
+
+    # Execute
+    notifier.notify(_report(0))
+    notifier.wait()
+    start = time.time()
+    for epoch in range(1, 5):
+        notifier.notify(_report(epoch))
+    elapsed = time.time() - start
+    notifier.wait()
+    notifier.close()
+
+    # Check
+    # notify doesn't wait for the webhook
+    assert elapsed < 0.1
+    # the reports after the first one wait for the rate limit together
+    assert [p["text"] for p in webhook.payloads] == ["epoch 0", "epoch 4"]
+    assert len(webhook.payloads[1]["attachments"]) == 5
+    assert notifier.n_posted == 2
+    assert notifier.n_merged == 3
+
+
+def test_slack_notifier_coalesce_images(webhook):
+    # Setup
+    notifier = SlackNotifier(webhook.url, min_interval=0.5)
+    # epoch -> with_images
+    built = dict()
+
+    def build(epoch, with_images):
+        built[epoch] = with_images
+        return _report(epoch)
+
+    # Execute
+    notifier.notify(partial(build, 0))
+    notifier.wait()
+    for epoch in range(1, 5):
+        notifier.notify(partial(build, epoch))
+    notifier.close()
+
+    # Check
+    # only the payload whose images are kept builds them
+    assert built == {0: True, 1: False, 2: False, 3: False, 4: True}
+
+
+def test_slack_notifier_retry(webhook):
+    # Setup
+    webhook.responses = [500, 429]
+    notifier = SlackNotifier(webhook.url, backoff=0.01)
+
+    # Execute
+    notifier.notify(lambda with_images: _report(1))
+    notifier.close()
+
+    # Check
+    assert [p["text"] for p in webhook.payloads] == ["epoch 1"]
+    assert notifier.n_failed == 0
+
+
+def test_slack_notifier_give_up(webhook):
+    # Setup
+    webhook.responses = [400]
+    notifier = SlackNotifier(webhook.url, backoff=0.01)
+
+    # Execute
+    notifier.notify(_report(1))
+    notifier.close()
+
+    # Check
+    assert webhook.payloads == []
+    assert notifier.n_failed == 1
+
+
+def test_slack_notifier_drain(webhook):
+    # Setup
+    webhook.delay = 0.2
+    notifier = SlackNotifier(webhook.url, min_interval=60)
+
+    # Execute
+    for epoch in range(3):
+        notifier.notify(_report(epoch))
+    start = time.time()
+    notifier.close()
+
+    # Check
+    # the pending reports are posted on close without the rate limit
+    assert time.time() - start < 5
+    texts = [p["text"] for p in webhook.payloads]
+    assert texts[-1] == "epoch 2"
+    assert sum(len(p["attachments"]) for p in webhook.payloads) >= 4
@@ -0,0 +1,133 @@
+import importlib
+import os
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from pytest_mock import MockFixture
+
+pytest.importorskip("chainer")
+
+slack_reporter_module = importlib.import_module(
+    "smtools.chainer.extensions.slack_reporter"
+)
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    slack_reporter_module._figure_hashes.clear()
+    slack_reporter_module._uploaded_figures.clear()
+    slack_reporter_module._client.cache_clear()
+
+
+def _trainer(out: Path, names):
+    """The attributes of a chainer Trainer with PlotReports of ``names``."""
+    return SimpleNamespace(
+        out=str(out),
+        _extensions={
+            f"PlotReport{i}": SimpleNamespace(
+                extension=SimpleNamespace(_file_name=name)
+            )
+            for i, name in enumerate(names)
+        },
+    )
+
+
+def _uploaded(client):
+    res = client.list_objects_v2(Bucket="public")
+    return {
+        obj["Key"]: client.get_object(Bucket="public", Key=obj["Key"])[
+            "Body"
+        ].read()
+        for obj in res.get("Contents", [])
+    }
+
+
+def test_figures_snapshot(tmp_path: Path, s3_client):
+    # Setup
+    s3_client.create_bucket(Bucket="public")
+    (tmp_path / "loss.png").write_bytes(b"loss at epoch 1")
+    trainer = _trainer(tmp_path, ["loss.png", "accuracy.png"])
+    log_attachment = {"color": "good", "fields": []}
+
+    # Execute
+    figures = slack_reporter_module._figures(trainer, "public")
+    # PlotReport redraws the figure before the notifier posts
+    (tmp_path / "loss.png").write_bytes(b"loss at epoch 2")
+    payload = slack_reporter_module._payload(
+        "#channel", log_attachment, "public", figures=figures
+    )
+
+    # Check
+    # the figure is uploaded as it was when the report was made
+    assert list(_uploaded(s3_client).values()) == [b"loss at epoch 1"]
+    assert [a["fields"] for a in payload["attachments"][1:]] == [
+        [{"value": "loss.png"}]
+    ]
+
+
+def test_figures_upload_once(
+    tmp_path: Path, s3_client, mocker: MockFixture
+):
+    # Setup
+    s3_client.create_bucket(Bucket="public")
+    path = tmp_path / "loss.png"
+    path.write_bytes(b"loss at epoch 1")
+    trainer = _trainer(tmp_path, ["loss.png"])
+    log_attachment = {"color": "good", "fields": []}
+
+    def report():
+        figures = slack_reporter_module._figures(trainer, "public")
+        return slack_reporter_module._payload(
+            "#channel", log_attachment, "public", figures=figures
+        )
+
+    url = report()["attachments"][1]["image_url"]
+    client, _ = slack_reporter_module._client("public")
+    api_call = mocker.spy(client, "_make_api_call")
+
+    # Execute & Check
+    # an unchanged figure makes no request to S3
+    assert report()["attachments"][1]["image_url"] == url
+    assert api_call.call_count == 0
+
+    # a changed figure is uploaded again
+    path.write_bytes(b"loss at epoch 2, redrawn")
+    new_url = report()["attachments"][1]["image_url"]
+    assert new_url != url
+    assert api_call.call_count > 0
+    assert sorted(_uploaded(s3_client).values()) == [
+        b"loss at epoch 1",
+        b"loss at epoch 2, redrawn",
+    ]
+    # only the latest version of the figure is cached
+    assert list(slack_reporter_module._figure_hashes) == [str(path)]
+    stat = os.stat(path)
+    assert slack_reporter_module._figure_hashes[str(path)][:2] == (
+        stat.st_size,
+        stat.st_mtime_ns,
+    )
+
+
+def test_payload_without_images(tmp_path: Path, s3_client):
+    # Setup
+    s3_client.create_bucket(Bucket="public")
+    (tmp_path / "loss.png").write_bytes(b"loss")
+    figures = slack_reporter_module._figures(
+        _trainer(tmp_path, ["loss.png"]), "public"
+    )
+    log_attachment = {"color": "good", "fields": []}
+
+    # Execute
+    payload = slack_reporter_module._payload(
+        "#channel",
+        log_attachment,
+        "public",
+        figures=figures,
+        with_images=False,
+    )
+
+    # Check
+    # a payload merged away uploads nothing
+    assert payload["attachments"] == [log_attachment]
+    assert _uploaded(s3_client) == {}
@@ -0,0 +1,291 @@
+import importlib
+import io
+import json
+import os
+import tarfile
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("chainer")
+
+from smtools.chainer.extensions import snapshot_transfer  # noqa: E402
+from smtools.compression import open_reader  # noqa: E402
+from smtools.restore_snapshot import (  # noqa: E402
+    find_snapshot,
+    restore_snapshot,
+)
+from smtools.retention import Retention  # noqa: E402
+
+snapshot_transfer_module = importlib.import_module(
+    "smtools.chainer.extensions.snapshot_transfer"
+)
+
+
+class _Trainer:
+    """The attributes of a chainer Trainer which snapshot_transfer uses."""
+
+    def __init__(self, out, iteration=0):
+        self.out = str(out)
+        self.updater = SimpleNamespace(iteration=iteration)
+
+    def get_extension(self, name):
+        raise ValueError(f"No extension: {name}")
+
+
+class _LiveTrainer(_Trainer):
+    """A trainer which records the threads reading its state."""
+
+    def __init__(self, out, iteration=0):
+        self.readers = set()
+        super().__init__(out, iteration)
+
+    @property
+    def updater(self):
+        self.readers.add(threading.current_thread().name)
+        return self._updater
+
+    @updater.setter
+    def updater(self, updater):
+        self._updater = updater
+
+    def get_extension(self, name):
+        self.readers.add(threading.current_thread().name)
+        return super().get_extension(name)
+
+
+HOSTS = ["algo-1", "algo-2", "algo-3"]
+
+
+def _set_host(monkeypatch, host=None):
+    training_env = {
+        "module_dir": "s3://sample/job/source/sourcedir.tar.gz",
+        "job_name": "job",
+    }
+    if host is not None:
+        training_env.update(hosts=HOSTS, current_host=host)
+    monkeypatch.setenv("SM_TRAINING_ENV", json.dumps(training_env))
+
+
+@pytest.fixture(autouse=True)
+def training_env(monkeypatch):
+    for var in ["OMPI_COMM_WORLD_RANK", "PMI_RANK", "RANK"]:
+        monkeypatch.delenv(var, raising=False)
+    _set_host(monkeypatch)
+    snapshot_transfer_module._dedup_uploader.cache_clear()
+
+
+def _save(out: Path, name: str, data: bytes):
+    # Chainer writes a new file and renames it
+    tmp_file = out / f"tmp{name}"
+    tmp_file.write_bytes(data)
+    tmp_file.replace(out / name)
+
+
+def _read_snapshot(client, key):
+    body = client.get_object(Bucket="sample", Key=key)["Body"].read()
+    with open_reader(io.BytesIO(body)) as f, tarfile.open(
+        fileobj=f, mode="r|"
+    ) as tar:
+        return {
+            m.name: tar.extractfile(m).read() for m in tar if m.isfile()
+        }
+
+
+def _keys(client, prefix="job/snapshot/"):
+    res = client.list_objects_v2(Bucket="sample", Prefix=prefix)
+    return sorted(obj["Key"] for obj in res.get("Contents", []))
+
+
+def _wait_for(client, key, timeout=5.0):
+    deadline = time.time() + timeout
+    while key not in _keys(client):
+        if time.time() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+def test_snapshot_transfer_async(
+    tmp_path: Path, monkeypatch, capsys, s3_client
+):
+    # Setup
+    s3_client.create_bucket(Bucket="sample")
+    # the first upload blocks until the next snapshots are queued
+    started, release = threading.Event(), threading.Event()
+    tar_snapshot = snapshot_transfer_module._tar_snapshot
+
+    def blocked_tar_snapshot(*args, **kwargs):
+        started.set()
+        release.wait()
+        return tar_snapshot(*args, **kwargs)
+
+    monkeypatch.setattr(
+        snapshot_transfer_module, "_tar_snapshot", blocked_tar_snapshot
+    )
+    ext = snapshot_transfer(["model.npz"], async_upload=True, max_pending=1)
+    trainer = _Trainer(tmp_path)
+
+    # Execute
+    for iteration in [10, 20, 30]:
+        trainer.updater.iteration = iteration
+        _save(tmp_path, "model.npz", f"model {iteration}".encode())
+        ext(trainer)
+        started.wait()
+    release.set()
+    ext.finalize()
+
+    # Check
+    # the stale snapshot is dropped in favor of the latest one
+    assert _keys(s3_client) == [
+        "job/snapshot/iter_000000010/model.tar.gz",
+        "job/snapshot/iter_000000030/model.tar.gz",
+    ]
+    assert _read_snapshot(
+        s3_client, "job/snapshot/iter_000000030/model.tar.gz"
+    ) == {"model/model.npz": b"model 30"}
+    # the staged files are removed, even those of the dropped one
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["model.npz"]
+    assert "(2 uploaded, 1 dropped, 0 failed)" in capsys.readouterr().out
+
+
+def test_snapshot_transfer_async_failure(
+    tmp_path: Path, capsys, s3_client
+):
+    # Setup
+    # no bucket to upload to
+    ext = snapshot_transfer(["model.npz"], async_upload=True)
+    trainer = _Trainer(tmp_path, iteration=10)
+    _save(tmp_path, "model.npz", b"model")
+
+    # Execute
+    ext(trainer)
+    ext.finalize()
+
+    # Check
+    assert "(0 uploaded, 0 dropped, 1 failed)" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize(
+    "codec,suffix",
+    [
+        ("gzip", ".tar.gz"),
+        pytest.param(
+            "zstd:3:2", ".tar.zst", marks=pytest.mark.requires("zstandard")
+        ),
+    ],
+)
+def test_snapshot_transfer_stream(
+    tmp_path: Path, s3_client, codec: str, suffix: str
+):
+    # Setup
+    s3_client.create_bucket(Bucket="sample")
+    contents = {"model.npz": os.urandom(6 * 1024 * 1024), "log": b"[]"}
+    for name, data in contents.items():
+        _save(tmp_path, name, data)
+    ext = snapshot_transfer(["model.npz", "log"], stream=True, codec=codec)
+
+    # Execute
+    ext(_Trainer(tmp_path, iteration=10))
+
+    # Check
+    key = f"job/snapshot/iter_000000010/model{suffix}"
+    assert _keys(s3_client) == [key]
+    assert _read_snapshot(s3_client, key) == {
+        f"model/{name}": data for name, data in contents.items()
+    }
+    # nothing is staged or written to the local disk
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(contents)
+
+
+def test_snapshot_transfer_leader(tmp_path: Path, monkeypatch, s3_client):
+    # Setup
+    s3_client.create_bucket(Bucket="sample")
+    ext = snapshot_transfer(["model.npz"])
+
+    # Execute
+    for host in HOSTS:
+        _set_host(monkeypatch, host)
+        host_dir = tmp_path / host
+        host_dir.mkdir()
+        _save(host_dir, "model.npz", host.encode())
+        ext(_Trainer(host_dir, iteration=10))
+
+    # Check
+    # only the first host uploads
+    key = "job/snapshot/iter_000000010/model.tar.gz"
+    assert _keys(s3_client) == [key]
+    assert _read_snapshot(s3_client, key) == {"model/model.npz": b"algo-1"}
+
+
+@pytest.mark.parametrize("incremental", [False, True])
+def test_snapshot_transfer_shard(
+    tmp_path: Path, monkeypatch, s3_client, incremental: bool
+):
+    # Setup
+    s3_client.create_bucket(Bucket="sample")
+    ext = snapshot_transfer(
+        ["model_shard*.npz"], distributed="shard", incremental=incremental
+    )
+    contents = dict()
+
+    # Execute & Check
+    for index, host in enumerate(HOSTS):
+        # each host has its own shard of the checkpoint
+        _set_host(monkeypatch, host)
+        host_dir = tmp_path / host
+        host_dir.mkdir()
+        name = f"model_shard{index}.npz"
+        contents[name] = os.urandom(1024 * 1024)
+        _save(host_dir, name, contents[name])
+        ext(_Trainer(host_dir, iteration=10))
+
+        marker = f"job/snapshot/iter_000000010/part-{index:05}-of-00003.json"
+        assert marker in _keys(s3_client)
+        if index < len(HOSTS) - 1:
+            # incomplete until every part is marked
+            with pytest.raises(FileNotFoundError):
+                find_snapshot("sample", "job")
+
+    iteration, keys = find_snapshot("sample", "job")
+    assert iteration == 10
+    assert len(keys) == 3
+
+    paths = restore_snapshot("sample", "job", tmp_path / "restored")
+    assert sorted(p.name for p in paths) == sorted(contents)
+    for path in paths:
+        assert path.read_bytes() == contents[path.name]
+
+
+def test_snapshot_transfer_watch(tmp_path: Path, s3_client):
+    # Setup
+    s3_client.create_bucket(Bucket="sample")
+    retention = Retention(keep_last=1)
+    ext = snapshot_transfer(
+        ["snapshot_iter_*"],
+        watch=True,
+        stable_seconds=0.1,
+        retention=retention,
+    )
+    trainer = _LiveTrainer(tmp_path)
+    ext.initialize(trainer)
+
+    # Execute
+    # the trainer has moved on when the snapshots land
+    for iteration in [10, 20]:
+        _save(tmp_path, f"snapshot_iter_{iteration}", b"snapshot")
+        trainer.updater.iteration = iteration + 3
+        ext(trainer)
+        key = f"job/snapshot/iter_{iteration:09}/model.tar.gz"
+        assert _wait_for(s3_client, key)
+    ext.finalize()
+
+    # Check
+    # the snapshots are keyed by their own iteration
+    assert _keys(s3_client) == ["job/snapshot/iter_000000020/model.tar.gz"]
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["snapshot_iter_20"]
+    # the watcher thread doesn't read the live trainer
+    assert trainer.readers == {threading.current_thread().name}
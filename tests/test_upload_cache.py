@@ -0,0 +1,126 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from sagemaker_tools.upload_cache import UploadCache
+
+
+def _read_tree(client, uri):
+    bucket_name, prefix = uri[len("s3://") :].split("/", 1)
+    res = client.list_objects_v2(Bucket=bucket_name, Prefix=prefix + "/")
+    return {
+        obj["Key"][len(prefix) + 1 :]: client.get_object(
+            Bucket=bucket_name, Key=obj["Key"]
+        )["Body"].read()
+        for obj in res["Contents"]
+    }
+
+
+def test_upload_cache(tmp_path: Path, s3_client):
+    # Setup
+    client = s3_client
+    bucket_name = "sample"
+    client.create_bucket(Bucket=bucket_name)
+    data_dir = tmp_path / "configs"
+    (data_dir / "models").mkdir(parents=True)
+    files = {
+        "train.yml": b"epochs: 10\n",
+        "models/a.yml": b"n_layers: 2\n",
+        "models/b.yml": b"n_layers: 3\n",
+    }
+    for name, content in files.items():
+        (data_dir / name).write_bytes(content)
+    cache_file = tmp_path / "cache" / "upload_cache.json"
+
+    # Execute
+    cache = UploadCache(client, cache_file=cache_file)
+    uri = cache.upload(data_dir, bucket_name, "smtrain-data/config")
+
+    # Check
+    assert uri.startswith("s3://sample/smtrain-data/config/")
+    assert _read_tree(client, uri) == files
+    assert cache.n_uploaded == 3
+
+    # the same contents are reused even by another process
+    cache = UploadCache(client, cache_file=cache_file)
+    assert cache.upload(data_dir, bucket_name, "smtrain-data/config") == uri
+    assert (cache.n_reused, cache.n_uploaded, cache.n_copied) == (1, 0, 0)
+
+    # only the changed file is uploaded, and the others are copied
+    (data_dir / "train.yml").write_bytes(b"epochs: 1\n")
+    new_uri = cache.upload(data_dir, bucket_name, "smtrain-data/config")
+    assert new_uri != uri
+    expected = {**files, "train.yml": b"epochs: 1\n"}
+    assert _read_tree(client, new_uri) == expected
+    assert (cache.n_uploaded, cache.n_copied) == (1, 2)
+    # the old tree is kept for the jobs using it
+    assert _read_tree(client, uri) == files
+
+
+def test_upload_cache_file(tmp_path: Path, s3_client):
+    # Setup
+    client = s3_client
+    bucket_name = "sample"
+    client.create_bucket(Bucket=bucket_name)
+    path = tmp_path / "labels.json"
+    path.write_text("{}")
+    cache = UploadCache(client, cache_file=None)
+
+    # Execute
+    uri = cache.upload(path, bucket_name, "data")
+
+    # Check
+    assert uri.startswith("s3://sample/data/")
+    assert uri.endswith("/labels.json")
+    key = uri[len("s3://sample/") :]
+    body = client.get_object(Bucket=bucket_name, Key=key)["Body"].read()
+    assert body == b"{}"
+
+    # a deleted copy source is uploaded again
+    client.delete_object(Bucket=bucket_name, Key=key)
+    cache.upload(path, bucket_name, "other")
+    assert (cache.n_uploaded, cache.n_copied) == (2, 0)
+
+
+def test_upload_cache_threads(tmp_path: Path, s3_client):
+    # Setup
+    client = s3_client
+    bucket_name = "sample"
+    client.create_bucket(Bucket=bucket_name)
+    paths = []
+    for name in ["a", "b"]:
+        path = tmp_path / f"{name}.txt"
+        path.write_text(name)
+        paths.append(path)
+    cache = UploadCache(client, cache_file=tmp_path / "upload_cache.json")
+    # each upload waits for the other, which only passes if they overlap
+    barrier = threading.Barrier(2, timeout=5)
+    upload_file = client.upload_file
+
+    def blocked_upload_file(*args, **kwargs):
+        barrier.wait()
+        return upload_file(*args, **kwargs)
+
+    client.upload_file = blocked_upload_file
+
+    # Execute
+    def upload(path):
+        return cache.upload(path, bucket_name, "data")
+
+    with ThreadPoolExecutor(2) as pool:
+        uris = list(pool.map(upload, paths))
+
+    # Check
+    assert cache.n_uploaded == 2
+    client.upload_file = upload_file
+    for path, uri in zip(paths, uris):
+        key = uri[len("s3://sample/") :]
+        body = client.get_object(Bucket=bucket_name, Key=key)["Body"].read()
+        assert body == path.read_bytes()
+
+    # the same data from many threads is uploaded once
+    (tmp_path / "c.txt").write_text("c")
+    with ThreadPoolExecutor(4) as pool:
+        uris = set(pool.map(upload, [tmp_path / "c.txt"] * 4))
+    assert len(uris) == 1
+    assert (cache.n_uploaded, cache.n_reused) == (3, 3)
@@ -0,0 +1,63 @@
+import os
+import queue
+from pathlib import Path
+
+import pytest
+
+from smtools.watcher import FileWatcher
+
+
+def _watch(tmp_path, **kwargs):
+    reported = queue.Queue()
+    watcher = FileWatcher(
+        tmp_path,
+        ["snapshot_iter_*"],
+        reported.put,
+        stable_seconds=0.2,
+        poll_interval=0.05,
+        **kwargs,
+    )
+    return watcher.start(), reported
+
+
+@pytest.mark.parametrize("use_inotify", [True, False])
+def test_file_watcher(tmp_path: Path, use_inotify: bool):
+    # Setup
+    (tmp_path / "snapshot_iter_1").write_text("old snapshot")
+    watcher, reported = _watch(tmp_path, use_inotify=use_inotify)
+
+    # Execute
+    with open(tmp_path / "snapshot_iter_2", "w") as f:
+        f.write("new snapshot")
+    (tmp_path / "log").write_text("log")
+    # written to a temporary file and moved
+    (tmp_path / "tmp").write_text("new snapshot")
+    os.rename(tmp_path / "tmp", tmp_path / "snapshot_iter_3")
+
+    # Check
+    paths = []
+    while len(paths) < 2:
+        paths += reported.get(timeout=5)
+    watcher.stop()
+    assert sorted(paths) == [
+        tmp_path / "snapshot_iter_2",
+        tmp_path / "snapshot_iter_3",
+    ]
+    assert reported.empty()
+
+
+@pytest.mark.parametrize("use_inotify", [True, False])
+def test_file_watcher_sentinel(tmp_path: Path, use_inotify: bool):
+    # Setup
+    watcher, reported = _watch(
+        tmp_path, sentinel=".done", use_inotify=use_inotify
+    )
+
+    # Execute & Check
+    (tmp_path / "snapshot_iter_1").write_text("snapshot")
+    with pytest.raises(queue.Empty):
+        reported.get(timeout=0.5)
+
+    (tmp_path / "snapshot_iter_1.done").touch()
+    assert reported.get(timeout=5) == [tmp_path / "snapshot_iter_1"]
+    watcher.stop()